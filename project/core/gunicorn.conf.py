@@ -0,0 +1,55 @@
+"""
+Gunicorn config for sttpproject project.
+
+Run with: gunicorn -c core/gunicorn.conf.py
+Every value can be overridden with the GUNICORN_* environment variables.
+For the async views: GUNICORN_APP=core.asgi:application GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker
+"""
+import multiprocessing
+import os
+
+wsgi_app = os.environ.get('GUNICORN_APP', 'core.wsgi:application')
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Worker Processes With a Few Threads Each, Threads Wait on The Database and Redis
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Django Is Loaded Once in The Master and Shared by The Forked Workers
+preload_app = True
+
+# Workers Are Recycled From Time to Time, The Jitter Keeps Them From Restarting Together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+
+# Importing The Views and Serializers Before Fork, Workers Don't Do It on Their First Request
+def when_ready(server):
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+
+
+# A Connection Opened in The Master Must Not Be Shared by The Workers
+# (Redis pools and the events writer thread already check the process id)
+def post_fork(server, worker):
+    from django.db import connections
+
+    connections.close_all()
+
+
+# Counters Still Buffered by The Worker's Threads Are Written Before It Exits
+def worker_exit(server, worker):
+    from orders.metrics import get_metrics_backend
+
+    backend = get_metrics_backend()
+    if hasattr(backend, 'stop'):
+        backend.stop()
@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'orders.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'orders.middleware.MetricsMiddleware',
@@ -91,6 +92,20 @@ DATABASES = {
     }
 }
 
+# Read Replica of 'default', Safe API Requests Read From It (orders.routers.PrimaryReplicaRouter)
+# The tests use 'default' instead, the replica's rows are the primary's
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['orders.routers.PrimaryReplicaRouter']
+
+# Seconds a User Who Wrote Reads From The Primary, Longer Than The Replica's Lag
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -136,11 +151,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Settings for JWTToken Auth
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'orders.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson Backed, The Output Is The Same as DRF's JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': (
+        'orders.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'orders.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
@@ -151,6 +176,13 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Cache of The Users Behind The JWT Tokens, Seconds in Redis and in The Process's LRU
+AUTH_USER_CACHE_OPTIONS = {
+    'timeout': 60,
+    'local_timeout': 5,  # Longest Time Other Workers May Still See a Deactivated User
+    'max_size': 10000,
+}
+
 # Settings for RedisCache
 CACHES = {
     'default': {
@@ -162,6 +194,30 @@ CACHES = {
     }
 }
 
+# Redis Client of The Async Views ('redis.asyncio'), The Cache LOCATION Is Used When There Is No URL
+ASYNC_REDIS_URL = None
+ASYNC_REDIS_OPTIONS = {}
+
+# Settings for Metrics, Counters of All The Workers Are Aggregated in Redis
+METRICS_BACKEND = 'orders.metrics.RedisMetricsBackend'
+METRICS_BACKEND_OPTIONS = {
+    'flush_interval': 1,  # Seconds Between Flushes of The Counters of a Worker's Threads
+}
+
+# Settings for Order Events, Written to The Logs by a Background Thread After Commit
+EVENTS_SINK = 'orders.events.LoggerSink'
+EVENTS_PIPELINE_OPTIONS = {
+    'max_size': 10000,  # Events Waiting in The Queue, More Are Dropped
+    'batch_size': 100,
+    'put_timeout': 0.05,  # Seconds a Request Waits for Room in a Full Queue
+}
+
+# Sink of The Outbox Relay ('manage.py relay_outbox'), 'orders.outbox.RedisStreamSink' Stands In for a Broker
+OUTBOX_RELAY_SINK = 'orders.outbox.EventLogSink'
+
+# Cancelled Orders Are Moved to The Archive Tables After That Many Days ('manage.py archive_orders')
+ARCHIVE_CANCELLED_AFTER_DAYS = 90
+
 # Settings for Logging
 LOGGING = {
     'version': 1,
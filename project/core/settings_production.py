@@ -0,0 +1,19 @@
+"""
+Production settings for sttpproject project.
+
+Used by the gunicorn profile (core/gunicorn.conf.py): DEBUG is off, so Django no longer
+keeps every SQL query of a request in memory, and database connections are reused.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, SECRET_KEY, os
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+
+ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1,back,back-prod').split(',')
+
+# Persistent Connections, One per Worker Thread, Checked Before Reuse After an Idle Request
+# workers * threads must stay below the max_connections of PostgreSQL (100 by default)
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
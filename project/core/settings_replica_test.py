@@ -0,0 +1,13 @@
+"""
+Settings for the replica lag tests: 'replica' is a second database on the same PostgreSQL server.
+
+Nothing is replicated into it, so the replica lags until a test copies the rows over.
+Run with 'pytest --ds=core.settings_replica_test orders/tests.py -k replica'.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, os
+
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.environ.get('DB_REPLICA_NAME', f"{DATABASES['default']['NAME']}_replica"),
+}
@@ -1,6 +1,46 @@
 from django.contrib import admin
-from .models import Order, Product
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, Product
+
+
+# Lines Are Shown on The Order's Page, Read-Only: The Order's Totals Are Computed When Its Lines Are Written
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    readonly_fields = ['product', 'quantity', 'unit_price']
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class OrderAdmin(admin.ModelAdmin):
+    inlines = [OrderItemInline]
+
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    readonly_fields = ['product', 'quantity', 'unit_price']
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+# Archived Orders Are Only Read, They Are Written by 'manage.py archive_orders'
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    inlines = [ArchivedOrderItemInline]
+    list_display = ['order_id', 'user', 'status', 'total_price', 'is_deleted', 'created_at', 'cancelled_at', 'archived_at']
+    list_filter = ['status', 'is_deleted']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 # Models for Admin Panel
-admin.site.register(Order)
+admin.site.register(Order, OrderAdmin)
 admin.site.register(Product)
+admin.site.register(ArchivedOrder, ArchivedOrderAdmin)
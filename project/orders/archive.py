@@ -0,0 +1,64 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import CANCELLED_STATUS, ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from .stats import add_order_change, apply_stats, get_order_values
+
+
+# Orders Cancelled Before That Are Archived, Soft-Deleted Orders Are Archived Right Away
+def get_archive_cutoff(cancelled_days=None):
+    if cancelled_days is None:
+        cancelled_days = getattr(settings, 'ARCHIVE_CANCELLED_AFTER_DAYS', 90)
+    return timezone.now() - timedelta(days=cancelled_days)
+
+
+# Orders Waiting for The Archive, Read Through 'order_archivable_idx'
+def get_archivable_orders(cutoff):
+    return Order.objects.filter(Q(is_deleted=True) | Q(status=CANCELLED_STATUS, cancelled_at__lt=cutoff))
+
+
+# Moves One Batch of Orders and Their Lines to The Archive Tables, Returns The Archived Orders
+#
+# The copy and the delete are one transaction, a crash leaves every order either in the orders
+# table or in the archive, so the archiving is resumed by simply running it again. Rows are
+# claimed with 'SELECT ... FOR UPDATE SKIP LOCKED', parallel archivers never take the same order
+# and an order being changed by a request is left for the next run. Seven queries per batch,
+# one more when cancelled orders leave the stats.
+def archive_orders_batch(cutoff, batch_size=1000):
+    with transaction.atomic():
+        orders = list(
+            get_archivable_orders(cutoff)
+            .select_for_update(skip_locked=True)
+            .order_by('order_id')[:batch_size]
+        )
+        if not orders:
+            return []
+
+        order_ids = [order.order_id for order in orders]
+        archived_at = timezone.now()
+        ArchivedOrder.objects.bulk_create(
+            ArchivedOrder(
+                order_id=order.order_id, user_id=order.user_id, status=order.status, total_price=order.total_price,
+                items_count=order.items_count, is_deleted=order.is_deleted, created_at=order.created_at,
+                cancelled_at=order.cancelled_at, archived_at=archived_at,
+            )
+            for order in orders
+        )
+        ArchivedOrderItem.objects.bulk_create(
+            ArchivedOrderItem(
+                order_id=item.order_id, product_id=item.product_id, quantity=item.quantity, unit_price=item.unit_price,
+            )
+            for item in OrderItem.objects.filter(order_id__in=order_ids)
+        )
+        # The Lines Are Deleted by The Cascade
+        Order.objects.filter(order_id__in=order_ids).delete()
+
+        # Archived Orders Leave The Stats, The Deleted Ones Were Already Out
+        stats_deltas = {}
+        for order in orders:
+            add_order_change(stats_deltas, get_order_values(order), None)
+        apply_stats(stats_deltas)
+
+    return orders
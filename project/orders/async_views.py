@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from .models import Order
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .utils import adelete_cache
+from .views import OrderViewSet
+
+logger = logging.getLogger('orders')
+
+# Background Refreshes of The Cached List, The Event Loop Only Keeps Weak References to Its Tasks
+refresh_tasks = set()
+
+
+# Base Class for The Async Orders API ('/api/v1/async/orders/')
+#
+# DRF views are sync only, so these are plain Django async views reusing OrderViewSet's checks, queryset,
+# filters, serializer, pagination and list cache. Reads use the async ORM and the async Redis client,
+# a slow query or cache call doesn't hold a worker thread when served by an ASGI server.
+# Writes run the serializer in a thread: the async ORM has no transactions.
+class AsyncOrderView(View):
+    viewset_class = OrderViewSet
+    http_method_names = ['get', 'post', 'put', 'patch', 'delete']
+    renderer = FastJSONRenderer()
+    # Viewset Action of Each Method, Its Permissions and Throttles Apply
+    actions = {}
+
+    # Same as DRF's Views: The Session Authentication Enforces CSRF Itself, The Token Ones Don't Need It
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        viewset = self.get_viewset(request)
+        request = viewset.request
+        try:
+            if method not in self.http_method_names or method not in self.actions:
+                raise exceptions.MethodNotAllowed(request.method)
+            # The Authentication, Permission and Throttle Checks of The Viewset, The User Lookup Runs in a Thread
+            await sync_to_async(viewset.initial)(request, *args, **kwargs)
+            return await getattr(self, method)(request, viewset, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(viewset, exc)
+
+    # Same Error Bodies and Headers ('WWW-Authenticate', 'Retry-After') as The Viewset's
+    def handle_exception(self, viewset, exc):
+        response = viewset.handle_exception(exc)
+        rendered = self.render(response.data, response.status_code)
+        for header, value in response.items():
+            if header.lower() not in ('content-type', 'vary', 'allow'):
+                rendered[header] = value
+        return rendered
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        return HttpResponse(self.renderer.render(data), content_type='application/json', status=status_code)
+
+    def get_viewset(self, request):
+        viewset = self.viewset_class(action_map=self.actions, format_kwarg=None, args=self.args, kwargs=self.kwargs)
+        viewset.request = viewset.initialize_request(request, *self.args, **self.kwargs)
+        viewset.request.parsers = [FastJSONParser()]
+        return viewset
+
+    # The Order of The Viewset's Queryset, or Its '.values()' Row With 'get_values', Checked by The Object Permissions
+    async def get_object(self, viewset, pk, get_values=None):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        if get_values is not None:
+            queryset = get_values(queryset)
+        try:
+            obj = await queryset.aget(pk=pk)
+        except (Order.DoesNotExist, DjangoValidationError, ValueError):
+            raise exceptions.NotFound('No Order matches the given query.')
+        if get_values is None:
+            viewset.check_object_permissions(viewset.request, obj)
+        else:
+            viewset.check_object_permissions(viewset.request, Order(order_id=obj['order_id'], user_id=obj['user_id']))
+        return obj
+
+    # Validation and Saving in One Thread, The Rendered Data Reads The Saved Products
+    @staticmethod
+    def save(serializer, **kwargs):
+        serializer.is_valid(raise_exception=True)
+        instance = serializer.save(**kwargs)
+        if getattr(instance, '_prefetched_objects_cache', None):
+            instance._prefetched_objects_cache = {}
+        return serializer.data
+
+
+# Processing '/api/v1/async/orders/', GET Lists The Orders (Same Cache as The Sync List), POST Creates One
+class AsyncOrderListView(AsyncOrderView):
+    actions = {'get': 'list', 'post': 'create'}
+
+    async def get(self, request, viewset):
+        list_cache = viewset.list_cache
+        cached_page = await list_cache.aget(request)
+        if cached_page.content is not None:
+            if await list_cache.aclaim_refresh(cached_page):
+                task = asyncio.create_task(self.refresh_page(viewset, request, cached_page))
+                refresh_tasks.add(task)
+                task.add_done_callback(refresh_tasks.discard)
+            return HttpResponse(cached_page.content, content_type='application/json')
+
+        try:
+            content = await self.get_page_content(viewset, request)
+        except Exception:
+            await list_cache.arelease(cached_page)
+            raise
+        await list_cache.astore(cached_page, content)
+        return HttpResponse(content, content_type='application/json')
+
+    async def get_page_content(self, viewset, request):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        paginator = viewset.paginator
+        read_serializer_class = viewset.read_serializer_class
+        page = await paginator.apaginate_queryset(read_serializer_class.get_values(queryset), request, view=viewset)
+        return self.renderer.render(
+            paginator.get_paginated_response(await read_serializer_class().ato_representation(page)).data
+        )
+
+    # Refreshes a Stale Page in a Task of The Event Loop, The Stale Page Has Been Served Meanwhile
+    async def refresh_page(self, viewset, request, cached_page):
+        cached_page.started = time.monotonic()
+        try:
+            await viewset.list_cache.astore(cached_page, await self.get_page_content(viewset, request))
+        except Exception:
+            await viewset.list_cache.arelease(cached_page)
+            logger.exception("Refreshing the cached orders page %s failed", cached_page.key)
+
+    async def post(self, request, viewset):
+        serializer = viewset.get_serializer(data=request.data)
+        data = await sync_to_async(self.save)(serializer, user=request.user)
+        return self.render(data, status.HTTP_201_CREATED)
+
+
+# Processing '/api/v1/async/orders/<pk>/', GET, PUT/PATCH and DELETE (Soft Delete) of One Order
+class AsyncOrderDetailView(AsyncOrderView):
+    actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+
+    async def get(self, request, viewset, pk):
+        row = await self.get_object(viewset, pk, viewset.read_serializer_class.get_values)
+        return self.render((await viewset.read_serializer_class().ato_representation([row]))[0])
+
+    async def put(self, request, viewset, pk, partial=False):
+        order = await self.get_object(viewset, pk)
+        serializer = viewset.get_serializer(order, data=request.data, partial=partial)
+        return self.render(await sync_to_async(self.save)(serializer))
+
+    async def patch(self, request, viewset, pk):
+        return await self.put(request, viewset, pk, partial=True)
+
+    async def delete(self, request, viewset, pk):
+        order = await self.get_object(viewset, pk)
+        order.is_deleted = True
+        await order.asave()
+        await adelete_cache(viewset.KEY_PREFIX, user_id=order.user_id)
+        return HttpResponse(status=status.HTTP_200_OK)
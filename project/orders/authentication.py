@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .routers import route_user_reads
+
+# User Fields Kept in The Cache, Enough for The Permissions, The Querysets and The Logs
+USER_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+# Two-Tier Cache of The Users Behind The Tokens: an LRU in The Process Over Redis
+#
+# A saved or deleted user is dropped from Redis and from the LRU of the process that changed it,
+# the LRUs of other processes hold an entry for 'local_timeout' seconds at most, so a deactivated
+# user or a changed staff flag is seen everywhere within that time.
+# Bulk 'update()' calls don't send signals and leave the user cached until 'timeout'.
+class UserCache:
+    def __init__(self, key_prefix='auth-user', timeout=60, local_timeout=5, max_size=10000):
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self.local_timeout = local_timeout
+        self.max_size = max_size
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_key(self, user_id):
+        return f"{self.key_prefix}:{user_id}"
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.local.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self.local.move_to_end(user_id)
+                return self.build_user(entry[1])
+
+        value = cache.client.get_client().get(self.get_key(user_id))
+        if value is None:
+            return None
+
+        fields = json.loads(value)
+        self.remember(user_id, fields)
+        return self.build_user(fields)
+
+    def set(self, user_id, user):
+        fields = {field: getattr(user, field) for field in USER_FIELDS}
+        cache.client.get_client().set(self.get_key(user_id), json.dumps(fields), ex=self.timeout)
+        self.remember(user_id, fields)
+
+    def remember(self, user_id, fields):
+        with self.lock:
+            self.local[user_id] = (time.monotonic() + self.local_timeout, fields)
+            self.local.move_to_end(user_id)
+            while len(self.local) > self.max_size:
+                self.local.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.local.pop(user_id, None)
+        cache.client.get_client().delete(self.get_key(user_id))
+
+    # A New Instance Every Time, Requests Must Not Share a Mutable User
+    # Built as a row loaded with '.only()', the other fields are deferred and 'save()' leaves them alone
+    def build_user(self, fields):
+        user_model = get_user_model()
+        field_names = [field.attname for field in user_model._meta.concrete_fields if field.attname in fields]
+        return user_model.from_db('default', field_names, [fields[name] for name in field_names])
+
+
+# Cache Configured by The AUTH_USER_CACHE_OPTIONS Setting, One per Process
+@lru_cache(maxsize=None)
+def get_user_cache():
+    return UserCache(**getattr(settings, 'AUTH_USER_CACHE_OPTIONS', {}))
+
+
+# JWT Authentication Resolving The User From The Token's Claim and The User Cache,
+# The User Row Is Only Read From The Database on a Cache Miss
+class CachedJWTAuthentication(JWTAuthentication):
+    # A User Who Wrote Lately Reads From The Primary (ReplicaRoutingMiddleware)
+    def authenticate(self, request):
+        user_auth = super().authenticate(request)
+        if user_auth is not None:
+            route_user_reads(user_auth[0].pk)
+        return user_auth
+
+    def get_user(self, validated_token):
+        # Checking The Password Hash Needs The Full Row
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user_cache = get_user_cache()
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = self.user_model.objects.only(*USER_FIELDS).get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        return user
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import math
+import random
+import time
+from dataclasses import dataclass
+from urllib.parse import urlencode
+from django.core.cache import cache
+from .routers import read_from_primary
+from .utils import (
+    STAFF_SCOPE, get_async_redis_client, get_generation_key, get_recent_write_key, get_user_scope,
+    split_generations_and_writes,
+)
+
+
+# Page of The List Cache Looked Up for a Request
+#
+# 'content' is served right away when it is set, with 'refresh' the request also has to recompute
+# the page (after its response with the sync views). Without content the request computes the page
+# and stores it, 'generations' are the ones read before the page's queries.
+@dataclass
+class CachedPage:
+    key: str
+    lock_key: str
+    generations: tuple
+    started: float
+    content: bytes = None
+    refresh: bool = False
+
+
+# Response Cache for The Orders List
+#
+# Pages are stored as rendered JSON bytes under '<prefix>:page:<scope>:<path and params digest>',
+# with the generations they were computed at, so a write to one user's order only invalidates that
+# user's and the admins' pages. One round trip reads the generations and the page.
+#
+# Against stampedes, only one request per page recomputes it, under a Redis lock ('SET NX'):
+# - a page of an old generation (a write happened) isn't served, the other requests wait for the new one
+#   for 'wait_timeout' seconds at most, then compute it themselves;
+# - a page older than 'soft_timeout' is still served to the other requests while it is refreshed;
+# - before the soft timeout a page is refreshed early with a probability growing as it gets closer,
+#   weighted by the time the page took to compute ('XFetch'), so the refresh is rarely synchronized.
+# Pages are dropped by Redis after 'timeout' whatever happens.
+class OrderListCache:
+    lock_timeout = 10
+    wait_timeout = 2
+    poll_interval = 0.05
+    early_expiration_beta = 1.0
+
+    def __init__(self, key_prefix, timeout, soft_timeout=None):
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self.soft_timeout = timeout if soft_timeout is None else soft_timeout
+
+    def get_scope(self, request):
+        if request.user.is_staff:
+            return STAFF_SCOPE
+        return get_user_scope(request.user.id)
+
+    # Query Params in a Stable Order Without Empty Values
+    def normalize_params(self, request):
+        return sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+            if value != ''
+        )
+
+    # The Path Is Part of The Digest, Pages of The Sync and Async Views Have Different Links
+    def get_page_key(self, request, scope):
+        digest = hashlib.md5(f"{request.path}?{urlencode(self.normalize_params(request))}".encode()).hexdigest()
+        return f"{self.key_prefix}:page:{scope}:{digest}"
+
+    # Keys of The Generations, of Their Recent Writes and of The Page, Read With One MGET
+    def get_lookup_keys(self, request):
+        scope = self.get_scope(request)
+        generation_keys = [get_generation_key(self.key_prefix), get_generation_key(f"{self.key_prefix}:{scope}")]
+        page_key = self.get_page_key(request, scope)
+        return page_key, generation_keys + [get_recent_write_key(key) for key in generation_keys] + [page_key]
+
+    # Only JSON Responses Are Cached, The Browsable API Is Rendered Every Time
+    def get(self, request):
+        if request.accepted_renderer.format != 'json':
+            return None
+
+        redis_client = cache.client.get_client()
+        page_key, keys = self.get_lookup_keys(request)
+        page = self.build_page(page_key, redis_client.mget(keys))
+        if page.content is not None or self.lock(redis_client, page):
+            return page
+
+        # Another Request Computes The New Generation
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            content = self.get_current_content(page, redis_client.get(page_key))
+            if content is not None:
+                page.content = content
+                break
+        return page
+
+    # Same Lookup With The Async Redis Client, The Async Views Only Render JSON
+    async def aget(self, request):
+        redis_client = get_async_redis_client()
+        page_key, keys = self.get_lookup_keys(request)
+        page = self.build_page(page_key, await redis_client.mget(keys))
+        if page.content is not None or await self.alock(redis_client, page):
+            return page
+
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            content = self.get_current_content(page, await redis_client.get(page_key))
+            if content is not None:
+                page.content = content
+                break
+        return page
+
+    # Stores The Rendered Content Once The Response Has Been Rendered
+    def store(self, page, response):
+        if page is None:
+            return
+        if response.status_code != 200:
+            self.release(page)
+            return
+
+        def set_content(rendered_response):
+            self.set(page, rendered_response.content)
+
+        response.add_post_render_callback(set_content)
+
+    def set(self, page, content):
+        pipeline = cache.client.get_client().pipeline(transaction=False)
+        pipeline.set(page.key, self.pack(page, content), ex=self.timeout)
+        pipeline.delete(page.lock_key)
+        pipeline.execute()
+
+    async def astore(self, page, content):
+        pipeline = get_async_redis_client().pipeline(transaction=False)
+        pipeline.set(page.key, self.pack(page, content), ex=self.timeout)
+        pipeline.delete(page.lock_key)
+        await pipeline.execute()
+
+    # Decides What The Request Does With The Page Read Along With The Generations
+    def build_page(self, page_key, values):
+        generations, written_lately = split_generations_and_writes(values[:4], 2)
+        # The Page of a Scope Written Within The Replica's Lag Is Read From The Primary Before It Is Cached
+        if written_lately:
+            read_from_primary.set(True)
+
+        page = CachedPage(
+            key=page_key,
+            lock_key=f"{page_key}:lock:{generations[0]}:{generations[1]}",
+            generations=tuple(generations),
+            started=time.monotonic(),
+        )
+        entry = self.unpack(values[4])
+        if entry is None or entry[0] != page.generations:
+            return page
+
+        _, soft_expires_at, delta, content = entry
+        page.content = content
+        # Refreshed Early, Once Expired The Stale Page Is Served While One Request Refreshes It
+        page.refresh = (
+            time.time() - delta * self.early_expiration_beta * math.log(1.0 - random.random()) >= soft_expires_at
+        )
+        return page
+
+    # The Lock Is Per Generation, Its Holder Recomputes The Page
+    def lock(self, redis_client, page):
+        return bool(redis_client.set(page.lock_key, 1, nx=True, ex=self.lock_timeout))
+
+    async def alock(self, redis_client, page):
+        return bool(await redis_client.set(page.lock_key, 1, nx=True, ex=self.lock_timeout))
+
+    # A Request Failing to Compute The Page Lets The Waiting Ones Compute It Right Away
+    def release(self, page):
+        cache.client.get_client().delete(page.lock_key)
+
+    async def arelease(self, page):
+        await get_async_redis_client().delete(page.lock_key)
+
+    # Takes The Lock of a Page Served Stale, Only One Request Refreshes It
+    def claim_refresh(self, page):
+        return page.refresh and self.lock(cache.client.get_client(), page)
+
+    async def aclaim_refresh(self, page):
+        return page.refresh and await self.alock(get_async_redis_client(), page)
+
+    def get_current_content(self, page, value):
+        entry = self.unpack(value)
+        if entry is None or entry[0] != page.generations:
+            return None
+        return entry[3]
+
+    # '<generation>:<scope generation>:<soft expiry>:<seconds to compute>\n<content>'
+    def pack(self, page, content):
+        delta = time.monotonic() - page.started
+        header = f"{page.generations[0]}:{page.generations[1]}:{time.time() + self.soft_timeout}:{delta}"
+        return header.encode() + b'\n' + content
+
+    def unpack(self, value):
+        if value is None:
+            return None
+        header, _, content = value.partition(b'\n')
+        try:
+            generation, scope_generation, soft_expires_at, delta = header.split(b':')
+            return (int(generation), int(scope_generation)), float(soft_expires_at), float(delta), content
+        except ValueError:
+            return None
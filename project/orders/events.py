@@ -0,0 +1,129 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('orders')
+
+# Event for a Logger, 'created' Is The Time It Happened, Not The Time It Was Written
+Event = namedtuple('Event', ['logger', 'message', 'created'])
+
+# Marks The End of The Queue for The Writer Thread
+STOP = object()
+
+
+# Default Sink, Writes The Events to Their Loggers (And So to Their Log Files)
+class LoggerSink:
+    def write(self, events):
+        for event in events:
+            event_logger = logging.getLogger(event.logger)
+            if not event_logger.isEnabledFor(logging.INFO):
+                continue
+            record = event_logger.makeRecord(event_logger.name, logging.INFO, '', 0, event.message, (), None)
+            record.created = event.created
+            record.msecs = (event.created - int(event.created)) * 1000
+            event_logger.handle(record)
+
+
+# Bounded In-Process Queue Drained by a Background Writer Thread
+#
+# Backpressure policy: when the queue is full, 'publish' waits up to 'put_timeout' seconds
+# for room and then drops the event, counting it in 'dropped'. A request never waits longer
+# than 'put_timeout' for the writer, and memory never grows beyond 'max_size' events.
+#
+# The writer takes up to 'batch_size' events at a time and hands them to the sink in one call.
+# Queued events are written when the process exits ('atexit') or when 'stop' is called.
+class EventPipeline:
+    def __init__(self, sink, max_size=10000, batch_size=100, put_timeout=0.05, stop_timeout=5):
+        self.sink = sink
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.stop_timeout = stop_timeout
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+        self.queue = None
+
+    # The Writer Is Started Lazily, and Again in a Forked Worker Process
+    def start(self):
+        if self.pid == os.getpid() and self.thread is not None:
+            return
+
+        with self.lock:
+            if self.pid == os.getpid() and self.thread is not None:
+                return
+            self.queue = queue.Queue(self.max_size)
+            self.thread = threading.Thread(target=self.run, name='order-events-writer', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+            atexit.register(self.stop)
+
+    def publish(self, event):
+        self.start()
+        try:
+            self.queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning('Event queue is full, dropped %s events so far', self.dropped)
+
+    def run(self):
+        while True:
+            events = [self.queue.get()]
+            while len(events) < self.batch_size:
+                try:
+                    events.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = STOP in events
+            events = [event for event in events if event is not STOP]
+            if events:
+                try:
+                    self.sink.write(events)
+                except Exception:
+                    logger.exception('Failed to write %s events', len(events))
+
+            for _ in range(len(events) + stopping):
+                self.queue.task_done()
+            if stopping:
+                return
+
+    # Waits Until Every Queued Event Is Written
+    def flush(self):
+        if self.pid == os.getpid() and self.thread is not None:
+            self.queue.join()
+
+    # Writes The Queued Events and Stops The Writer
+    def stop(self):
+        if self.pid != os.getpid() or self.thread is None:
+            return
+
+        thread, self.thread = self.thread, None
+        try:
+            self.queue.put(STOP, timeout=self.stop_timeout)
+        except queue.Full:
+            logger.warning('Event writer is stuck, %s events are lost', self.queue.qsize())
+            return
+        thread.join(self.stop_timeout)
+
+
+# Pipeline Configured by The EVENTS_SINK and EVENTS_PIPELINE_OPTIONS Settings, One per Process
+@lru_cache(maxsize=None)
+def get_event_pipeline():
+    sink_class = import_string(getattr(settings, 'EVENTS_SINK', 'orders.events.LoggerSink'))
+    return EventPipeline(sink_class(), **getattr(settings, 'EVENTS_PIPELINE_OPTIONS', {}))
+
+
+# Queues The Event Once The Current Transaction Commits, Nothing Is Written for a Rollback
+def publish_event(logger_name, message):
+    event = Event(logger_name, message, time.time())
+    transaction.on_commit(lambda: get_event_pipeline().publish(event))
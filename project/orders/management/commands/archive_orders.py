@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from orders.archive import archive_orders_batch, get_archive_cutoff
+from orders.views import OrderViewSet
+
+
+# Moves Soft-Deleted and Long-Cancelled Orders to The Archive Tables, in Batches
+#
+# Every batch is committed on its own, an interrupted run is resumed by running the command
+# again. Meant to be run periodically (cron), several runs in parallel don't collide.
+class Command(BaseCommand):
+    help = 'Moves soft-deleted and old cancelled orders with their lines to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--cancelled-days', type=int, help='Age of the archived cancelled orders, ARCHIVE_CANCELLED_AFTER_DAYS by default',
+        )
+        parser.add_argument('--max-batches', type=int, help='Stop after that many batches')
+
+    def handle(self, *args, **options):
+        cutoff = get_archive_cutoff(options['cancelled_days'])
+        archived = 0
+        user_ids = set()
+        batches = 0
+
+        while options['max_batches'] is None or batches < options['max_batches']:
+            orders = archive_orders_batch(cutoff, batch_size=options['batch_size'])
+            if not orders:
+                break
+            batches += 1
+            archived += len(orders)
+            # Only The Cancelled Orders Were Still Listed
+            user_ids.update(order.user_id for order in orders if not order.is_deleted)
+
+        OrderViewSet().delete_users_cache(user_ids)
+        self.stdout.write(f'Archived {archived} orders in {batches} batches')
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import ThreadSensitiveContext
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from orders.models import Order
+
+BENCH_USERNAME = 'bench-async-views'
+
+
+# Sleeps Before Every Query Like a Slow Database Would, The Calling Thread Is Blocked Meanwhile
+# Also tracks the highest number of queries waiting at the same time
+class SimulatedLatency:
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.latency)
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    # Inserted First, 'connection.execute_wrapper' Pops The Last Wrapper When It Exits
+    def add_to(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, self)
+
+
+# Serves The Same Requests by One Worker With The Sync Viewset (a Pool of '--threads' Threads, Like
+# a gthread Worker) and With The Async Views ('--concurrency' Requests in Flight on One Event Loop, Like
+# an ASGI Worker) While Every Query Takes '--latency' Seconds Longer
+class Command(BaseCommand):
+    help = 'Compares the sync and async orders views of one worker under simulated database latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', type=float, default=0.05, help='Seconds added to every query')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and view')
+        parser.add_argument('--threads', type=int, default=4, help='Threads of the sync worker')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight on the event loop')
+
+    # The Test Clients Send 'testserver' as The Host
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        order = Order.objects.filter(user=user, is_deleted=False).first()
+        if order is None:
+            order = Order.objects.create(user=user, status='pending', total_price='40.00')
+        headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+        latency = SimulatedLatency(options['latency'])
+        connection_created.connect(latency.add_to)
+        for connection in connections.all():
+            latency.add_to(connection)
+
+        # Every List Request Has Its Own Query String, Otherwise It Would Be Served From The Cache
+        for endpoint, path in (('list', 'orders/?bench={number}'), ('detail', f'orders/{order.order_id}/')):
+            sync_paths = [f'/api/v1/{path}'.format(number=number) for number in range(options['requests'])]
+            async_paths = [f'/api/v1/async/{path}'.format(number=number) for number in range(options['requests'])]
+
+            latency.peak = 0
+            elapsed = self.run_sync(sync_paths, headers, options['threads'])
+            self.report(f'sync  {endpoint}', len(sync_paths), elapsed, latency.peak)
+
+            latency.peak = 0
+            elapsed = asyncio.run(self.run_async(async_paths, headers, options['concurrency']))
+            self.report(f'async {endpoint}', len(async_paths), elapsed, latency.peak)
+
+        connection_created.disconnect(latency.add_to)
+
+    def run_sync(self, paths, headers, threads):
+        def get(path):
+            response = Client().get(path, headers=headers)
+            assert response.status_code == 200, response.content
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(get, paths))
+        return time.perf_counter() - started
+
+    async def run_async(self, paths, headers, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        # Every Request Gets Its Own Thread for The ORM Calls, Like Under Django's ASGI Handler
+        async def get(path):
+            async with semaphore, ThreadSensitiveContext():
+                response = await AsyncClient().get(path, headers=headers)
+                assert response.status_code == 200, response.content
+
+        started = time.perf_counter()
+        await asyncio.gather(*(get(path) for path in paths))
+        return time.perf_counter() - started
+
+    def report(self, label, count, elapsed, peak):
+        self.stdout.write(f'{label}: {count / elapsed:.0f} req/s, {peak} queries in flight at most')
@@ -0,0 +1,53 @@
+import json
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+from orders.models import Order
+
+BENCH_USERNAME = 'bench-bulk-import'
+
+
+def make_order(number, products_count):
+    return {
+        "status": "pending",
+        "total_price": f"{number % 1000}.00",
+        "products": [
+            {"name": f"product {number}-{item}", "price": "10.00", "quantity": 1}
+            for item in range(products_count)
+        ],
+    }
+
+
+# Compares Posting Orders One by One With The Bulk Import Endpoint
+class Command(BaseCommand):
+    help = 'Benchmarks orders/bulk/ against single order creation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--products', type=int, default=3, help='Products per order')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=user)
+        orders = [make_order(number, options['products']) for number in range(options['orders'])]
+
+        started = time.perf_counter()
+        for order in orders:
+            response = client.post('/api/v1/orders/', order, format='json')
+            assert response.status_code == 201, response.content
+        single = time.perf_counter() - started
+
+        body = '\n'.join(json.dumps(order) for order in orders)
+        started = time.perf_counter()
+        response = client.post('/api/v1/orders/bulk/', body, content_type='application/x-ndjson')
+        bulk = time.perf_counter() - started
+        assert response.status_code == 200, response.content
+
+        count = len(orders)
+        self.stdout.write(f'single: {count / single:.0f} orders/s ({single:.2f}s for {count} orders)')
+        self.stdout.write(f'bulk:   {count / bulk:.0f} orders/s ({bulk:.2f}s for {count} orders)')
+        self.stdout.write(f'speedup: {single / bulk:.1f}x')
+
+        Order.objects.filter(user=user).delete()
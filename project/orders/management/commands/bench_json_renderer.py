@@ -0,0 +1,78 @@
+import io
+import time
+import uuid
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from orders.models import Order, OrderItem, Product
+from orders.parsers import FastJSONParser
+from orders.renderers import FastJSONRenderer, orjson
+from orders.serializers import OrderSerializer
+
+
+# Orders Built in Memory With Their Products Set Like prefetch_related Does, No Database Needed
+def make_orders(count, products_count):
+    user = User(id=1, username='bench-json')
+    orders = []
+    for number in range(count):
+        order = Order(
+            order_id=uuid.uuid4(), user=user, status='pending', total_price=Decimal(number % 1000) + Decimal('0.50'),
+        )
+        products = [
+            Product(product_id=uuid.uuid4(), name=f'product №{item}', price=Decimal('45.00'), quantity=item)
+            for item in range(products_count)
+        ]
+        items = [OrderItem(order=order, product=product, quantity=1, unit_price=product.price) for product in products]
+        order._prefetched_objects_cache = {
+            'products': prefetched(Product, products), 'items': prefetched(OrderItem, items),
+        }
+        orders.append(order)
+    return orders
+
+
+def prefetched(model, instances):
+    queryset = model.objects.none()
+    queryset._result_cache = instances
+    queryset._prefetch_done = True
+    return queryset
+
+
+# Compares DRF's JSONRenderer and JSONParser With The orjson Backed Ones on The Orders List Format
+class Command(BaseCommand):
+    help = 'Benchmarks rendering and parsing orders with the stdlib and orjson JSON backends'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--products', type=int, default=10, help='Products per order')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write('orjson is not installed, FastJSONRenderer falls back to the stdlib json')
+
+        data = OrderSerializer(make_orders(options['orders'], options['products']), many=True).data
+        stdlib_content = JSONRenderer().render(data)
+        fast_content = FastJSONRenderer().render(data)
+        assert fast_content == stdlib_content, 'The rendered bytes differ'
+        self.stdout.write(f"{options['orders']} orders, {len(stdlib_content) / 1024 / 1024:.1f} MiB, identical output")
+
+        render_stdlib = self.bench(lambda: JSONRenderer().render(data), options['repeat'])
+        render_fast = self.bench(lambda: FastJSONRenderer().render(data), options['repeat'])
+        parse_stdlib = self.bench(lambda: JSONParser().parse(io.BytesIO(stdlib_content)), options['repeat'])
+        parse_fast = self.bench(lambda: FastJSONParser().parse(io.BytesIO(stdlib_content)), options['repeat'])
+
+        self.stdout.write(f'render: json {render_stdlib * 1000:.1f}ms, orjson {render_fast * 1000:.1f}ms '
+                          f'({render_stdlib / render_fast:.1f}x)')
+        self.stdout.write(f'parse:  json {parse_stdlib * 1000:.1f}ms, orjson {parse_fast * 1000:.1f}ms '
+                          f'({parse_stdlib / parse_fast:.1f}x)')
+
+    # Best of The Runs
+    def bench(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,120 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from orders.models import Order
+from orders.pagination import OrderCursorPagination
+from orders.stats import add_created_orders, delete_orders
+from orders.utils import delete_cache
+from orders.views import OrderViewSet
+
+BENCH_USER_PREFIX = 'bench-filters-'
+
+# Every Filter Combination Supported by OrderViewSet.get_queryset and The Ordering
+STATUS_FILTERS = [{}, {'status': 'pending'}]
+PRICE_FILTERS = [{}, {'min_price': '4000'}, {'max_price': '100'}, {'min_price': '1000', 'max_price': '1200'}]
+ORDERINGS = [{}, {'ordering': 'total_price'}, {'ordering': '-total_price'}]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# Seeds Orders and Reports Query Plans and Latencies of The Orders List Filters
+class Command(BaseCommand):
+    help = 'Benchmarks the first page of the orders list for every filter combination'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--deleted-ratio', type=float, default=0.2)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--explain', action='store_true', help='Print the full query plans')
+
+    def handle(self, *args, **options):
+        bench_users = User.objects.filter(username__startswith=BENCH_USER_PREFIX)
+        if bench_users.exists():
+            raise CommandError(
+                f"Users '{BENCH_USER_PREFIX}*' are left from another run, delete them and run rebuild_order_stats."
+            )
+
+        try:
+            users = self.seed(options['orders'], options['users'], options['deleted_ratio'])
+            admin = User.objects.create(username=f'{BENCH_USER_PREFIX}admin', is_staff=True)
+
+            for role, user in (('admin', admin), ('user', users[0])):
+                for params in itertools.product(STATUS_FILTERS, PRICE_FILTERS, ORDERINGS):
+                    params = {key: value for part in params for key, value in part.items()}
+                    self.bench(role, user, params, options['repeat'], options['explain'])
+        finally:
+            self.remove(bench_users)
+
+    # Creating The Orders in Batches, They Are Counted in The Stats Like Any Other
+    def seed(self, total, users_count, deleted_ratio):
+        users = User.objects.bulk_create(User(username=f'{BENCH_USER_PREFIX}{number}') for number in range(users_count))
+
+        started = timezone.now()
+        random.seed(0)
+        batch = []
+        for number in range(total):
+            batch.append(Order(
+                user=users[number % users_count],
+                status=random.choice(('pending', 'confirmed', 'cancelled')),
+                total_price=Decimal(random.randint(100, 500000)) / 100,
+                is_deleted=random.random() < deleted_ratio,
+                created_at=started - timedelta(seconds=number),
+            ))
+            if len(batch) == 10000 or number == total - 1:
+                with transaction.atomic():
+                    add_created_orders(Order.objects.bulk_create(batch))
+                batch = []
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE orders_order')
+        self.stdout.write(f'Seeded {total} orders')
+        return users
+
+    # The Bench Users and Their Orders Leave The Stats and The Database
+    def remove(self, bench_users):
+        deleted = delete_orders(Order.objects.filter(user__in=bench_users))
+        bench_users.delete()
+        delete_cache(OrderViewSet.KEY_PREFIX)
+        self.stdout.write(f'Deleted {deleted} orders')
+
+    def bench(self, role, user, params, repeat, explain):
+        request = Request(APIRequestFactory().get('/api/v1/orders/', params, HTTP_HOST='localhost'))
+        request.user = user
+        view = OrderViewSet(request=request, action='list', format_kwarg=None, kwargs={})
+        queryset = view.filter_queryset(view.get_queryset())
+
+        # The Query Run by The Paginator for The First Page
+        paginator = OrderCursorPagination()
+        ordering = paginator.get_ordering(request, queryset, view)
+        page = queryset.order_by(*ordering).prefetch_related(None)[:paginator.page_size + 1]
+
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(page.all())
+            timings.append(time.perf_counter() - started)
+
+        plan = page.explain(analyze=True) if connection.vendor == 'postgresql' else page.explain()
+        self.stdout.write(
+            f'{role:5} {params or "no filters"}: '
+            f'p50={percentile(timings, 0.50) * 1000:.2f}ms p99={percentile(timings, 0.99) * 1000:.2f}ms'
+        )
+        self.stdout.write('    ' + ('\n    '.join(plan.splitlines()) if explain else self.summarize(plan)))
+
+    # Index Names or Scan Types From The Plan
+    def summarize(self, plan):
+        lines = [line.strip() for line in plan.splitlines()]
+        return ' | '.join(line for line in lines if 'Scan' in line or 'SCAN' in line or 'SEARCH' in line)
@@ -0,0 +1,127 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import parse_qs, urlparse
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from orders.models import Order
+from orders.pagination import OrderCursorPagination
+from orders.stats import add_created_orders, delete_orders
+from orders.utils import delete_cache
+from orders.views import OrderViewSet
+
+BENCH_USERNAME = 'bench-pagination'
+PAGE_BUCKETS = [(1, 10), (11, 100), (101, 1000), (1001, 10000), (10001, None)]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# Walks The Orders List Page by Page and Reports Latency per Depth
+class Command(BaseCommand):
+    help = 'Benchmarks cursor pagination of the orders list from page 1 to the last page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=10000)
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--ordering', default='', help="e.g. 'total_price' or '-total_price'")
+        parser.add_argument('--compare-offset', action='store_true', help='Also time OFFSET pagination')
+
+    def handle(self, *args, **options):
+        pages = options['pages']
+        page_size = options['page_size']
+        if User.objects.filter(username=BENCH_USERNAME).exists():
+            raise CommandError(
+                f"User '{BENCH_USERNAME}' is left from another run, delete it and run rebuild_order_stats."
+            )
+
+        user = self.seed(pages * page_size)
+        try:
+            timings = self.walk_cursor(user, pages, page_size, options['ordering'])
+            self.report('cursor', timings)
+
+            if options['compare_offset']:
+                self.report('offset', self.walk_offset(user, pages, page_size))
+        finally:
+            self.remove(user)
+
+    # Creating Enough Orders for The Requested Number of Pages, They Are Counted in The Stats Like Any Other
+    def seed(self, total):
+        user = User.objects.create(username=BENCH_USERNAME, is_staff=True)
+        started = timezone.now()
+        batch = []
+        for number in range(total):
+            batch.append(Order(
+                user=user,
+                status=('pending', 'confirmed', 'cancelled')[number % 3],
+                total_price=Decimal(number % 5000) + Decimal('0.99'),
+                created_at=started - timedelta(seconds=number),
+            ))
+            if len(batch) == 10000 or number == total - 1:
+                with transaction.atomic():
+                    add_created_orders(Order.objects.bulk_create(batch))
+                batch = []
+        self.stdout.write(f'Seeded {total} orders')
+        return user
+
+    # The Bench User and Its Orders Leave The Stats and The Database
+    def remove(self, user):
+        deleted = delete_orders(Order.objects.filter(user=user))
+        user_id = user.id
+        user.delete()
+        delete_cache(OrderViewSet.KEY_PREFIX, user_id=user_id)
+        self.stdout.write(f'Deleted {deleted} orders')
+
+    def make_view(self, user, params):
+        request = Request(APIRequestFactory().get('/api/v1/orders/', params, HTTP_HOST='localhost'))
+        request.user = user
+        view = OrderViewSet(request=request, action='list', format_kwarg=None, kwargs={})
+        return view, request
+
+    def walk_cursor(self, user, pages, page_size, ordering):
+        params = {'page_size': page_size}
+        if ordering:
+            params['ordering'] = ordering
+
+        timings = []
+        for _ in range(pages):
+            view, request = self.make_view(user, params)
+            paginator = OrderCursorPagination()
+
+            started = time.perf_counter()
+            paginator.paginate_queryset(view.filter_queryset(view.get_queryset()), request, view)
+            timings.append(time.perf_counter() - started)
+
+            next_link = paginator.get_next_link()
+            if next_link is None:
+                break
+            params['cursor'] = parse_qs(urlparse(next_link).query)['cursor'][0]
+        return timings
+
+    def walk_offset(self, user, pages, page_size):
+        view, _ = self.make_view(user, {})
+        queryset = view.get_queryset().order_by('-created_at', '-order_id')
+
+        timings = []
+        for page in range(pages):
+            started = time.perf_counter()
+            list(queryset[page * page_size:(page + 1) * page_size])
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    def report(self, name, timings):
+        self.stdout.write(f'{name} pagination, {len(timings)} pages:')
+        for first, last in PAGE_BUCKETS:
+            bucket = timings[first - 1:last]
+            if not bucket:
+                break
+            self.stdout.write(
+                f'  pages {first}-{first + len(bucket) - 1}: '
+                f'p50={percentile(bucket, 0.50) * 1000:.2f}ms p99={percentile(bucket, 0.99) * 1000:.2f}ms'
+            )
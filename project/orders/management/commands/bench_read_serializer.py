@@ -0,0 +1,61 @@
+import time
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from orders.models import Order, Product
+from orders.serializers import OrderSerializer, OrderValuesSerializer, link_products
+
+BENCH_USERNAME = 'bench-read-serializer'
+
+
+# Compares Reading a Page of Orders Through OrderSerializer (Model Instances, DRF Fields)
+# With OrderValuesSerializer ('.values()' Rows, Plain Dicts), Both Include Their Queries
+class Command(BaseCommand):
+    help = 'Benchmarks the model serializer and the values serializer on the orders read path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000, help='Orders read per run')
+        parser.add_argument('--products', type=int, default=10, help='Products per order')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        self.seed(user, options['orders'], options['products'])
+        queryset = Order.objects.filter(user=user).order_by('-created_at', '-order_id')[:options['orders']]
+
+        def read_models():
+            return OrderSerializer(OrderSerializer.setup_eager_loading(queryset), many=True).data
+
+        def read_values():
+            return OrderValuesSerializer().to_representation(list(OrderValuesSerializer.get_values(queryset)))
+
+        assert JSONRenderer().render(read_models()) == JSONRenderer().render(read_values()), 'The outputs differ'
+        self.stdout.write(f"{options['orders']} orders with {options['products']} products each, identical output")
+
+        for label, function in (('OrderSerializer      ', read_models), ('OrderValuesSerializer', read_values)):
+            with CaptureQueriesContext(connection) as queries:
+                function()
+            elapsed = self.bench(function, options['repeat'])
+            self.stdout.write(f'{label}: {elapsed * 1000:.1f}ms, {len(queries)} queries')
+
+    # Tops Up The Bench User's Orders, Kept Between Runs
+    def seed(self, user, count, products_count):
+        missing = count - Order.objects.filter(user=user).count()
+        for number in range(missing):
+            order = Order.objects.create(user=user, status='pending', total_price=Decimal(number % 1000) + Decimal('0.50'))
+            products = Product.objects.bulk_create(
+                Product(name=f'product №{item}', price=Decimal('45.00'), quantity=item) for item in range(products_count)
+            )
+            link_products(order, products)
+
+    # Best of The Runs
+    def bench(self, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from decimal import Decimal
+from urllib.request import Request, urlopen
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from orders.models import Order
+from orders.stats import add_created_orders, delete_orders
+from orders.utils import delete_cache
+from orders.views import OrderViewSet
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+
+# Sends Requests to a Running Server (runserver or gunicorn) and Reports The Throughput
+# of The Orders List and Detail Endpoints, Every '--url' Is Compared With The First One
+#
+# The requests are sent as a user created for the test in the database of the settings, which must be
+# the servers' database. The user must not exist yet, it is deleted with its orders at the end.
+class Command(BaseCommand):
+    help = 'Load tests the orders list and detail endpoints of running servers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', required=True, help='e.g. http://back:8000, can be repeated')
+        parser.add_argument('--username', required=True, help='User created for the test, must not exist')
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=30, help='Seconds per endpoint')
+        parser.add_argument('--orders', type=int, default=500, help='Orders of the load test user')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username=options['username']).exists():
+            raise CommandError(f"User '{options['username']}' already exists, the load test user is deleted afterwards.")
+
+        user = self.seed(options['username'], options['password'], options['orders'])
+        try:
+            self.run_endpoints(options)
+        finally:
+            self.remove(user)
+
+    def run_endpoints(self, options):
+        results = {}
+        for base_url in options['url']:
+            base_url = base_url.rstrip('/')
+            headers = {'Authorization': f'Bearer {self.login(base_url, options["username"], options["password"])}'}
+            orders = self.get(base_url + '/api/v1/orders/', headers)['results']
+
+            for endpoint, path in (
+                ('list', '/api/v1/orders/'),
+                ('detail', f"/api/v1/orders/{orders[0]['order_id']}/"),
+            ):
+                rps = self.run(base_url + path, headers, options['concurrency'], options['duration'])
+                results[(base_url, endpoint)] = rps
+                baseline = results[(options['url'][0].rstrip('/'), endpoint)]
+                if base_url != options['url'][0].rstrip('/') and baseline:
+                    self.stdout.write(f'    {rps / baseline:.2f}x of {options["url"][0]}')
+
+    # The Orders Are Counted in The Stats Like Any Other, and Leave Them With The User
+    @transaction.atomic
+    def seed(self, username, password, count):
+        user = User.objects.create_user(username=username, password=password)
+        add_created_orders(Order.objects.bulk_create(
+            Order(user=user, status='pending', total_price=Decimal(number % 1000)) for number in range(count)
+        ))
+        transaction.on_commit(lambda: delete_cache(OrderViewSet.KEY_PREFIX, user_id=user.id))
+        return user
+
+    def remove(self, user):
+        delete_orders(Order.objects.filter(user=user))
+        user_id = user.id
+        user.delete()
+        delete_cache(OrderViewSet.KEY_PREFIX, user_id=user_id)
+
+    def login(self, base_url, username, password):
+        body = json.dumps({'username': username, 'password': password}).encode()
+        request = Request(base_url + '/api/v1/login/', body, {'Content-Type': 'application/json'})
+        with urlopen(request) as response:
+            return json.load(response)['access']
+
+    def get(self, url, headers):
+        with urlopen(Request(url, headers=headers)) as response:
+            return json.load(response)
+
+    # Every Thread Sends Requests One After Another Until The Time Is Over
+    def run(self, url, headers, concurrency, duration):
+        timings = []
+        errors = []
+        deadline = time.monotonic() + duration
+
+        def worker():
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    with urlopen(Request(url, headers=headers)) as response:
+                        response.read()
+                except Exception as exc:
+                    errors.append(exc)
+                    continue
+                timings.append(time.perf_counter() - started)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        rps = len(timings) / elapsed
+        self.stdout.write(
+            f'{url}: {rps:.0f} req/s, p50={percentile(timings, 0.50) * 1000:.1f}ms '
+            f'p99={percentile(timings, 0.99) * 1000:.1f}ms, {len(errors)} errors'
+        )
+        return rps
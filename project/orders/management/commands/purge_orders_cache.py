@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from orders.utils import purge_cache
+from orders.views import OrderViewSet
+
+
+# Removes Every Cached Orders Page, Not Only The Current Generation
+class Command(BaseCommand):
+    help = 'Purges all cached orders list pages with SCAN + UNLINK'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        purged = purge_cache(OrderViewSet.KEY_PREFIX, batch_size=options['batch_size'])
+        self.stdout.write(f'Purged {purged} cache keys')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from orders.stats import rebuild_stats
+
+
+# Recomputes The Order Stats ('/api/v1/orders/stats/') From The Orders Table
+#
+# The stats are kept in the transaction of every order write, changes made behind the models
+# (queryset 'update()', raw SQL, orders deleted with their user) are only counted after a rebuild.
+class Command(BaseCommand):
+    help = 'Rebuilds the order stats from the orders table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='User and status totals written per query')
+
+    def handle(self, *args, **options):
+        counted = rebuild_stats(batch_size=options['batch_size'])
+        self.stdout.write(f'Rebuilt the stats of {counted} orders')
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from orders.models import OutboxEvent
+from orders.outbox import get_relay_sink, relay_outbox_batch
+
+
+# Delivers The Outbox Events, Several Relays Can Run in Parallel
+class Command(BaseCommand):
+    help = 'Delivers the outbox events to the configured sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when idle')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox and exit')
+        parser.add_argument('--sink', help="e.g. 'orders.outbox.RedisStreamSink', OUTBOX_RELAY_SINK by default")
+        parser.add_argument('--keep-days', type=int, default=7, help='Delivered events are deleted after that')
+
+    def handle(self, *args, **options):
+        sink = import_string(options['sink'])() if options['sink'] else get_relay_sink()
+        delivered = 0
+
+        while True:
+            count = relay_outbox_batch(sink, batch_size=options['batch_size'])
+            delivered += count
+            if count:
+                continue
+
+            self.purge_delivered(options['keep_days'])
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write(f'Delivered {delivered} events')
+
+    def purge_delivered(self, keep_days):
+        OutboxEvent.objects.filter(delivered_at__lt=timezone.now() - timedelta(days=keep_days)).delete()
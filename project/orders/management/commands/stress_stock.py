@@ -0,0 +1,151 @@
+import queue
+import random
+import threading
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from orders.models import Order, OrderItem, Product
+from orders.stats import add_created_orders, delete_orders
+from orders.stock import InsufficientStock
+from orders.utils import delete_cache
+from orders.views import OrderViewSet
+
+STRESS_USERNAME = 'stress-stock'
+
+
+# Confirms Orders Sharing a Few Products From Many Threads, Some of Them Are Cancelled Right After,
+# Then Checks That The Stock Left Is Exactly The Initial Stock Minus The Lines of The Confirmed Orders
+#
+# The lines of every order list the products in a random order, two confirmations lock the same
+# products and only the product_id order of the locks keeps them from deadlocking.
+# Needs PostgreSQL to run the workers in parallel, SQLite serializes the writers.
+class Command(BaseCommand):
+    help = 'Confirms and cancels orders from parallel workers and checks that no stock is oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--products', type=int, default=5, help='Products shared by all the orders')
+        parser.add_argument('--lines', type=int, default=3, help='Products per order')
+        parser.add_argument('--stock', type=int, default=1000, help='Initial quantity of every product')
+        parser.add_argument('--cancel-ratio', type=float, default=0.2, help='Share of confirmations cancelled')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username=STRESS_USERNAME).exists():
+            raise CommandError(
+                f"User '{STRESS_USERNAME}' is left from another run, delete it and run rebuild_order_stats."
+            )
+
+        rng = random.Random(options['seed'])
+        user, products, orders = self.seed(rng, options)
+        try:
+            self.stress(rng, products, orders, options)
+        finally:
+            self.remove(user, products)
+
+    def stress(self, rng, products, orders, options):
+        stock_before = {product.product_id: product.quantity for product in products}
+
+        tasks = queue.Queue()
+        for order in orders:
+            tasks.put(order)
+        counts = {'confirmed': 0, 'rejected': 0, 'cancelled': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def count(name):
+            with lock:
+                counts[name] += 1
+
+        def work(worker_rng):
+            try:
+                while True:
+                    try:
+                        order = tasks.get_nowait()
+                    except queue.Empty:
+                        return
+                    self.process(order, worker_rng, options['cancel_ratio'], count)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=work, args=(random.Random(rng.random()),)) for _ in range(options['workers'])
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        oversold = self.find_oversold(products, stock_before)
+        transitions = counts['confirmed'] + counts['rejected'] + counts['cancelled']
+        self.stdout.write(
+            f"{options['workers']} workers: {counts['confirmed']} confirmed, {counts['rejected']} out of stock, "
+            f"{counts['cancelled']} cancelled, {counts['errors']} errors in {elapsed:.2f}s "
+            f"({transitions / elapsed:.0f} transitions/s)"
+        )
+        if counts['errors'] or oversold:
+            raise CommandError(f"Stock mismatch for products {oversold}" if oversold else 'Some transitions failed')
+        self.stdout.write('No stock oversold')
+
+    def process(self, order, rng, cancel_ratio, count):
+        try:
+            order.status = 'confirmed'
+            try:
+                order.save()
+            except InsufficientStock:
+                count('rejected')
+                return
+            count('confirmed')
+
+            if rng.random() < cancel_ratio:
+                order.status = 'cancelled'
+                order.save()
+                count('cancelled')
+        except Exception as exc:
+            count('errors')
+            self.stderr.write(f"{order.order_id}: {exc!r}")
+
+    # Fresh Products and Pending Orders for Every Run, The Orders Are Counted in The Stats Like Any Other
+    @transaction.atomic
+    def seed(self, rng, options):
+        user = User.objects.create(username=STRESS_USERNAME)
+        products = Product.objects.bulk_create(
+            Product(name=f'stress product {number}', price='1.00', quantity=options['stock'])
+            for number in range(options['products'])
+        )
+        orders = Order.objects.bulk_create(
+            Order(user=user, status='pending', total_price=0) for _ in range(options['orders'])
+        )
+        add_created_orders(orders)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=rng.randint(1, 3), unit_price=product.price)
+            for order in orders
+            for product in rng.sample(products, min(options['lines'], len(products)))
+        )
+        # Loaded Back so Their Saves Detect The Status Change
+        return user, products, list(Order.objects.filter(order_id__in=[order.order_id for order in orders]))
+
+    # The Stress User, Its Orders and The Products Leave The Stats and The Database
+    def remove(self, user, products):
+        delete_orders(Order.objects.filter(user=user))
+        Product.objects.filter(product_id__in=[product.product_id for product in products]).delete()
+        user_id = user.id
+        user.delete()
+        delete_cache(OrderViewSet.KEY_PREFIX, user_id=user_id)
+
+    # Products Whose Stock Isn't The Initial Stock Minus The Lines of The Confirmed Orders
+    def find_oversold(self, products, stock_before):
+        reserved = {}
+        items = OrderItem.objects.filter(product__in=products, order__status='confirmed')
+        for product_id, quantity in items.values_list('product_id', 'quantity'):
+            reserved[product_id] = reserved.get(product_id, 0) + quantity
+
+        stock_after = dict(Product.objects.filter(product_id__in=stock_before).values_list('product_id', 'quantity'))
+        return [
+            str(product_id)
+            for product_id, quantity in stock_before.items()
+            if stock_after[product_id] != quantity - reserved.get(product_id, 0) or stock_after[product_id] < 0
+        ]
@@ -0,0 +1,342 @@
+import atexit
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('orders')
+
+# Upper Bounds of The Latency Histogram Buckets in Seconds, The Last Bucket Is +Inf
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKET_FIELDS = tuple(f'bucket_{bound}' for bound in LATENCY_BUCKETS) + ('bucket_inf',)
+METRIC_FIELDS = (
+    'total_calls', 'success', 'errors', 'duration_us', 'request_bytes', 'response_bytes', 'db_queries',
+) + BUCKET_FIELDS
+
+# Key of The Requests That Didn't Match Any Route, Keeps The Number of Keys Bounded
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def new_counters():
+    return dict.fromkeys(METRIC_FIELDS, 0)
+
+
+# Route Pattern of The Request, '/api/v1/orders/<pk>/' Instead of Every Order's Path
+def get_route(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None or resolver_match.route is None:
+        return UNMATCHED_ROUTE
+
+    route = re.sub(r'\(\?P<(\w+)>[^)]*\)', r'<\1>', resolver_match.route)
+    route = route.replace('/?', '').replace('^', '').replace('$', '').replace('\\', '')
+    return '/' + route
+
+
+# Counts The Queries Run Through The Connections It Wraps
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+# Base Class for The Metrics Backends
+# Counters are stored per (route, method) and summed up per route when read
+class BaseMetricsBackend:
+    def record(self, route, method, status_code, duration, request_bytes=0, response_bytes=0, db_queries=0):
+        raise NotImplementedError
+
+    # Raw Counters, {(route, method): {field: value}}
+    def get_counters(self):
+        raise NotImplementedError
+
+    def count(self, counters, status_code, duration, request_bytes, response_bytes, db_queries):
+        counters['total_calls'] += 1
+        if 200 <= status_code < 400:
+            counters['success'] += 1
+        else:
+            counters['errors'] += 1
+
+        counters['duration_us'] += int(duration * 1_000_000)
+        counters['request_bytes'] += request_bytes
+        counters['response_bytes'] += response_bytes
+        counters['db_queries'] += db_queries
+
+        for bound, field in zip(LATENCY_BUCKETS, BUCKET_FIELDS):
+            if duration <= bound:
+                counters[field] += 1
+                break
+        else:
+            counters['bucket_inf'] += 1
+
+    # Metrics per Route With The Details per Method
+    def get_metrics(self):
+        metrics = {}
+        for (route, method), counters in sorted(self.get_counters().items()):
+            route_metrics = metrics.setdefault(route, {'total_calls': 0, 'success': 0, 'errors': 0, 'methods': {}})
+            for field in ('total_calls', 'success', 'errors'):
+                route_metrics[field] += counters[field]
+            route_metrics['methods'][method] = summarize(counters)
+        return metrics
+
+
+# Counters Kept in The Process, Every Worker Reports Only Its Own Requests
+class LocalMetricsBackend(BaseMetricsBackend):
+    def __init__(self, **options):
+        self.metrics = defaultdict(new_counters)
+        self.lock = threading.Lock()
+
+    def record(self, route, method, status_code, duration, request_bytes=0, response_bytes=0, db_queries=0):
+        with self.lock:
+            self.count(
+                self.metrics[(route, method)], status_code, duration, request_bytes, response_bytes, db_queries,
+            )
+
+    def get_counters(self):
+        with self.lock:
+            return {key: dict(counters) for key, counters in self.metrics.items()}
+
+
+# Counters of One Thread, Its Lock Is Only Contended While The Flusher Takes Them
+class MetricsBuffer:
+    def __init__(self):
+        self.counters = defaultdict(new_counters)
+        self.lock = threading.Lock()
+        self.thread = threading.current_thread()
+        self.flushed_at = time.monotonic()
+
+    # Takes The Counters Out, The Thread Goes on Counting in New Ones
+    def take(self):
+        with self.lock:
+            counters, self.counters = self.counters, defaultdict(new_counters)
+            self.flushed_at = time.monotonic()
+        return counters
+
+    # Puts Back Counters That Couldn't Be Written
+    def put_back(self, counters):
+        with self.lock:
+            for key, values in counters.items():
+                for field, value in values.items():
+                    self.counters[key][field] += value
+
+
+# Counters Shared by All The Workers in Redis Hashes
+#
+# Requests are counted in a per-thread buffer, every thread adds its buffer to the hashes with
+# one pipelined HINCRBY batch once 'flush_interval' seconds have passed. A background flusher
+# thread does the same for the threads that stay idle, and the buffers left are flushed when
+# the process exits ('atexit', gunicorn's 'worker_exit'), e.g. a worker recycled by 'max_requests'.
+class RedisMetricsBackend(BaseMetricsBackend):
+    def __init__(self, key_prefix='metrics', flush_interval=1.0, stop_timeout=5, **options):
+        self.key_prefix = key_prefix
+        self.flush_interval = flush_interval
+        self.stop_timeout = stop_timeout
+        self.local = threading.local()
+        self.buffers = []
+        self.lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+        self.stopping = threading.Event()
+
+    @property
+    def endpoints_key(self):
+        return f"{self.key_prefix}:endpoints"
+
+    def get_endpoint_key(self, endpoint):
+        return f"{self.key_prefix}:endpoint:{endpoint}"
+
+    # The Flusher Is Started Lazily, and Again in a Forked Worker Process
+    def start(self):
+        if self.pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # Buffers Copied From The Parent Process Are Its Own to Flush
+            self.local = threading.local()
+            self.buffers = []
+            self.stopping = threading.Event()
+            self.thread = threading.Thread(target=self.run, name='metrics-flusher', daemon=True)
+            self.thread.start()
+            self.pid = os.getpid()
+            atexit.register(self.stop)
+
+    def get_buffer(self):
+        self.start()
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            buffer = self.local.buffer = MetricsBuffer()
+            with self.lock:
+                self.buffers.append(buffer)
+        return buffer
+
+    def record(self, route, method, status_code, duration, request_bytes=0, response_bytes=0, db_queries=0):
+        buffer = self.get_buffer()
+        with buffer.lock:
+            self.count(
+                buffer.counters[(route, method)], status_code, duration, request_bytes, response_bytes, db_queries,
+            )
+        if time.monotonic() - buffer.flushed_at >= self.flush_interval:
+            self.flush_buffer(buffer)
+
+    def run(self):
+        while not self.stopping.wait(max(self.flush_interval, 0.1)):
+            self.flush()
+
+    # Adding The Buffers of All The Threads of The Process to The Shared Counters
+    # Buffers of finished threads are dropped once they are empty
+    def flush(self):
+        with self.lock:
+            buffers = list(self.buffers)
+        for buffer in buffers:
+            self.flush_buffer(buffer)
+        with self.lock:
+            self.buffers = [buffer for buffer in self.buffers if buffer.thread.is_alive() or buffer.counters]
+
+    def flush_buffer(self, buffer):
+        counters = buffer.take()
+        if not counters:
+            return
+
+        try:
+            pipeline = cache.client.get_client().pipeline(transaction=False)
+            for (route, method), values in counters.items():
+                endpoint = f"{method} {route}"
+                pipeline.sadd(self.endpoints_key, endpoint)
+                for field, value in values.items():
+                    if value:
+                        pipeline.hincrby(self.get_endpoint_key(endpoint), field, value)
+            pipeline.execute()
+        except Exception:
+            # Metrics Must Not Break Requests, The Counters Are Kept for The Next Flush
+            logger.exception('Failed to flush metrics')
+            buffer.put_back(counters)
+
+    # Stops The Flusher and Flushes What Is Left
+    def stop(self):
+        if self.pid != os.getpid() or self.thread is None:
+            return
+
+        thread, self.thread = self.thread, None
+        self.stopping.set()
+        thread.join(self.stop_timeout)
+        self.flush()
+
+    # Counters of All The Workers, The Other Workers' Counts Are at Most 'flush_interval' Seconds Old
+    def get_counters(self):
+        self.flush()
+
+        redis_client = cache.client.get_client()
+        endpoints = [endpoint.decode() for endpoint in redis_client.smembers(self.endpoints_key)]
+        pipeline = redis_client.pipeline(transaction=False)
+        for endpoint in endpoints:
+            pipeline.hgetall(self.get_endpoint_key(endpoint))
+
+        counters = {}
+        for endpoint, values in zip(endpoints, pipeline.execute()):
+            method, route = endpoint.split(' ', 1)
+            counters[(route, method)] = new_counters()
+            counters[(route, method)].update({field.decode(): int(value) for field, value in values.items()})
+        return counters
+
+
+# Quantile Estimated From The Histogram, Interpolated Inside The Bucket Like Prometheus Does
+def get_quantile(counters, quantile):
+    total = counters['total_calls']
+    if not total:
+        return None
+
+    rank = quantile * total
+    seen = 0
+    lower = 0
+    for bound, field in zip(LATENCY_BUCKETS + (None,), BUCKET_FIELDS):
+        count = counters[field]
+        if count and seen + count >= rank:
+            if bound is None:
+                return lower
+            return lower + (bound - lower) * (rank - seen) / count
+        seen += count
+        lower = bound if bound is not None else lower
+    return lower
+
+
+def summarize(counters):
+    total = counters['total_calls']
+    buckets = {}
+    cumulative = 0
+    for bound, field in zip(LATENCY_BUCKETS + ('+Inf',), BUCKET_FIELDS):
+        cumulative += counters[field]
+        buckets[str(bound)] = cumulative
+
+    return {
+        'total_calls': total,
+        'success': counters['success'],
+        'errors': counters['errors'],
+        'latency_seconds': {
+            'p50': get_quantile(counters, 0.50),
+            'p95': get_quantile(counters, 0.95),
+            'p99': get_quantile(counters, 0.99),
+            'sum': counters['duration_us'] / 1_000_000,
+            'buckets': buckets,
+        },
+        'request_bytes': counters['request_bytes'],
+        'response_bytes': counters['response_bytes'],
+        'db_queries': counters['db_queries'],
+    }
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Counters in The Prometheus Text Exposition Format
+def format_prometheus(counters):
+    lines = [
+        '# HELP http_requests_total Requests by route, method and outcome.',
+        '# TYPE http_requests_total counter',
+    ]
+    series = sorted(counters.items())
+    for (route, method), values in series:
+        labels = f'route="{escape_label(route)}",method="{method}"'
+        lines.append(f'http_requests_total{{{labels},outcome="success"}} {values["success"]}')
+        lines.append(f'http_requests_total{{{labels},outcome="error"}} {values["errors"]}')
+
+    lines += [
+        '# HELP http_request_duration_seconds Request latency by route and method.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (route, method), values in series:
+        labels = f'route="{escape_label(route)}",method="{method}"'
+        cumulative = 0
+        for bound, field in zip(LATENCY_BUCKETS + ('+Inf',), BUCKET_FIELDS):
+            cumulative += values[field]
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'http_request_duration_seconds_sum{{{labels}}} {values["duration_us"] / 1_000_000}')
+        lines.append(f'http_request_duration_seconds_count{{{labels}}} {values["total_calls"]}')
+
+    for name, field, help_text in (
+        ('http_request_bytes_total', 'request_bytes', 'Request body bytes by route and method.'),
+        ('http_response_bytes_total', 'response_bytes', 'Response body bytes by route and method.'),
+        ('db_queries_total', 'db_queries', 'Database queries by route and method.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for (route, method), values in series:
+            lines.append(f'{name}{{route="{escape_label(route)}",method="{method}"}} {values[field]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+# Backend Configured by The METRICS_BACKEND Setting, One per Process
+@lru_cache(maxsize=None)
+def get_metrics_backend():
+    backend_class = import_string(getattr(settings, 'METRICS_BACKEND', 'orders.metrics.LocalMetricsBackend'))
+    return backend_class(**getattr(settings, 'METRICS_BACKEND_OPTIONS', {}))
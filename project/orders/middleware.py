@@ -1,31 +1,161 @@
-from collections import defaultdict
-from threading import Lock
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.auth import SESSION_KEY
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from .metrics import QueryCounter, get_metrics_backend, get_route
+from .routers import apin_to_primary, has_replica, pin_to_primary, read_from_primary, route_user_reads
+
+# Query Counter of The Current Async Request, Copied to The Threads Running Its ORM Calls
+async_query_counter = ContextVar('async_query_counter', default=None)
+
+
+# Async Requests Run Their Queries on The Connections of Other Threads,
+# Every Connection Counts Into The Counter of The Request That Uses It
+def count_async_query(execute, sql, params, many, context):
+    queries = async_query_counter.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+# Inserted First, 'connection.execute_wrapper' Pops The Last Wrapper When It Exits
+@receiver(connection_created)
+def add_async_query_counter(sender, connection, **kwargs):
+    if count_async_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_async_query)
 
 
 # Class for Processing Metrics
 class MetricsMiddleware:
-    metrics = defaultdict(lambda: {"total_calls": 0, "success": 0, "errors": 0})
-    lock = Lock()
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        self.backend = get_metrics_backend()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
-        endpoint = request.path
-        status_code = response.status_code
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
 
-        # Writing Metrics
-        with self.lock:
-            self.metrics[endpoint]["total_calls"] += 1
-            if 200 <= status_code < 400:
-                self.metrics[endpoint]["success"] += 1
-            else:
-                self.metrics[endpoint]["errors"] += 1
+        queries = QueryCounter()
+        started = time.perf_counter()
 
+        # Queries of The Request Are Counted on Every Database Connection
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+
+        self.record(request, response, time.perf_counter() - started, queries)
         return response
 
+    # Same Metrics for a Request Served by an Async View Under ASGI
+    async def __acall__(self, request):
+        queries = QueryCounter()
+        token = async_query_counter.set(queries)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            async_query_counter.reset(token)
+
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    def record(self, request, response, duration, queries):
+        # Streamed Bodies Aren't Measured, Their Size Is Unknown Here
+        response_bytes = 0 if response.streaming else len(response.content)
+        try:
+            request_bytes = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            request_bytes = 0
+
+        # Writing Metrics
+        self.backend.record(
+            get_route(request),
+            request.method,
+            response.status_code,
+            duration,
+            request_bytes=request_bytes,
+            response_bytes=response_bytes,
+            db_queries=queries.count,
+        )
+
     @classmethod
     def get_metrics(cls):
-        with cls.lock:
-            return dict(cls.metrics)
+        return get_metrics_backend().get_metrics()
+
+
+# Routes The Reads of a Request, Placed After AuthenticationMiddleware
+#
+# Safe requests read from the replica, unless their user wrote lately: a user whose write
+# succeeded is pinned to the primary for REPLICA_PIN_SECONDS. Session users are known here,
+# token users once the API has authenticated them (CachedJWTAuthentication).
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not has_replica():
+            return self.get_response(request)
+
+        token = read_from_primary.set(request.method not in self.safe_methods)
+        try:
+            user_id = self.get_session_user_id(request)
+            if user_id is not None:
+                route_user_reads(user_id)
+            response = self.get_response(request)
+        finally:
+            read_from_primary.reset(token)
+
+        user_id = self.get_writer_id(request, response)
+        if user_id is not None:
+            pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        if not has_replica():
+            return await self.get_response(request)
+
+        token = read_from_primary.set(request.method not in self.safe_methods)
+        try:
+            user_id = await sync_to_async(self.get_session_user_id)(request)
+            if user_id is not None:
+                await sync_to_async(route_user_reads)(user_id)
+            response = await self.get_response(request)
+        finally:
+            read_from_primary.reset(token)
+
+        # Django's Lazy Session User Is Loaded in a Thread
+        user_id = await sync_to_async(self.get_writer_id)(request, response)
+        if user_id is not None:
+            await apin_to_primary(user_id)
+        return response
+
+    # Reading The Session Row Goes to The Primary
+    def get_session_user_id(self, request):
+        return request.session.get(SESSION_KEY) if hasattr(request, 'session') else None
+
+    # The User Whose Write Succeeded, Set on The Request by The Session or by The API's Authentication
+    def get_writer_id(self, request, response):
+        if request.method in self.safe_methods or response.status_code >= 400:
+            return None
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        return user.pk
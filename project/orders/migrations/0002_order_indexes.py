@@ -0,0 +1,42 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:30
+
+from django.conf import settings
+from django.db import migrations, models
+from orders.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+# The Orders Table Takes Writes While The Indexes Are Built
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('orders', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['created_at', 'order_id'], name='order_created_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['total_price', 'order_id'], name='order_price_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['status', 'total_price', 'order_id'], name='order_status_price_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', 'created_at', 'order_id'], name='order_user_created_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', 'total_price', 'order_id'], name='order_user_price_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', 'status', 'total_price', 'order_id'], name='order_user_status_price_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+
+BATCH_SIZE = 2000
+
+
+# Every Product Link Becomes a Line of One Unit at The Product's Current Price
+def copy_product_links(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    db_alias = schema_editor.connection.alias
+    links = Order.products.through.objects.using(db_alias).order_by('id').values_list('order_id', 'product_id', 'product__price')
+
+    items = []
+    for order_id, product_id, price in links.iterator(chunk_size=BATCH_SIZE):
+        items.append(OrderItem(order_id=order_id, product_id=product_id, quantity=1, unit_price=price))
+        if len(items) == BATCH_SIZE:
+            OrderItem.objects.using(db_alias).bulk_create(items)
+            items = []
+    OrderItem.objects.using(db_alias).bulk_create(items)
+
+    # Totals of The Orders With Lines, Orders Without Products Keep Their Stored Total
+    lines = OrderItem.objects.using(db_alias).filter(order_id=OuterRef('pk')).order_by().values('order_id')
+    Order.objects.using(db_alias).filter(Exists(lines)).update(
+        total_price=Subquery(lines.annotate(total=Sum(F('unit_price') * F('quantity'))).values('total')),
+        items_count=Subquery(lines.annotate(count=Sum('quantity')).values('count')),
+    )
+
+
+def copy_items_to_links(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    through_model = Order.products.through
+    db_alias = schema_editor.connection.alias
+    items = OrderItem.objects.using(db_alias).order_by('id').values_list('order_id', 'product_id')
+
+    links = []
+    for order_id, product_id in items.iterator(chunk_size=BATCH_SIZE):
+        links.append(through_model(order_id=order_id, product_id=product_id))
+        if len(links) == BATCH_SIZE:
+            through_model.objects.using(db_alias).bulk_create(links)
+            links = []
+    through_model.objects.using(db_alias).bulk_create(links)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='order_items', to='orders.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'product'), name='order_item_product_unique')],
+            },
+        ),
+        migrations.RunPython(copy_product_links, copy_items_to_links),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+# The Old M2M Table Is Dropped in Its Own Migration (and Transaction) After The Lines Are Copied,
+# 'Order.products' Then Reads The Products Through The Lines
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_items'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='order',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='products',
+            field=models.ManyToManyField(through='orders.OrderItem', to='orders.product'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:30
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+BATCH_SIZE = 2000
+
+
+# Totals of The Existing Orders, as 'manage.py rebuild_order_stats' Computes Them
+def build_stats(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderStats = apps.get_model('orders', 'OrderStats')
+    db_alias = schema_editor.connection.alias
+    totals = (
+        Order.objects.using(db_alias).filter(is_deleted=False).order_by().values('user_id', 'status')
+        .annotate(orders=Count('order_id'), total=Sum('total_price'), items=Sum('items_count'))
+    )
+
+    rows = {}
+    for row in totals.iterator(chunk_size=BATCH_SIZE):
+        for scope in (f"user:{row['user_id']}", 'all'):
+            stats = rows.setdefault((scope, row['status']), OrderStats(scope=scope, status=row['status'], slot=0))
+            stats.orders += row['orders']
+            stats.total_price += row['total']
+            stats.items_count += row['items']
+    OrderStats.objects.using(db_alias).bulk_create(rows.values(), batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=32)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled')], max_length=10)),
+                ('slot', models.PositiveSmallIntegerField(default=0)),
+                ('orders', models.BigIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('items_count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'status', 'slot'), name='order_stats_unique')],
+            },
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
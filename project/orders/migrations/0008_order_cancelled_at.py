@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:57
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# The Cancellation Time of The Orders Already Cancelled Is Unknown, They Are Kept a Full Period From Now
+def set_cancelled_at(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    db_alias = schema_editor.connection.alias
+    Order.objects.using(db_alias).filter(status='cancelled', cancelled_at__isnull=True).update(cancelled_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='cancelled_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='cancelled_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(set_cancelled_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:05
+
+from django.db import migrations, models
+from orders.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+# The Orders Table Takes Writes While The Index Is Built
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('orders', '0008_order_cancelled_at'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', True), ('status', 'cancelled'), _connector='OR'), fields=['order_id'], name='order_archivable_idx'),
+        ),
+    ]
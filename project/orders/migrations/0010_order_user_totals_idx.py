@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 14:20
+
+from django.db import migrations, models
+from orders.migration_operations import AddIndexConcurrentlyIfSupported
+
+
+# The Orders Table Takes Writes While The Index Is Built, Outside of The Transaction Copying The Lines (0004)
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('orders', '0009_order_archivable_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', 'status'], include=('total_price', 'items_count'), name='order_user_totals_idx'),
+        ),
+    ]
@@ -1,7 +1,61 @@
 import uuid
+from contextlib import nullcontext
 from django.contrib.auth.models import User
-from django.db import models
-from .utils import send_order_status_change_event
+from django.db import connections, models, router, transaction
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+from .stats import STATS_FIELDS, add_order_change, apply_stats, get_order_values
+from .stock import RESERVED_STATUS, get_order_lines, get_reserved, move_orders_stock, move_stock
+from .utils import send_order_status_change_event, send_order_status_change_events
+
+# Final Status of an Order, The Time It Is Set Is Kept in 'cancelled_at'
+CANCELLED_STATUS = 'cancelled'
+
+
+# Remembers The Values Loaded From The Database, So Changes Are Detected Without Queries
+class DirtyFieldsMixin:
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_values(fields)
+
+    def get_loaded_value(self, attname):
+        return getattr(self, '_loaded_values', {}).get(attname)
+
+    # Names of The Fields Changed Since Loading, None if Nothing Was Loaded
+    def get_dirty_fields(self):
+        loaded_values = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded_values is None:
+            return None
+
+        deferred_fields = self.get_deferred_fields()
+        return [
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.attname not in deferred_fields
+            and (
+                field.attname not in loaded_values
+                or loaded_values[field.attname] != getattr(self, field.attname)
+            )
+        ]
+
+    def _remember_values(self, fields=None):
+        loaded_values = getattr(self, '_loaded_values', {})
+        deferred_fields = self.get_deferred_fields()
+        for field in self._meta.concrete_fields:
+            # Django Passes Attnames ('user_id') When Loading Deferred Fields, Callers May Pass Either Name
+            if field.attname in deferred_fields or (
+                fields is not None and field.name not in fields and field.attname not in fields
+            ):
+                continue
+            loaded_values[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded_values
 
 
 # Model of The Product
@@ -15,40 +69,336 @@ class Product(models.Model):
         return self.name
 
 
+# Queries Over The Orders Table
+class OrderQuerySet(models.QuerySet):
+    # Per-User Order Count, Revenue of The Confirmed Orders and Order Sizes in One GROUP BY,
+    # Answered From 'order_user_totals_idx' Without Reading The Lines
+    def user_totals(self):
+        return (
+            self.filter(is_deleted=False)
+            .order_by('user_id')
+            .values('user_id')
+            .annotate(
+                orders=Count('order_id'),
+                revenue=Sum('total_price', filter=Q(status='confirmed'), default=0),
+                items=Sum('items_count'),
+                average_items=Avg('items_count'),
+            )
+        )
+
+    # Moves The Orders to 'status' in Batches, One Conditional UPDATE ... RETURNING per Batch and Source Status
+    #
+    # Only the transitions of Order.ALLOWED_TRANSITIONS are applied, orders in other statuses are left alone.
+    # Every batch is a transaction: the rows are changed, their stock is moved (orders short of stock get
+    # their old status back), one outbox event per changed order is written and the stats are moved. Returns the changed
+    # orders as (order_id, user_id, old_status) and the IDs of the orders left unchanged for lack of stock.
+    def transition(self, status, batch_size=1000):
+        using = router.db_for_write(self.model)
+        changed = []
+        out_of_stock = []
+        for old_status in self.model.get_source_statuses(status):
+            after_id = None
+            while True:
+                with transaction.atomic(using=using):
+                    rows = self.update_status_batch(using, old_status, status, after_id, batch_size)
+                    if not rows:
+                        break
+                    after_id = max(order_id for order_id, *_ in rows)
+
+                    rejected = set()
+                    if RESERVED_STATUS in (old_status, status):
+                        lines = get_order_lines([order_id for order_id, *_ in rows])
+                        moves = []
+                        for order_id, *_ in rows:
+                            order_lines = lines.get(order_id, {})
+                            moves.append((order_id, get_reserved(old_status, order_lines), get_reserved(status, order_lines)))
+                        rejected = move_orders_stock(moves)
+                        if rejected:
+                            self.model.objects.using(using).filter(order_id__in=rejected).update(status=old_status)
+
+                    rows = [row for row in rows if row[0] not in rejected]
+                    send_order_status_change_events((order_id, old_status, status) for order_id, *_ in rows)
+
+                    stats_deltas = {}
+                    for _, user_id, is_deleted, total_price, items_count in rows:
+                        values = {
+                            'user_id': user_id, 'status': old_status, 'is_deleted': is_deleted,
+                            'total_price': total_price, 'items_count': items_count,
+                        }
+                        add_order_change(stats_deltas, values, {**values, 'status': status})
+                    apply_stats(stats_deltas)
+
+                changed += [(order_id, user_id, old_status) for order_id, user_id, *_ in rows]
+                out_of_stock += sorted(rejected)
+        return changed, out_of_stock
+
+    # Changes The Status of The Next Batch of Orders (by order_id) Still in 'old_status'
+    # Returns their IDs, users and the values counted in the stats, (order_id, user_id, is_deleted, total_price, items_count)
+    def update_status_batch(self, using, old_status, status, after_id, batch_size):
+        batch = self.filter(status=old_status)
+        if after_id is not None:
+            batch = batch.filter(order_id__gt=after_id)
+        sql, params = batch.order_by('order_id').values('order_id')[:batch_size].query.sql_with_params()
+
+        connection = connections[using]
+        quote_name = connection.ops.quote_name
+        fields = [self.model._meta.get_field(name) for name in ('order_id', 'user', 'is_deleted', 'total_price', 'items_count')]
+        assignments, values = [f"{quote_name('status')} = %s"], [status]
+        if status == CANCELLED_STATUS:
+            cancelled_at = self.model._meta.get_field('cancelled_at')
+            assignments.append(f"{quote_name(cancelled_at.column)} = %s")
+            values.append(cancelled_at.get_db_prep_save(timezone.now(), connection))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {quote_name(self.model._meta.db_table)} SET {', '.join(assignments)} "
+                f"WHERE {quote_name(fields[0].column)} IN ({sql}) AND {quote_name('status')} = %s "
+                f"RETURNING {', '.join(quote_name(field.column) for field in fields)}",
+                [*values, *params, old_status],
+            )
+            return [
+                tuple(field.to_python(value) for field, value in zip(fields, row))
+                for row in cursor.fetchall()
+            ]
+
+
 # Model of The Order
-class Order(models.Model):
+class Order(DirtyFieldsMixin, models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('confirmed', 'Confirmed'),
         ('cancelled', 'Cancelled'),
     ]
 
+    # Statuses an Order Can Move To, a Cancelled Order Is Final
+    ALLOWED_TRANSITIONS = {
+        'pending': ('confirmed', 'cancelled'),
+        'confirmed': ('cancelled',),
+        'cancelled': (),
+    }
+
     order_id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # Totals of The Lines, Computed on The Server When The Lines Are Written
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
-    products = models.ManyToManyField(Product)
+    items_count = models.PositiveIntegerField(default=0)
+    products = models.ManyToManyField(Product, through='OrderItem')
     is_deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Cancelled Orders Are Archived ARCHIVE_CANCELLED_AFTER_DAYS After The Cancellation
+    cancelled_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    # Indexes for The Filters and Orderings of OrderViewSet, Deleted Orders Are Never Listed
+    # so All of Them Are Partial. Every Index Ends With The Keyset of The Pagination
+    class Meta:
+        indexes = [
+            # Admins
+            models.Index(
+                fields=['created_at', 'order_id'], condition=models.Q(is_deleted=False), name='order_created_idx',
+            ),
+            models.Index(
+                fields=['total_price', 'order_id'], condition=models.Q(is_deleted=False), name='order_price_idx',
+            ),
+            models.Index(
+                fields=['status', 'total_price', 'order_id'], condition=models.Q(is_deleted=False),
+                name='order_status_price_idx',
+            ),
+            # Users
+            models.Index(
+                fields=['user', 'created_at', 'order_id'], condition=models.Q(is_deleted=False),
+                name='order_user_created_idx',
+            ),
+            models.Index(
+                fields=['user', 'total_price', 'order_id'], condition=models.Q(is_deleted=False),
+                name='order_user_price_idx',
+            ),
+            models.Index(
+                fields=['user', 'status', 'total_price', 'order_id'], condition=models.Q(is_deleted=False),
+                name='order_user_status_price_idx',
+            ),
+            # Per-User Aggregates (Postgres Reads The Totals From The Index Only)
+            models.Index(
+                fields=['user', 'status'], include=['total_price', 'items_count'], condition=models.Q(is_deleted=False),
+                name='order_user_totals_idx',
+            ),
+            # Orders Waiting for The Archive ('manage.py archive_orders'), Taken in order_id Order
+            models.Index(
+                fields=['order_id'], condition=models.Q(is_deleted=True) | models.Q(status='cancelled'),
+                name='order_archivable_idx',
+            ),
+        ]
+
+    @classmethod
+    def can_change_status(cls, old_status, new_status):
+        return old_status == new_status or new_status in cls.ALLOWED_TRANSITIONS.get(old_status, ())
+
+    @classmethod
+    def get_source_statuses(cls, status):
+        return [old_status for old_status, new_statuses in cls.ALLOWED_TRANSITIONS.items() if status in new_statuses]
 
     def save(self, *args, **kwargs):
-        if not self.order_id:
+        # The Status Loaded With The Order, No Query Needed to Detect a Change
+        old_status = None if self._state.adding else self.get_loaded_value('status')
+
+        # Writing Only The Changed Columns of an Existing Order
+        dirty_fields = self.get_dirty_fields()
+        if dirty_fields is not None and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = dirty_fields
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'status' not in update_fields:
             old_status = None
-        else:
-            try:
-                old_status = Order.objects.get(order_id=self.order_id).status
-            except Order.DoesNotExist:
-                old_status = None
-
-        # Сохраняем объект заказа
-        super().save(*args, **kwargs)
-
-        # Если старый статус существует и отличается от нового, выбрасываем событие
-        if old_status and old_status != self.status:
-            send_order_status_change_event(
-                order_id=self.order_id,
-                old_status=old_status,
-                new_status=self.status
-            )
+        status_changed = bool(old_status) and old_status != self.status
+        if self.status == CANCELLED_STATUS and (status_changed or (self._state.adding and self.cancelled_at is None)):
+            self.cancelled_at = timezone.now()
+            if update_fields is not None and 'cancelled_at' not in update_fields:
+                update_fields = kwargs['update_fields'] = [*update_fields, 'cancelled_at']
+        stats_deltas = self.get_stats_deltas(update_fields)
+
+        # Событие об изменении статуса пишется в outbox в той же транзакции, что и заказ
+        with transaction.atomic(savepoint=False) if status_changed or stats_deltas else nullcontext():
+            # Confirming Takes The Lines From Stock, Leaving 'confirmed' Gives Them Back (InsufficientStock if Short)
+            if status_changed and RESERVED_STATUS in (old_status, self.status):
+                lines = get_order_lines([self.order_id]).get(self.order_id, {})
+                move_stock(get_reserved(old_status, lines), get_reserved(self.status, lines))
+
+            # Сохраняем объект заказа
+            super().save(*args, **kwargs)
+            apply_stats(stats_deltas)
+
+            if status_changed:
+                send_order_status_change_event(
+                    order_id=self.order_id,
+                    old_status=old_status,
+                    new_status=self.status
+                )
+
+        self._remember_values(update_fields)
+
+    # Change of The Order's Stats Made by This Save, From The Loaded Values to The Written Ones
+    # Orders saved without being loaded first aren't counted, the bulk writes
+    # ('bulk_write_orders', 'link_products', 'transition') apply their own deltas
+    def get_stats_deltas(self, update_fields=None):
+        deltas = {}
+        if self._state.adding:
+            add_order_change(deltas, None, get_order_values(self))
+            return deltas
+
+        loaded_values = getattr(self, '_loaded_values', {})
+        if any(field not in loaded_values for field in STATS_FIELDS):
+            return deltas
+
+        old = {field: loaded_values[field] for field in STATS_FIELDS}
+        new = {
+            field: getattr(self, field)
+            if update_fields is None or self._meta.get_field(field).name in update_fields else old[field]
+            for field in STATS_FIELDS
+        }
+        add_order_change(deltas, old, new)
+        return deltas
 
     def __str__(self):
         return f"Order {self.order_id} by {self.user.username}"
+
+
+# Line of an Order, The Product's Price Is Kept as It Was When The Line Was Written
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='order_items')
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            # One Line per Product, Also The Index of The Order's Lines
+            models.UniqueConstraint(fields=['order', 'product'], name='order_item_product_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} in {self.order_id}"
+
+
+# Orders Moved Out of The Orders Table ('manage.py archive_orders'), Soft-Deleted and Long-Cancelled Ones
+#
+# Same columns as Order, the hot table only keeps the orders the API still lists. Archived orders
+# are never changed, so the status machine, the stock and the outbox don't apply to them.
+class ArchivedOrder(models.Model):
+    order_id = models.UUIDField(primary_key=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    items_count = models.PositiveIntegerField(default=0)
+    is_deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(editable=False)
+    cancelled_at = models.DateTimeField(null=True, blank=True, editable=False)
+    archived_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    # Keyset of The Archive's Pagination, for All The Orders and per User
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'order_id'], name='archived_created_idx'),
+            models.Index(fields=['user', 'created_at', 'order_id'], name='archived_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.order_id} by {self.user.username}"
+
+
+# Line of an Archived Order
+class ArchivedOrderItem(models.Model):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='archived_order_items')
+    quantity = models.PositiveIntegerField(default=1)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='archived_order_item_product_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} in {self.order_id}"
+
+
+# Running Totals of The Orders Not Deleted per Scope and Status, Kept by orders.stats
+#
+# A user's totals are under 'user:<id>', everybody's under 'all' and spread over STATS_SLOTS rows
+# per status, so concurrent writers rarely wait on the same row. Every order write adds its change
+# inside the transaction that writes the order (Order.save's 'atomic(savepoint=False)' block, the one
+# of the bulk writes), 'manage.py rebuild_order_stats' recomputes them from the orders.
+class OrderStats(models.Model):
+    scope = models.CharField(max_length=32)
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    slot = models.PositiveSmallIntegerField(default=0)
+    orders = models.BigIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    items_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Target of The Stats' Upsert, Also The Index of The Reads by Scope
+            models.UniqueConstraint(fields=['scope', 'status', 'slot'], name='order_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.status} #{self.slot}"
+
+
+# Transactional Outbox, Events Are Written in The Same Transaction as The Change
+# and Delivered Later by The Relay ('manage.py relay_outbox')
+class OutboxEvent(models.Model):
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The Relay Only Reads The Undelivered Events
+            models.Index(fields=['id'], condition=models.Q(delivered_at__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id}"
@@ -0,0 +1,72 @@
+import json
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .events import Event, LoggerSink
+from .models import OutboxEvent
+from .utils import ORDER_STATUS_CHANGED, event_logger, format_order_status_change_event
+
+
+# Delivers The Events to The 'event_stub' Log (orders/events.log)
+class EventLogSink:
+    def write(self, outbox_events):
+        LoggerSink().write([
+            Event(event_logger.name, self.format(outbox_event), outbox_event.created_at.timestamp())
+            for outbox_event in outbox_events
+        ])
+
+    def format(self, outbox_event):
+        if outbox_event.topic == ORDER_STATUS_CHANGED:
+            return format_order_status_change_event(outbox_event.payload)
+        return f"{outbox_event.topic}: {json.dumps(outbox_event.payload)}"
+
+
+# Local Stand-In for a Message Broker, The Events Are Appended to a Redis Stream
+class RedisStreamSink:
+    stream = 'order-events'
+
+    def write(self, outbox_events):
+        pipeline = cache.client.get_client().pipeline(transaction=False)
+        for outbox_event in outbox_events:
+            pipeline.xadd(self.stream, {
+                'id': outbox_event.id,
+                'topic': outbox_event.topic,
+                'payload': json.dumps(outbox_event.payload),
+                'created_at': outbox_event.created_at.isoformat(),
+            })
+        pipeline.execute()
+
+
+# Sink Configured by The OUTBOX_RELAY_SINK Setting
+@lru_cache(maxsize=None)
+def get_relay_sink():
+    return import_string(getattr(settings, 'OUTBOX_RELAY_SINK', 'orders.outbox.EventLogSink'))()
+
+
+# Claims and Delivers One Batch of The Outbox
+#
+# Rows are claimed with 'SELECT ... FOR UPDATE SKIP LOCKED', so parallel relays never take the same
+# event, and are marked as delivered in the same transaction once the sink has accepted them.
+# A crash or a sink error rolls the claim back and the batch is delivered again (at least once).
+def relay_outbox_batch(sink=None, batch_size=100):
+    sink = sink or get_relay_sink()
+
+    with transaction.atomic():
+        outbox_events = list(
+            OutboxEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(delivered_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not outbox_events:
+            return 0
+
+        sink.write(outbox_events)
+        OutboxEvent.objects.filter(id__in=[outbox_event.id for outbox_event in outbox_events]).update(
+            delivered_at=timezone.now()
+        )
+
+    return len(outbox_events)
@@ -0,0 +1,165 @@
+import base64
+import json
+from collections import OrderedDict
+from types import SimpleNamespace
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# Keyset (Cursor) Pagination for The Orders
+# Every page is fetched with 'WHERE (sort key, order_id) > (last seen values) LIMIT n',
+# so the cost of a page doesn't depend on how deep it is (unlike OFFSET)
+class OrderCursorPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    # Default Ordering, Newest Orders First
+    ordering = ('-created_at',)
+
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request, view)))
+
+    # Same Page Fetched With The Async ORM
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request, view)])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = self.get_ordering(request, queryset, view)
+        self.model = queryset.model
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor['reverse']
+
+        # Walking Backwards Means Reading The Reversed Ordering and Flipping The Page
+        ordering = [_invert(field) for field in self.fields] if self.reverse else self.fields
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_position_filter(ordering, self.cursor['position']))
+
+        # Fetching One Extra Row to Know if There Is One More Page
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    # Ordering Requested Through The OrderingFilter, Closed by The Primary Key
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+
+        fields = list(ordering or self.ordering)
+        pk_name = queryset.model._meta.pk.name
+        if not any(field.lstrip('-') in (pk_name, 'pk') for field in fields):
+            # Ties Are Broken in The Same Direction as The Last Sort Key
+            fields.append('-' + pk_name if fields[-1].startswith('-') else pk_name)
+        return fields
+
+    # Builds '(a > x) OR (a = x AND b > y) ...' for The Given Position
+    def get_position_filter(self, ordering, position):
+        position_filter = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            position_filter |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return position_filter
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        # Rows Are Model Instances or '.values()' Dicts
+        if isinstance(row, dict):
+            row = SimpleNamespace(**row)
+        position = [self._get_field(field).value_to_string(row) for field in self.fields]
+        payload = {'o': self.fields, 'p': position, 'r': int(reverse)}
+        token = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode())
+        return replace_query_param(self.base_url, self.cursor_query_param, token.decode())
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            # Cursor Is Only Valid for The Ordering It Was Issued For
+            if payload['o'] != self.fields or len(payload['p']) != len(self.fields):
+                raise ValueError
+            position = [
+                self._get_field(field).to_python(value)
+                for field, value in zip(self.fields, payload['p'])
+            ]
+            return {'position': position, 'reverse': bool(payload['r'])}
+        except (TypeError, ValueError, KeyError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _get_field(self, field):
+        return self.model._meta.get_field(field.lstrip('-'))
+
+
+def _invert(field):
+    return field[1:] if field.startswith('-') else '-' + field
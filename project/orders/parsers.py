@@ -0,0 +1,150 @@
+import codecs
+import json
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from .renderers import FastJSONRenderer, orjson
+
+# Size of The Body Chunks Read From The Stream
+READ_SIZE = 64 * 1024
+
+
+def get_encoding(parser_context):
+    return (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+
+
+# Reads The Body in Chunks and Decodes It Incrementally
+def iter_text(stream, encoding):
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+# JSON Parser Backed by orjson, Falls Back to DRF's JSONParser Without orjson or for Non UTF-8 Bodies
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = get_encoding(parser_context)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8' or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+# Parser for Newline Delimited JSON, One Object per Line
+# Rows are decoded lazily while the view iterates 'request.data'
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self.iter_rows(stream, get_encoding(parser_context))
+
+    def iter_rows(self, stream, encoding):
+        if stream is None:
+            return
+
+        buffer = ''
+        line_number = 0
+        for text in iter_text(stream, encoding):
+            buffer += text
+            *lines, buffer = buffer.split('\n')
+            for line in lines:
+                line_number += 1
+                if line.strip():
+                    yield self.decode_line(line, line_number)
+
+        if buffer.strip():
+            yield self.decode_line(buffer, line_number + 1)
+
+    def decode_line(self, line, line_number):
+        try:
+            return json.loads(line)
+        except ValueError as exc:
+            raise ParseError(f'NDJSON parse error on line {line_number} - {exc}')
+
+
+# Parser for a JSON Array Decoded Item by Item, The Whole Body Is Never Held in Memory
+# A body that isn't exactly one array (cut before its ']', or followed by more data) raises ParseError
+# once the parser gets there, the view has only written the chunks of rows before it
+class JSONArrayStreamParser(BaseParser):
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self.iter_items(stream, get_encoding(parser_context))
+
+    def iter_items(self, stream, encoding):
+        if stream is None:
+            return
+
+        decoder = json.JSONDecoder()
+        texts = iter_text(stream, encoding)
+        buffer = ''
+        position = 0
+        # What Comes Next: The '[', The First Item or ']', an Item After a ',', a ',' or ']' After an Item,
+        # Then Only Whitespace Until The End of The Body
+        expected = 'start'
+
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+
+            if position == len(buffer):
+                text = next(texts, None)
+                if text is None:
+                    if expected == 'end':
+                        return
+                    raise ParseError('JSON parse error - unexpected end of the array')
+                buffer = buffer[position:] + text
+                position = 0
+                continue
+
+            char = buffer[position]
+            if expected == 'end':
+                raise ParseError('JSON parse error - unexpected data after the array')
+            if expected == 'start':
+                if char != '[':
+                    raise ParseError('JSON parse error - expected an array of orders')
+                expected = 'first item'
+                position += 1
+                continue
+            if expected == 'separator':
+                if char not in ',]':
+                    raise ParseError("JSON parse error - expected ',' or ']' after an item")
+                expected = 'item' if char == ',' else 'end'
+                position += 1
+                continue
+            if expected == 'first item' and char == ']':
+                expected = 'end'
+                position += 1
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError as exc:
+                # The Item May Be Cut by The Chunk Boundary, Reading More
+                text = next(texts, None)
+                if text is None:
+                    raise ParseError(f'JSON parse error - {exc}')
+                buffer = buffer[position:] + text
+                position = 0
+                continue
+
+            # A Number Cut by The Chunk Boundary Decodes Without an Error
+            if end == len(buffer):
+                text = next(texts, None)
+                if text:
+                    buffer = buffer[position:] + text
+                    position = 0
+                    continue
+
+            yield item
+            position = end
+            expected = 'separator'
@@ -0,0 +1,66 @@
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Alias of The Read Replica in DATABASES, Without It Everything Goes to 'default'
+REPLICA_DB_ALIAS = 'replica'
+
+# Whether The Reads of The Current Request Go to The Primary
+#
+# Set by ReplicaRoutingMiddleware: only safe requests of users who haven't written lately read
+# from the replica. Code running outside a request (commands, the shell) reads from the primary.
+read_from_primary = ContextVar('read_from_primary', default=True)
+
+
+def has_replica():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+# Sends Reads to The Replica and Writes to The Primary
+#
+# Reads inside a transaction of the primary stay on it, they must see what the transaction wrote
+# and the rows it locked. Querysets that lock ('select_for_update') or write are routed as writes.
+# Sessions are always read from the primary, a session written by the login must be found right away.
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not has_replica():
+            return None
+        if read_from_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label == 'sessions':
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    # Both Aliases Hold The Same Rows
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}:
+            return True
+        return None
+
+
+# Read-Your-Writes: a User Who Wrote Reads From The Primary for REPLICA_PIN_SECONDS,
+# Longer Than The Replica Is Expected to Lag, The Pin Is Kept in Redis for All The Workers
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+
+def get_pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def pin_to_primary(user_id):
+    cache.set(get_pin_key(user_id), 1, timeout=get_pin_seconds())
+
+
+async def apin_to_primary(user_id):
+    await cache.aset(get_pin_key(user_id), 1, timeout=get_pin_seconds())
+
+
+# Called Once The User of a Safe Request Is Known, Its Reads Move to The Primary if It Is Pinned
+def route_user_reads(user_id):
+    if not read_from_primary.get() and cache.get(get_pin_key(user_id)) is not None:
+        read_from_primary.set(True)
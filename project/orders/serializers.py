@@ -1,6 +1,178 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Order, Product
-from .utils import delete_cache
+from .models import CANCELLED_STATUS, ArchivedOrder, ArchivedOrderItem, Order, OrderItem, Product
+from .signals import log_orders_written
+from .stats import add_order_change, apply_stats, get_order_values
+from .stock import InsufficientStock, RESERVED_STATUS, get_order_lines, get_reserved, move_orders_stock, move_stock
+from .utils import delete_cache, send_order_status_change_events
+
+
+# Lines of The Order From (Product, Quantity) Pairs, a Repeated Product Becomes One Line
+# The Order's Totals Are Set From The Lines, so They Are Written Together With Them
+def build_order_items(order, lines):
+    items = {}
+    for product, quantity in lines:
+        item = items.get(product.product_id)
+        if item is None:
+            items[product.product_id] = OrderItem(
+                order=order, product=product, quantity=quantity, unit_price=Decimal(product.price),
+            )
+        else:
+            item.quantity += quantity
+
+    order.total_price = sum((item.unit_price * item.quantity for item in items.values()), Decimal('0.00'))
+    order.items_count = sum(item.quantity for item in items.values())
+    return list(items.values())
+
+
+# Quantities of Each Product in The Lines, as Taken From Stock by a Confirmed Order
+def get_item_lines(items):
+    return {item.product_id: item.quantity for item in items}
+
+
+# Replacing The Lines of a Saved Order by One Unit of Each Product, The Totals Are Updated in The Same Transaction
+# The order isn't saved through Order.save, its stats and its update event are written here
+@transaction.atomic
+def link_products(order, products):
+    old_values = get_order_values(order)
+    items = build_order_items(order, [(product, 1) for product in products])
+    OrderItem.objects.filter(order_id=order.order_id).delete()
+    OrderItem.objects.bulk_create(items)
+    Order.objects.filter(order_id=order.order_id).update(total_price=order.total_price, items_count=order.items_count)
+    order._remember_values(['total_price', 'items_count'])
+
+    stats_deltas = {}
+    add_order_change(stats_deltas, old_values, get_order_values(order))
+    apply_stats(stats_deltas)
+    log_orders_written([order], created=False)
+
+
+# Finding Existing Products in One Query and Creating The Missing Ones in Another
+def get_or_create_products(products_data):
+    # An Empty Lookup Would Select The Whole Table
+    if not products_data:
+        return []
+
+    lookup = Q()
+    for product_data in products_data:
+        lookup |= Q(**product_data)
+
+    products = {}
+    for product in Product.objects.filter(lookup):
+        products.setdefault((product.name, product.price, product.quantity), product)
+
+    missing = {}
+    for product_data in products_data:
+        key = (product_data['name'], product_data['price'], product_data['quantity'])
+        if key not in products:
+            missing.setdefault(key, Product(**product_data))
+    Product.objects.bulk_create(missing.values())
+    products.update(missing)
+
+    return [products[(data['name'], data['price'], data['quantity'])] for data in products_data]
+
+
+# Writing a Chunk of Validated Orders With a Constant Number of Queries
+# 'created' is a list of validated data, 'updated' a list of (order, validated data) pairs
+# Returns the new orders and the orders left unwritten because their products are out of stock
+#
+# Orders are written with 'bulk_create'/'bulk_update', Order.save and its signals don't run:
+# the stock moves, status change events, stats and created/updated events are all written here.
+@transaction.atomic
+def bulk_write_orders(user, created, updated):
+    items = {}
+
+    # New Orders Get New Products, as in OrderSerializer.create
+    orders = []
+    new_products = []
+    for validated_data in created:
+        validated_data = dict(validated_data)
+        products = [Product(**product_data) for product_data in validated_data.pop('products', [])]
+        item_lines = validated_data.pop('items', [])
+        order = Order(user=user, **validated_data)
+        if order.status == CANCELLED_STATUS:
+            order.cancelled_at = timezone.now()
+        orders.append(order)
+        new_products += products
+        items[order] = build_order_items(order, [(product, 1) for product in products] + item_lines)
+
+    Product.objects.bulk_create(new_products)
+
+    # Existing Orders Reuse Matching Products, as in OrderSerializer.update
+    changes = {}
+    relinked = []
+    update_fields = set()
+    old_values = {}
+    for order, validated_data in updated:
+        old_values[order] = get_order_values(order)
+        validated_data = dict(validated_data)
+        products_data = validated_data.pop('products', [])
+        item_lines = validated_data.pop('items', [])
+        old_status = order.status
+        for attr, value in validated_data.items():
+            setattr(order, attr, value)
+        update_fields.update(validated_data)
+
+        if old_status != order.status:
+            changes[order] = old_status
+            if order.status == CANCELLED_STATUS:
+                order.cancelled_at = timezone.now()
+                update_fields.add('cancelled_at')
+        if products_data or item_lines:
+            relinked.append((order, products_data, item_lines))
+
+    if relinked:
+        products = get_or_create_products([data for _, products_data, _ in relinked for data in products_data])
+        for order, products_data, item_lines in relinked:
+            lines = [(product, 1) for product in products[:len(products_data)]] + item_lines
+            products = products[len(products_data):]
+            items[order] = build_order_items(order, lines)
+        update_fields.update(['total_price', 'items_count'])
+
+    # Stock of The Confirmed Orders, as in Order.save (Only Unconfirmed Orders Get New Lines)
+    stored_lines = get_order_lines([
+        order.order_id for order, old_status in changes.items()
+        if order not in items and RESERVED_STATUS in (old_status, order.status)
+    ])
+    moves = [(order, {}, get_reserved(order.status, get_item_lines(items[order]))) for order in orders]
+    for order, old_status in changes.items():
+        lines = get_item_lines(items[order]) if order in items else stored_lines.get(order.order_id, {})
+        moves.append((order, get_reserved(old_status, lines), get_reserved(order.status, lines)))
+    rejected = move_orders_stock(moves)
+
+    Order.objects.bulk_create([order for order in orders if order not in rejected])
+
+    relinked_ids = [order.order_id for order, _, _ in relinked if order not in rejected]
+    if relinked_ids:
+        OrderItem.objects.filter(order_id__in=relinked_ids).delete()
+
+    if update_fields:
+        Order.objects.bulk_update([order for order, _ in updated if order not in rejected], sorted(update_fields))
+
+    OrderItem.objects.bulk_create(
+        item for order, order_items in items.items() if order not in rejected for item in order_items
+    )
+
+    send_order_status_change_events(
+        (order.order_id, old_status, order.status) for order, old_status in changes.items() if order not in rejected
+    )
+
+    stats_deltas = {}
+    for order in orders:
+        if order not in rejected:
+            add_order_change(stats_deltas, None, get_order_values(order))
+    for order, _ in updated:
+        if order not in rejected:
+            add_order_change(stats_deltas, old_values[order], get_order_values(order))
+    apply_stats(stats_deltas)
+
+    log_orders_written([order for order in orders if order not in rejected], created=True)
+    log_orders_written([order for order, _ in updated if order not in rejected], created=False)
+
+    return orders, rejected
 
 
 # ModelSerializer for The Product Model
@@ -10,47 +182,235 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ['product_id', 'name', 'price', 'quantity']
 
 
+# Serializer for an Order Line, Written as The ID of an Existing Product and a Quantity
+class OrderItemSerializer(serializers.ModelSerializer):
+    product_id = serializers.UUIDField()
+
+    class Meta:
+        model = OrderItem
+        fields = ['product_id', 'quantity', 'unit_price']
+        read_only_fields = ['unit_price']
+        extra_kwargs = {'quantity': {'min_value': 1, 'default': 1}}
+
+
 # ModelSerializer for The Order Model
+#
+# The lines of an order are its 'products' (new products, one unit of each) and its 'items'
+# (existing products with a quantity). 'total_price' is computed from them and can't be written.
 class OrderSerializer(serializers.ModelSerializer):
-    products = ProductSerializer(many=True)
+    products = ProductSerializer(many=True, required=False)
+    items = OrderItemSerializer(many=True, required=False)
     user = serializers.StringRelatedField()
 
     # Creating Keys for The Cache
     KEY_PREFIX = 'orders-viewset'
 
+    # Highest Total The Column Holds
+    MAX_TOTAL_PRICE = Decimal('99999999.99')
+
+    # Relations Rendered by The Serializer, Loaded Up Front to Avoid N+1 Queries
+    # Products and lines are listed in a stable order, the same as in OrderValuesSerializer
+    select_related_fields = ['user']
+    prefetch_related_fields = [
+        Prefetch('products', queryset=Product.objects.order_by('product_id')),
+        Prefetch('items', queryset=OrderItem.objects.order_by('product_id')),
+    ]
+
     class Meta:
         model = Order
-        fields = ['order_id', 'user', 'status', 'total_price', 'products', 'is_deleted']
+        fields = ['order_id', 'user', 'status', 'total_price', 'products', 'items', 'is_deleted']
+        read_only_fields = ['total_price']
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.select_related(*cls.select_related_fields).prefetch_related(*cls.prefetch_related_fields)
+
+    # Only The Transitions of Order.ALLOWED_TRANSITIONS
+    def validate_status(self, status):
+        if self.instance is not None and not Order.can_change_status(self.instance.status, status):
+            raise serializers.ValidationError(f"Can not change status from '{self.instance.status}' to '{status}'.")
+        return status
+
+    # Products of The Lines in One Query, The Bulk Import Puts The Products of a Whole Chunk in The Context
+    # The validated 'items' are (product, quantity) pairs
+    def validate_items(self, items):
+        product_ids = {item['product_id'] for item in items}
+        products = {
+            product_id: product
+            for product_id, product in self.context.get('products', {}).items()
+            if product_id in product_ids
+        }
+        if product_ids - products.keys():
+            products.update(Product.objects.in_bulk(product_ids - products.keys()))
+
+        missing = sorted(str(product_id) for product_id in product_ids - products.keys())
+        if missing:
+            raise serializers.ValidationError(f"Products not found: {', '.join(missing)}.")
+        return [(products[item['product_id']], item['quantity']) for item in items]
+
+    def validate(self, attrs):
+        # The Stock Taken by a Confirmed Order Is Its Lines, They Only Change Before Confirming
+        if self.instance is not None and self.instance.status == RESERVED_STATUS and (
+            attrs.get('products') or attrs.get('items')
+        ):
+            raise serializers.ValidationError({'items': ['The lines of a confirmed order can not be changed.']})
+
+        total_price = sum(product_data['price'] for product_data in attrs.get('products', []))
+        total_price += sum(Decimal(product.price) * quantity for product, quantity in attrs.get('items', []))
+        if total_price > self.MAX_TOTAL_PRICE:
+            raise serializers.ValidationError({'total_price': [f'The total must not exceed {self.MAX_TOTAL_PRICE}.']})
+        return attrs
 
     # Processing POST Method
+    @transaction.atomic
     def create(self, validated_data):
-        products_data = validated_data.pop('products')
-        order = Order.objects.create(**validated_data)
+        products = [Product(**product_data) for product_data in validated_data.pop('products', [])]
+        item_lines = validated_data.pop('items', [])
+        order = Order(**validated_data)
+        items = build_order_items(order, [(product, 1) for product in products] + item_lines)
 
-        for product_data in products_data:
-            product = Product.objects.create(**product_data)
-            order.products.add(product)
+        order.save()
+        Product.objects.bulk_create(products)
+        OrderItem.objects.bulk_create(items)
+        try:
+            move_stock({}, get_reserved(order.status, get_item_lines(items)))
+        except InsufficientStock as exc:
+            raise serializers.ValidationError({'status': [str(exc)]})
 
-        # Deleting Cache
-        delete_cache(self.KEY_PREFIX)
+        # Deleting Cache Once Committed, a Page Computed Before That Would Be Cached Under The New Generation
+        user_id = order.user_id
+        transaction.on_commit(lambda: delete_cache(self.KEY_PREFIX, user_id=user_id))
 
         return order
 
-    # Processing PUT/PATCH Methods
+    # Processing PUT/PATCH Methods, Given Lines Replace The Order's Lines
+    @transaction.atomic
     def update(self, instance, validated_data):
         products_data = validated_data.pop('products', [])
+        item_lines = validated_data.pop('items', [])
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        instance.save()
-
-        if products_data:
-            instance.products.clear()
+        # The New Lines Are Written First, Confirming Takes Them From Stock
+        # The new totals are saved with the other changed fields
+        if products_data or item_lines:
+            products = get_or_create_products(products_data) if products_data else []
+            items = build_order_items(instance, [(product, 1) for product in products] + item_lines)
+            OrderItem.objects.filter(order_id=instance.order_id).delete()
+            OrderItem.objects.bulk_create(items)
 
-            for product_data in products_data:
-                product, created = Product.objects.get_or_create(**product_data)
-                instance.products.add(product)
+        try:
+            instance.save()
+        except InsufficientStock as exc:
+            raise serializers.ValidationError({'status': [str(exc)]})
 
-        delete_cache(self.KEY_PREFIX)
+        user_id = instance.user_id
+        transaction.on_commit(lambda: delete_cache(self.KEY_PREFIX, user_id=user_id))
         return instance
+
+
+# Body of The Bulk Status Change, Without 'order_ids' The Orders Are Selected by The List's Filters
+class OrderTransitionSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    order_ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=False, max_length=10000)
+
+
+# Line of an Archived Order
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['product_id', 'quantity', 'unit_price']
+
+
+# Read-Only Serializer of The Archived Orders, for The Admins
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    user = serializers.StringRelatedField()
+
+    class Meta:
+        model = ArchivedOrder
+        fields = [
+            'order_id', 'user', 'status', 'total_price', 'items_count', 'items', 'is_deleted', 'created_at', 'cancelled_at',
+            'archived_at',
+        ]
+        read_only_fields = fields
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.select_related('user').prefetch_related(
+            Prefetch('items', queryset=ArchivedOrderItem.objects.order_by('product_id')),
+        )
+
+
+# Read-Only Serializer for GET Requests, Renders Orders From '.values()' Rows
+#
+# The output is identical to OrderSerializer's, but no DRF field is run per product:
+# orders are dicts from one query (the user's name is joined), their products and lines are grouped
+# from one query of the lines table. Decimals are formatted by OrderSerializer's own fields.
+class OrderValuesSerializer:
+    # Values of an Order Row, 'user_id' Is for The Permissions and 'created_at' for The Pagination
+    order_fields = ('order_id', 'user_id', 'user__username', 'status', 'total_price', 'is_deleted', 'created_at')
+    item_fields = (
+        'order_id', 'product_id', 'product__name', 'product__price', 'product__quantity', 'quantity', 'unit_price',
+    )
+
+    def __init__(self):
+        fields = OrderSerializer().fields
+        self.total_price_field = fields['total_price']
+        self.price_field = fields['products'].child.fields['price']
+        self.unit_price_field = fields['items'].child.fields['unit_price']
+
+    @classmethod
+    def get_values(cls, queryset):
+        return queryset.select_related(None).prefetch_related(None).values(*cls.order_fields)
+
+    @classmethod
+    def get_items_queryset(cls, rows):
+        return (
+            OrderItem.objects
+            .filter(order_id__in=[row['order_id'] for row in rows])
+            .order_by('order_id', 'product_id')
+            .values_list(*cls.item_fields)
+        )
+
+    def to_representation(self, rows):
+        items = list(self.get_items_queryset(rows)) if rows else []
+        return self.render(rows, items)
+
+    async def ato_representation(self, rows):
+        items = [item async for item in self.get_items_queryset(rows)] if rows else []
+        return self.render(rows, items)
+
+    def render(self, rows, items):
+        products_by_order = {}
+        items_by_order = {}
+        price = self.price_field.to_representation
+        unit_price = self.unit_price_field.to_representation
+        for order_id, product_id, name, product_price, stock, quantity, item_price in items:
+            product_id = str(product_id)
+            products_by_order.setdefault(order_id, []).append({
+                'product_id': product_id,
+                'name': name,
+                'price': price(product_price),
+                'quantity': stock,
+            })
+            items_by_order.setdefault(order_id, []).append({
+                'product_id': product_id,
+                'quantity': quantity,
+                'unit_price': unit_price(item_price),
+            })
+
+        total_price = self.total_price_field.to_representation
+        return [
+            {
+                'order_id': str(row['order_id']),
+                'user': row['user__username'],
+                'status': row['status'],
+                'total_price': total_price(row['total_price']),
+                'products': products_by_order.get(row['order_id'], []),
+                'items': items_by_order.get(row['order_id'], []),
+                'is_deleted': row['is_deleted'],
+            }
+            for row in rows
+        ]
@@ -1,27 +1,55 @@
 import logging
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import get_user_cache
+from .events import publish_event
 from .models import Order
 
 # Получаем логгер
 logger = logging.getLogger('order_activity')
 
 
+# Username if The User Is Already Loaded, Otherwise The ID, The Log Never Costs a Query
+def get_user_label(instance):
+    if Order.user.is_cached(instance):
+        return instance.user.username
+    return f"id={instance.user_id}"
+
+
 # Логируем создание нового заказа
 @receiver(post_save, sender=Order)
 def log_order_creation(sender, instance, created, **kwargs):
     if created:
-        logger.info(f"Order created: {instance.order_id}, User: {instance.user.username}, Total Price: {instance.total_price}")
+        publish_event(logger.name, f"Order created: {instance.order_id}, User: {get_user_label(instance)}, Total Price: {instance.total_price}")
 
 
 # Логируем обновление заказа
 @receiver(post_save, sender=Order)
 def log_order_update(sender, instance, created, **kwargs):
     if not created:  # Это обновление, а не создание
-        logger.info(f"Order updated: {instance.order_id}, User: {instance.user.username}, Total Price: {instance.total_price}")
+        publish_event(logger.name, f"Order updated: {instance.order_id}, User: {get_user_label(instance)}, Total Price: {instance.total_price}")
+
+
+# Same Events for Orders Written Without Signals ('bulk_create', 'bulk_update', queryset updates)
+def log_orders_written(orders, created):
+    for order in orders:
+        (log_order_creation if created else log_order_update)(Order, order, created)
 
 
 # Логируем удаление заказа
 @receiver(post_delete, sender=Order)
 def log_order_deletion(sender, instance, **kwargs):
-    logger.info(f"Order deleted: {instance.order_id}, User: {instance.user.username}, Total Price: {instance.total_price}")
+    publish_event(logger.name, f"Order deleted: {instance.order_id}, User: {get_user_label(instance)}, Total Price: {instance.total_price}")
+
+
+# Сбрасываем кэш пользователя для аутентификации (деактивация, смена is_staff и т.д.)
+# Второй сброс после коммита убирает запись, закэшированную другим запросом до коммита
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    get_user_cache().invalidate(user_id)
+    transaction.on_commit(lambda: get_user_cache().invalidate(user_id))
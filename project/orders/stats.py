@@ -0,0 +1,137 @@
+import random
+from decimal import Decimal
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+from .utils import get_user_scope
+
+# Scope of The Totals of All The Users, a User's Totals Are Under 'user:<id>'
+ALL_USERS_SCOPE = 'all'
+
+# Rows per Status Holding The Totals of All The Users, a Write Adds to One of Them at Random
+STATS_SLOTS = 16
+
+# Fields of an Order Counted in The Stats, Deleted Orders Aren't Counted
+STATS_FIELDS = ('user_id', 'status', 'is_deleted', 'total_price', 'items_count')
+
+
+# Adds an Order Going From 'old' to 'new' to The Deltas, Both Are Dicts of STATS_FIELDS or None (No Order)
+# The deltas are {(user_id, status): [orders, total_price, items_count]}
+def add_order_change(deltas, old, new):
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None or values['is_deleted']:
+            continue
+        delta = deltas.setdefault((values['user_id'], values['status']), [0, Decimal('0.00'), 0])
+        delta[0] += sign
+        delta[1] += sign * Decimal(values['total_price'])
+        delta[2] += sign * values['items_count']
+
+
+def get_order_values(order):
+    return {field: getattr(order, field) for field in STATS_FIELDS}
+
+
+# Adds The Deltas to The Stats of The Users and of All The Users, One INSERT ... ON CONFLICT DO UPDATE
+#
+# Runs inside the transaction that writes the order (Order.save's 'atomic(savepoint=False)' block,
+# the one of the bulk writes), the stats are always in line with the orders.
+# Rows are written in key order, two writers lock the rows they share in the same order.
+def apply_stats(deltas):
+    from .models import OrderStats
+
+    rows = {}
+    slot = random.randrange(STATS_SLOTS)
+    for (user_id, status), values in deltas.items():
+        for key in ((get_user_scope(user_id), status, 0), (ALL_USERS_SCOPE, status, slot)):
+            row = rows.setdefault(key, [0, Decimal('0.00'), 0])
+            for index, value in enumerate(values):
+                row[index] += value
+
+    rows = sorted((key, values) for key, values in rows.items() if any(values))
+    if not rows:
+        return
+
+    connection = connections[router.db_for_write(OrderStats)]
+    quote_name = connection.ops.quote_name
+    table = quote_name(OrderStats._meta.db_table)
+    keys = ', '.join(quote_name(name) for name in ('scope', 'status', 'slot'))
+    counters = [quote_name(name) for name in ('orders', 'total_price', 'items_count')]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({keys}, {', '.join(counters)}) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))} "
+            f"ON CONFLICT ({keys}) DO UPDATE SET "
+            + ', '.join(f"{counter} = {table}.{counter} + EXCLUDED.{counter}" for counter in counters),
+            [value for key, values in rows for value in (*key, *values)],
+        )
+
+
+# Counts Orders Created With 'bulk_create' (Seeds of The Bench Commands), Call It in The Transaction of The Insert
+def add_created_orders(orders):
+    deltas = {}
+    for order in orders:
+        add_order_change(deltas, None, get_order_values(order))
+    apply_stats(deltas)
+
+
+# Deletes The Orders of a Queryset in Batches and Takes Them Out of The Stats, One Transaction per Batch
+# The lines are deleted by the cascade, the post_delete receivers run as for any deleted order.
+def delete_orders(queryset, batch_size=10000):
+    from .models import Order
+
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            rows = list(queryset.order_by('order_id').values('order_id', *STATS_FIELDS)[:batch_size])
+            if not rows:
+                return deleted
+            Order.objects.filter(order_id__in=[row['order_id'] for row in rows]).delete()
+            deltas = {}
+            for row in rows:
+                add_order_change(deltas, row, None)
+            apply_stats(deltas)
+        deleted += len(rows)
+
+
+# Totals of a Scope per Status, {status: {'orders', 'total_price', 'items_count'}}, One Query of STATS_SLOTS Rows at Most per Status
+def get_stats(scope):
+    from .models import Order, OrderStats
+
+    stats = {status: {'orders': 0, 'total_price': Decimal('0.00'), 'items_count': 0} for status, _ in Order.STATUS_CHOICES}
+    for status, orders, total_price, items_count in (
+        OrderStats.objects.filter(scope=scope).values_list('status', 'orders', 'total_price', 'items_count')
+    ):
+        stats[status]['orders'] += orders
+        stats[status]['total_price'] += total_price
+        stats[status]['items_count'] += items_count
+    return stats
+
+
+# Recomputes The Stats From The Orders Table, Returns The Number of Orders Counted
+#
+# On PostgreSQL the stats table is locked against writes first: an order write running meanwhile
+# either committed before the totals are read or adds its change after the rebuild has committed.
+def rebuild_stats(batch_size=1000):
+    from .models import Order, OrderStats
+
+    using = router.db_for_write(OrderStats)
+    with transaction.atomic(using=using):
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {connection.ops.quote_name(OrderStats._meta.db_table)} IN EXCLUSIVE MODE")
+        OrderStats.objects.using(using).all().delete()
+
+        totals = (
+            Order.objects.using(using).filter(is_deleted=False).order_by().values_list('user_id', 'status')
+            .annotate(orders=Count('order_id'), total=Sum('total_price'), items=Sum('items_count'))
+        )
+        counted = 0
+        deltas = {}
+        for user_id, status, orders, total_price, items_count in totals.iterator(chunk_size=batch_size):
+            deltas[(user_id, status)] = [orders, total_price, items_count]
+            counted += orders
+            if len(deltas) == batch_size:
+                apply_stats(deltas)
+                deltas = {}
+        apply_stats(deltas)
+    return counted
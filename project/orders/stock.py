@@ -0,0 +1,107 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+# Status Holding Stock: The Lines of a Confirmed Order Are Taken From The Products' Quantity
+RESERVED_STATUS = 'confirmed'
+
+
+# Raised When Products Have Less Stock Than a Reservation Needs, Nothing Is Taken Then
+class InsufficientStock(Exception):
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f"Not enough stock for products: {', '.join(str(product_id) for product_id in product_ids)}.")
+
+
+# Quantities of Each Product in The Lines of The Orders, {order_id: {product_id: quantity}}, One Query
+def get_order_lines(order_ids):
+    from .models import OrderItem
+
+    lines = {}
+    items = OrderItem.objects.filter(order_id__in=order_ids).values_list('order_id', 'product_id', 'quantity')
+    for order_id, product_id, quantity in items:
+        lines.setdefault(order_id, {})[product_id] = quantity
+    return lines
+
+
+# Stock Held by an Order With These Lines in This Status
+def get_reserved(status, lines):
+    return lines if status == RESERVED_STATUS else {}
+
+
+# Changes The Quantity of Products by {product_id: delta}, Negative Deltas Take From Stock
+#
+# The rows are locked in product_id order before they are changed, two transactions touching
+# the same products always lock them in the same order and can't deadlock. The UPDATE only
+# changes rows that still have the stock ('quantity >= n'), so nothing is oversold even where
+# SELECT FOR UPDATE is a no-op. Two queries whatever the number of products.
+def change_stock(deltas):
+    from .models import Product
+
+    product_ids = sorted(product_id for product_id, delta in deltas.items() if delta)
+    if not product_ids:
+        return
+
+    with transaction.atomic(savepoint=False):
+        stock = dict(
+            Product.objects.select_for_update().filter(product_id__in=product_ids).order_by('product_id')
+            .values_list('product_id', 'quantity')
+        )
+        missing = [product_id for product_id in product_ids if stock.get(product_id, 0) + deltas[product_id] < 0]
+        if missing:
+            raise InsufficientStock(missing)
+
+        def per_product(values):
+            return Case(
+                *[When(product_id=product_id, then=Value(values[product_id])) for product_id in product_ids],
+                output_field=IntegerField(),
+            )
+
+        needed = {product_id: max(-deltas[product_id], 0) for product_id in product_ids}
+        updated = Product.objects.filter(product_id__in=product_ids, quantity__gte=per_product(needed)).update(
+            quantity=F('quantity') + per_product(deltas),
+        )
+        if updated != len(product_ids):
+            raise InsufficientStock(product_ids)
+
+
+# Moves The Stock Held by an Order From What It Held Before to What It Holds After, {product_id: quantity}
+def move_stock(before, after):
+    deltas = dict(before)
+    for product_id, quantity in after.items():
+        deltas[product_id] = deltas.get(product_id, 0) - quantity
+    change_stock(deltas)
+
+
+# Moves The Stock of Many Orders, 'moves' Are (key, before, after) Triples, Returns The Keys
+# of The Orders Whose Reservation Failed, Their Stock Is Left Untouched
+#
+# All the moves are tried together first, if some product is short every order gets its own
+# savepoint, so one short order doesn't reject the others.
+def move_orders_stock(moves):
+    moves = [(key, before, after) for key, before, after in moves if before != after]
+    if not moves:
+        return set()
+
+    try:
+        with transaction.atomic():
+            move_stock(merge_lines(before for _, before, _ in moves), merge_lines(after for _, _, after in moves))
+        return set()
+    except InsufficientStock:
+        pass
+
+    rejected = set()
+    for key, before, after in moves:
+        try:
+            with transaction.atomic():
+                move_stock(before, after)
+        except InsufficientStock:
+            rejected.add(key)
+    return rejected
+
+
+def merge_lines(lines_list):
+    merged = {}
+    for lines in lines_list:
+        for product_id, quantity in lines.items():
+            merged[product_id] = merged.get(product_id, 0) + quantity
+    return merged
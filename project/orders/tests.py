@@ -1,9 +1,44 @@
+import io
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import AsyncClient
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
+from rest_framework.throttling import UserRateThrottle
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connection, connections, transaction
 from django.urls import reverse
-from .models import Product, Order
+from .events import Event, EventPipeline, get_event_pipeline
+from .metrics import LocalMetricsBackend, RedisMetricsBackend
+from .archive import archive_orders_batch, get_archive_cutoff
+from .cache import OrderListCache
+from .models import ArchivedOrder, ArchivedOrderItem, OrderItem, OrderStats, OutboxEvent, Product, Order
+from .outbox import EventLogSink, relay_outbox_batch
+from .parsers import FastJSONParser, JSONArrayStreamParser, NDJSONParser
+from .renderers import FastJSONRenderer
+from .routers import PrimaryReplicaRouter, get_pin_key, read_from_primary, route_user_reads
+from .serializers import OrderSerializer, OrderValuesSerializer, get_or_create_products, link_products
+from .stats import ALL_USERS_SCOPE, add_created_orders, delete_orders, get_stats, rebuild_stats
+from .stock import InsufficientStock, change_stock
+from .views import OrderViewSet
+from .utils import (
+    ORDER_STATUS_CHANGED, delete_cache, get_generation_key, get_user_scope, purge_cache,
+)
 from django.contrib.auth.models import User
 from rest_framework import status
+from rest_framework.exceptions import ParseError
 
 
 @pytest.fixture
@@ -18,6 +53,32 @@ def user(db):
     return User.objects.create_user(username='testuser', password='testpass')
 
 
+@pytest.fixture
+def clear_cache():
+    # Drops cached list pages left over from other tests
+    cache.clear()
+
+
+def read_generation(key_prefix):
+    # Generation counter of the cache namespace, as read by OrderListCache
+    return int(cache.client.get_client().get(get_generation_key(key_prefix)) or 0)
+
+
+def create_orders(user, count):
+    # Bulk creates orders with one product each, bypassing the API
+    orders = Order.objects.bulk_create(
+        Order(user=user, status='pending', total_price='40.00') for _ in range(count)
+    )
+    products = Product.objects.bulk_create(
+        Product(name='shampoo', price='40.00', quantity=1) for _ in range(count)
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, product=product, unit_price=product.price)
+        for order, product in zip(orders, products)
+    )
+    return orders
+
+
 @pytest.fixture
 def products():
     # Creates a product instance (shampoo) and returns it in a list
@@ -78,8 +139,8 @@ def test_list_orders(api_client, user, products):
 
     # Assert that the request was successful and the list contains the created order
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == 1
-    assert response.data[0]['user'] == user.username  # Ensure the user is correctly assigned
+    assert len(response.data['results']) == 1
+    assert response.data['results'][0]['user'] == user.username  # Ensure the user is correctly assigned
 
 
 @pytest.mark.django_db
@@ -93,7 +154,7 @@ def test_update_order(api_client, user, products):
         status='pending',
         total_price='40.00',
     )
-    order.products.set(products)
+    link_products(order, products)
 
     # Define the URL and the updated data
     url = reverse('order-detail', args=[order.order_id])
@@ -127,7 +188,7 @@ def test_delete_order(api_client, user, products):
         status='pending',
         total_price='40.00',
     )
-    order.products.set(products)
+    link_products(order, products)
 
     # Define the URL for deleting the order
     url = reverse('order-detail', args=[order.order_id])
@@ -228,8 +289,8 @@ def test_filter_orders_by_status(api_client, user, products):
 
     # Check that filtering works and only one order with the correct status is returned
     assert response.status_code == status.HTTP_200_OK
-    assert len(response.data) == 1
-    assert response.data[0]['status'] == 'pending'
+    assert len(response.data['results']) == 1
+    assert response.data['results'][0]['status'] == 'pending'
 
 
 @pytest.mark.django_db
@@ -259,18 +320,1525 @@ def test_filter_orders_by_price_range(api_client, user, products):
     response_min = api_client.get(url_min)
     # Check that the response contains only orders with price >= 40.00
     assert response_min.status_code == status.HTTP_200_OK
-    assert len(response_min.data) == 2  # There should be two orders with price >= 40.00
+    assert len(response_min.data['results']) == 2  # There should be two orders with price >= 40.00
 
     # Test filtering by maximum price
     url_max = reverse('order-list') + '?max_price=50.00'
     response_max = api_client.get(url_max)
     # Check that the response contains only orders with price <= 50.00
     assert response_max.status_code == status.HTTP_200_OK
-    assert len(response_max.data) == 2  # There should be two orders with price <= 50.00
+    assert len(response_max.data['results']) == 2  # There should be two orders with price <= 50.00
 
     # Test filtering by price range (min_price and max_price)
     url_range = reverse('order-list') + '?min_price=40.00&max_price=60.00'
     response_range = api_client.get(url_range)
     # Check that the response contains only orders within the price range 40.00 to 60.00
     assert response_range.status_code == status.HTTP_200_OK
-    assert len(response_range.data) == 1  # There should be one order with price in the range 40.00 to 60.00
+    assert len(response_range.data['results']) == 1  # There should be one order with price in the range 40.00 to 60.00
+
+
+@pytest.mark.django_db
+def test_list_orders_cursor_pagination(api_client, user):
+    api_client.force_authenticate(user=user)
+
+    # Create more orders than fit on one page
+    for price in range(1, 8):
+        Order.objects.create(user=user, status='pending', total_price=price)
+
+    # Walk forward through all pages ordered by total price
+    url = reverse('order-list') + '?ordering=total_price&page_size=3'
+    prices = []
+    pages = []
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        pages.append(response.data)
+        prices += [order['total_price'] for order in response.data['results']]
+        url = response.data['next']
+
+    # Every order is returned exactly once and in the requested order
+    assert prices == [f'{price}.00' for price in range(1, 8)]
+    assert [len(page['results']) for page in pages] == [3, 3, 1]
+    assert pages[0]['previous'] is None
+
+    # The previous cursor leads back to the page before
+    response = api_client.get(pages[-1]['previous'])
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['results'] == pages[1]['results']
+
+
+@pytest.mark.django_db
+def test_list_orders_invalid_cursor(api_client, user):
+    api_client.force_authenticate(user=user)
+
+    response = api_client.get(reverse('order-list') + '?cursor=not-a-cursor')
+
+    # A tampered cursor is rejected instead of silently returning the first page
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+# Query Counts Must Not Depend on The Number of Orders in The Database
+@pytest.mark.django_db
+@pytest.mark.parametrize('orders_count', [1, 100, 10000])
+def test_list_orders_query_count(api_client, user, clear_cache, django_assert_num_queries, orders_count):
+    api_client.force_authenticate(user=user)
+    create_orders(user, orders_count)
+
+    # One query for the page (with the user joined) and one for its products
+    with django_assert_num_queries(2):
+        response = api_client.get(reverse('order-list'))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['results']) == min(orders_count, 100)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('orders_count', [1, 100, 10000])
+def test_retrieve_order_query_count(api_client, user, django_assert_num_queries, orders_count):
+    api_client.force_authenticate(user=user)
+    order = create_orders(user, orders_count)[0]
+
+    with django_assert_num_queries(2):
+        response = api_client.get(reverse('order-detail', args=[order.order_id]))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['products']) == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('items_count', [1, 200])
+@pytest.mark.parametrize('orders_count', [1, 100, 10000])
+def test_create_order_query_count(api_client, user, django_assert_num_queries, orders_count, items_count):
+    api_client.force_authenticate(user=user)
+    create_orders(user, orders_count)
+    data = {
+        "status": "pending",
+        "total_price": "40.00",
+        "products": [
+            {"name": f"shampoo {number}", "price": "40.00", "quantity": 1} for number in range(items_count)
+        ]
+    }
+
+    # Savepoint, order insert, stats upsert, products insert, lines insert, release
+    # and the products and lines of the response
+    with django_assert_num_queries(8):
+        response = api_client.post(reverse('order-list'), data, format='json')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert len(response.data['products']) == items_count
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('items_count', [1, 200])
+@pytest.mark.parametrize('orders_count', [1, 100, 10000])
+def test_update_order_query_count(api_client, user, django_assert_num_queries, orders_count, items_count):
+    api_client.force_authenticate(user=user)
+    order = create_orders(user, orders_count)[0]
+
+    # Half of the products already exist and are reused
+    Product.objects.bulk_create(
+        Product(name=f"shampoo {number}", price='50.00', quantity=2) for number in range(1, items_count, 2)
+    )
+    data = {
+        "status": "confirmed",
+        "total_price": "50.00",
+        "products": [
+            {"name": f"shampoo {number}", "price": "50.00", "quantity": 2} for number in range(items_count)
+        ]
+    }
+
+    # Fixed cost of loading, saving, relinking one order, taking its lines from stock,
+    # writing its status change to the outbox and moving its stats
+    with django_assert_num_queries(17):
+        response = api_client.put(reverse('order-detail', args=[order.order_id]), data, format='json')
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.data['products']) == items_count
+    assert Product.objects.filter(name__startswith='shampoo ').count() == items_count
+
+
+@pytest.mark.django_db
+def test_delete_cache_invalidates_list(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    url = reverse('order-list')
+
+    # Warm the cache with an empty list
+    assert api_client.get(url).json()['results'] == []
+
+    # An order created behind the API is hidden by the cached page
+    Order.objects.create(user=user, status='pending', total_price='40.00')
+    assert len(api_client.get(url).json()['results']) == 0
+
+    # Invalidation is a single generation bump and the next request misses the cache
+    generation = read_generation('orders-viewset')
+    delete_cache('orders-viewset')
+    assert read_generation('orders-viewset') == generation + 1
+    assert len(api_client.get(url).json()['results']) == 1
+
+
+@pytest.mark.django_db
+def test_order_write_invalidates_cache_after_commit(user, clear_cache, django_capture_on_commit_callbacks):
+    scope_prefix = f'orders-viewset:{get_user_scope(user.id)}'
+    generation = read_generation(scope_prefix)
+
+    # A page computed before the commit can't be cached under the new generation
+    with django_capture_on_commit_callbacks(execute=True):
+        serializer = OrderSerializer(data={"status": "pending"})
+        serializer.is_valid(raise_exception=True)
+        order = serializer.save(user=user)
+        assert read_generation(scope_prefix) == generation
+    assert read_generation(scope_prefix) == generation + 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        serializer = OrderSerializer(order, data={"status": "cancelled"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        assert read_generation(scope_prefix) == generation + 1
+    assert read_generation(scope_prefix) == generation + 2
+
+
+@pytest.mark.django_db
+def test_list_cache_is_scoped_per_user(api_client, user, clear_cache, django_capture_on_commit_callbacks):
+    other_user = User.objects.create_user(username='otheruser', password='testpass')
+    admin = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+    Order.objects.create(user=other_user, status='pending', total_price='40.00')
+    url = reverse('order-list')
+
+    # Warm the same URL as three different users
+    api_client.force_authenticate(user=user)
+    assert api_client.get(url).json()['results'] == []
+    api_client.force_authenticate(user=other_user)
+    assert len(api_client.get(url).json()['results']) == 1
+    api_client.force_authenticate(user=admin)
+    assert len(api_client.get(url).json()['results']) == 1
+
+    # The user creates an order through the API, the cache is invalidated once it is committed
+    api_client.force_authenticate(user=user)
+    data = {"status": "pending", "total_price": "40.00", "products": []}
+    with django_capture_on_commit_callbacks(execute=True):
+        assert api_client.post(url, data, format='json').status_code == status.HTTP_201_CREATED
+
+    # An order of the other user created behind the API stays hidden by their cached page
+    Order.objects.create(user=other_user, status='pending', total_price='50.00')
+
+    # Only the writer's pages and the admins' pages were evicted
+    assert len(api_client.get(url).json()['results']) == 1
+    api_client.force_authenticate(user=other_user)
+    assert len(api_client.get(url).json()['results']) == 1
+    api_client.force_authenticate(user=admin)
+    assert len(api_client.get(url).json()['results']) == 3
+
+
+@pytest.mark.django_db
+def test_purge_cache(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    api_client.get(reverse('order-list'))
+
+    # Cached pages and their locks are removed
+    assert purge_cache('orders-viewset') > 0
+    assert purge_cache('orders-viewset') == 0
+
+
+@pytest.mark.django_db
+def test_list_cache_serves_stale_page_while_one_request_refreshes(api_client, user, clear_cache, monkeypatch):
+    # Pages are past their soft timeout as soon as they are stored
+    monkeypatch.setattr(OrderViewSet.list_cache, 'soft_timeout', -1)
+    refreshes = []
+    refresh_list_page = OrderViewSet.refresh_list_page
+    monkeypatch.setattr(
+        OrderViewSet, 'refresh_list_page', lambda self, page: refreshes.append(page.key) or refresh_list_page(self, page),
+    )
+    api_client.force_authenticate(user=user)
+    url = reverse('order-list')
+    assert api_client.get(url).json()['results'] == []
+    Order.objects.create(user=user, status='pending', total_price='40.00')
+
+    # While another request holds the refresh lock the stale page is served as is
+    redis_client = cache.client.get_client()
+    page_key, = redis_client.keys('orders-viewset:page:*')
+    generations = [read_generation('orders-viewset'), read_generation(f'orders-viewset:{get_user_scope(user.id)}')]
+    lock_key = f"{page_key.decode()}:lock:{generations[0]}:{generations[1]}"
+    redis_client.set(lock_key, 1)
+    assert api_client.get(url).json()['results'] == []
+    assert refreshes == []
+
+    # Once it is released, one request gets the stale page and refreshes it after its response
+    redis_client.delete(lock_key)
+    assert api_client.get(url).json()['results'] == []
+    assert refreshes == [page_key.decode()]
+    assert redis_client.get(lock_key) is None
+    assert len(api_client.get(url).json()['results']) == 1
+
+
+@pytest.mark.django_db
+def test_list_cache_waits_for_page_of_lock_holder(api_client, user, clear_cache, monkeypatch, django_assert_num_queries):
+    api_client.force_authenticate(user=user)
+    url = reverse('order-list')
+    assert api_client.get(url).json()['results'] == []
+    Order.objects.create(user=user, status='pending', total_price='40.00')
+    delete_cache('orders-viewset', user_id=user.id)
+
+    # Another worker holds the lock of the new generation and stores the page while the request waits
+    redis_client = cache.client.get_client()
+    page_key, = redis_client.keys('orders-viewset:page:*')
+    generations = [read_generation('orders-viewset'), read_generation(f'orders-viewset:{get_user_scope(user.id)}')]
+    monkeypatch.setattr(OrderListCache, 'lock', lambda self, redis_client, page: False)
+    monkeypatch.setattr('orders.cache.time.sleep', lambda seconds: redis_client.set(
+        page_key, f"{generations[0]}:{generations[1]}:{time.time() + 60}:0.1\n".encode() + b'{"results": ["stored"]}',
+    ))
+    with django_assert_num_queries(0):
+        assert api_client.get(url).json()['results'] == ['stored']
+
+    # Without the page in time, the request computes it itself
+    delete_cache('orders-viewset', user_id=user.id)
+    monkeypatch.setattr(OrderViewSet.list_cache, 'wait_timeout', 0)
+    assert len(api_client.get(url).json()['results']) == 1
+
+
+def test_list_cache_early_expiration(monkeypatch):
+    list_cache = OrderListCache('test-early-expiration', 60, soft_timeout=30)
+    monkeypatch.setattr('orders.cache.random.random', lambda: 0.5)
+
+    def build_page(seconds_left, compute_seconds, generation=1):
+        value = f"{generation}:2:{time.time() + seconds_left}:{compute_seconds}\n".encode() + b'[]'
+        return list_cache.build_page('page', [b'1', b'2', None, None, value])
+
+    # A page is refreshed early the more likely the closer it is to its soft timeout and the slower it is to compute
+    assert not build_page(20, 0.5).refresh
+    assert build_page(0.1, 0.5).refresh
+    assert build_page(20, 60).refresh
+    assert build_page(-1, 0).refresh
+    assert build_page(20, 0.5).content == b'[]'
+
+    # A page of an old generation isn't served at all
+    assert build_page(20, 0.5, generation=0).content is None
+
+
+@pytest.mark.django_db
+def test_order_save_query_count(user, django_assert_num_queries):
+    # Inserting a new order is a single INSERT and the upsert of its stats
+    order = Order(user=user, status='pending', total_price='40.00')
+    with django_assert_num_queries(2) as captured:
+        order.save()
+    assert 'orders_orderstats' in captured.captured_queries[1]['sql']
+
+    # Updating a loaded order is a single UPDATE of the changed columns, the stats follow the total
+    order = Order.objects.select_related('user').get(order_id=order.order_id)
+    order.total_price = '50.00'
+    with django_assert_num_queries(2) as captured:
+        order.save()
+    update_sql = captured.captured_queries[0]['sql']
+    assert '"total_price"' in update_sql
+    assert '"status"' not in update_sql
+
+    # Columns the stats don't count are updated alone
+    order.created_at = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+    with django_assert_num_queries(1):
+        order.save()
+
+    # A status change also inserts its outbox event, confirming reads the lines to take from stock
+    order.status = 'confirmed'
+    with django_assert_num_queries(4) as captured:
+        order.save()
+    assert 'orders_orderitem' in captured.captured_queries[0]['sql']
+    assert '"status"' in captured.captured_queries[1]['sql']
+    assert 'orders_orderstats' in captured.captured_queries[2]['sql']
+    assert 'orders_outboxevent' in captured.captured_queries[3]['sql']
+
+    order.refresh_from_db()
+    assert order.status == 'confirmed'
+    assert order.get_dirty_fields() == []
+
+
+@pytest.mark.django_db
+def test_order_save_after_deferred_loading(user, django_assert_num_queries):
+    order_id = Order.objects.create(user=user, status='pending', total_price='40.00').order_id
+
+    # The foreign key loaded later by its attname is remembered like the other loaded values
+    order = Order.objects.only('status').get(order_id=order_id)
+    assert order.user_id == user.id
+    order.refresh_from_db(fields=['user_id'])
+    assert order.get_dirty_fields() == []
+
+    # Only the status is written, the stats load the deferred total
+    order.status = 'confirmed'
+    with django_assert_num_queries(4) as captured:
+        order.save()
+    update_sql = next(query['sql'] for query in captured.captured_queries if query['sql'].startswith('UPDATE "orders_order"'))
+    assert '"status"' in update_sql
+    assert '"user_id"' not in update_sql
+    assert order.get_dirty_fields() == []
+
+
+@pytest.mark.django_db
+def test_order_status_change_event(user, monkeypatch):
+    events = []
+    monkeypatch.setattr('orders.models.send_order_status_change_event', lambda **event: events.append(event))
+
+    # Creating an order and saving it without changes emits nothing
+    order = Order.objects.create(user=user, status='pending', total_price='40.00')
+    order.save()
+    assert events == []
+
+    # A status change is detected from the loaded values
+    order = Order.objects.get(order_id=order.order_id)
+    order.status = 'cancelled'
+    order.save()
+    assert events == [{'order_id': order.order_id, 'old_status': 'pending', 'new_status': 'cancelled'}]
+
+
+@pytest.mark.django_db
+def test_bulk_import_ndjson(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    existing = Order.objects.create(user=user, status='pending', total_price='40.00')
+    rows = [
+        {"status": "pending", "total_price": "10.00", "products": [{"name": "soap", "price": "10.00", "quantity": 1}]},
+        {"order_id": str(existing.order_id), "status": "confirmed"},
+        {"status": "unknown", "total_price": "10.00", "products": []},
+        {"order_id": "not-a-uuid", "status": "confirmed"},
+        {"status": "pending", "total_price": "20.00", "products": []},
+    ]
+    body = '\n'.join(json.dumps(row) for row in rows)
+
+    response = api_client.post(reverse('order-bulk'), body, content_type='application/x-ndjson')
+
+    # Every row gets its own result and valid rows are written despite the invalid ones
+    assert response.status_code == status.HTTP_200_OK
+    assert [result['status'] for result in response.data['results']] == ['created', 'updated', 'error', 'error', 'created']
+    assert 'status' in response.data['results'][2]['errors']
+    assert Order.objects.filter(user=user).count() == 3
+    assert Order.objects.get(order_id=response.data['results'][0]['order_id']).products.get().name == 'soap'
+    existing.refresh_from_db()
+    assert existing.status == 'confirmed'
+
+
+@pytest.mark.django_db
+def test_bulk_import_json_array(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    other_order = Order.objects.create(
+        user=User.objects.create_user(username='otheruser', password='testpass'),
+        status='pending',
+        total_price='40.00',
+    )
+    rows = [
+        {"status": "pending", "total_price": "10.00", "products": []},
+        {"order_id": str(other_order.order_id), "status": "cancelled"},
+    ]
+
+    response = api_client.post(reverse('order-bulk'), rows, format='json')
+
+    # Orders of other users can't be updated
+    assert response.status_code == status.HTTP_200_OK
+    assert [result['status'] for result in response.data['results']] == ['created', 'error']
+    other_order.refresh_from_db()
+    assert other_order.status == 'pending'
+
+
+@pytest.mark.parametrize('body', [
+    '[{"a": 1, "b": "x"}, 2.5, "str]ing", [1, 2], {"nested": {"c": [true, null]}}]',
+    ' [ ] ',
+])
+def test_json_array_stream_parser(monkeypatch, body):
+    # Tiny reads make items span many chunks
+    monkeypatch.setattr('orders.parsers.READ_SIZE', 3)
+    items = list(JSONArrayStreamParser().parse(io.BytesIO(body.encode())))
+    assert items == json.loads(body)
+
+
+@pytest.mark.parametrize('body', [
+    '[{"a": 1}, {"b": 2}', '[{"a": 1}, {"b":', '[1, 2', '[{"a": 1}] {"b": 2}', '[1] x', '[1 2]', '[1,]', '[,1]', '[1,,2]', '',
+])
+def test_json_array_stream_parser_rejects_broken_arrays(monkeypatch, body):
+    monkeypatch.setattr('orders.parsers.READ_SIZE', 3)
+    with pytest.raises(ParseError):
+        list(JSONArrayStreamParser().parse(io.BytesIO(body.encode())))
+
+
+@pytest.mark.django_db
+def test_bulk_import_rejects_repeated_orders(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    soap = Product.objects.create(name='soap', price='2.50', quantity=5)
+    order_id = api_client.post(
+        reverse('order-list'), {"status": "pending", "items": [{"product_id": str(soap.product_id), "quantity": 2}]},
+        format='json',
+    ).data['order_id']
+    rows = [
+        {"status": "pending", "total_price": "10.00", "products": []},
+        {"order_id": order_id, "status": "confirmed"},
+        {"order_id": order_id, "status": "cancelled"},
+    ]
+
+    # The chunk isn't written, its rows would change the order from the same loaded state
+    response = api_client.post(reverse('order-bulk'), rows, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'repeated' in response.data['detail']
+    assert response.data['results'] == []
+    assert Order.objects.filter(user=user).count() == 1
+    assert Order.objects.get(order_id=order_id).status == 'pending'
+    soap.refresh_from_db()
+    assert soap.quantity == 5
+    assert not OutboxEvent.objects.filter(payload__order_id=order_id).exists()
+
+
+@pytest.mark.django_db
+def test_bulk_import_truncated_json_array(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    body = json.dumps([{"status": "pending", "total_price": "10.00", "products": []}] * 2)[:-1]
+
+    # The rows of the chunk cut by the end of the body aren't written
+    response = api_client.post(reverse('order-bulk'), body, content_type='application/json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'unexpected end' in response.data['detail']
+    assert not Order.objects.filter(user=user).exists()
+
+
+def test_ndjson_parser(monkeypatch):
+    monkeypatch.setattr('orders.parsers.READ_SIZE', 4)
+    body = '{"a": 1}\n\n{"b": "\u00e9"}'.encode()
+    assert list(NDJSONParser().parse(io.BytesIO(body))) == [{"a": 1}, {"b": "\u00e9"}]
+
+
+@pytest.mark.django_db
+def test_export_orders(api_client, user):
+    api_client.force_authenticate(user=user)
+    orders = create_orders(user, 3)
+    Order.objects.filter(order_id=orders[0].order_id).update(status='confirmed')
+    Order.objects.create(user=User.objects.create_user(username='otheruser'), status='pending', total_price='40.00')
+
+    # NDJSON export uses the same filters and representation as the list
+    response = api_client.get(reverse('order-export') + '?status=pending')
+    assert response.status_code == status.HTTP_200_OK
+    assert response['Content-Type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert len(rows) == 2
+    assert rows[0]['user'] == user.username
+    assert rows[0]['products'][0]['name'] == 'shampoo'
+
+    # CSV export has one row per product
+    response = api_client.get(reverse('order-export') + '?export_format=csv')
+    assert response.status_code == status.HTTP_200_OK
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert lines[0].startswith('order_id,user,status,total_price')
+    assert len(lines) == 4
+
+    response = api_client.get(reverse('order-export') + '?export_format=xml')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize('backend_class', [LocalMetricsBackend, RedisMetricsBackend])
+def test_metrics_backends_aggregate_threads(backend_class):
+    key_prefix = f'test-metrics-{backend_class.__name__}'
+    cache.client.get_client().delete(f'{key_prefix}:endpoints', f'{key_prefix}:endpoint:GET /api/v1/orders/')
+    backend = backend_class(key_prefix=key_prefix, flush_interval=0)
+
+    def send_requests():
+        for status_code, duration in ((200, 0.001), (201, 0.02), (404, 0.3), (500, 20)):
+            backend.record('/api/v1/orders/', 'GET', status_code, duration, response_bytes=10, db_queries=2)
+
+    threads = [threading.Thread(target=send_requests) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Counts of every thread are visible to the reader
+    metrics = backend.get_metrics()['/api/v1/orders/']
+    assert (metrics['total_calls'], metrics['success'], metrics['errors']) == (32, 16, 16)
+    method_metrics = metrics['methods']['GET']
+    assert method_metrics['response_bytes'] == 320
+    assert method_metrics['db_queries'] == 64
+    assert method_metrics['latency_seconds']['buckets']['0.005'] == 8
+    assert method_metrics['latency_seconds']['buckets']['+Inf'] == 32
+    assert 0.01 < method_metrics['latency_seconds']['p50'] <= 0.025
+    assert method_metrics['latency_seconds']['p99'] == 10
+
+
+def test_redis_metrics_backend_buffers_until_flush():
+    cache.client.get_client().delete('test-metrics-buffered:endpoints', 'test-metrics-buffered:endpoint:GET /metrics/')
+    reader = RedisMetricsBackend(key_prefix='test-metrics-buffered')
+    writer = RedisMetricsBackend(key_prefix='test-metrics-buffered', flush_interval=60)
+
+    # Another worker's counts arrive once its buffer is flushed
+    writer.record('/metrics/', 'GET', 200, 0.01)
+    assert reader.get_metrics() == {}
+    writer.flush()
+    assert reader.get_metrics()['/metrics/']['total_calls'] == 1
+
+
+def test_redis_metrics_backend_flushes_idle_threads():
+    cache.client.get_client().delete('test-metrics-idle:endpoints', 'test-metrics-idle:endpoint:GET /metrics/')
+    reader = RedisMetricsBackend(key_prefix='test-metrics-idle')
+    writer = RedisMetricsBackend(key_prefix='test-metrics-idle', flush_interval=60)
+
+    # A thread that counted a request and stays idle, its buffer is flushed by another thread
+    thread = threading.Thread(target=writer.record, args=('/metrics/', 'GET', 200, 0.01))
+    thread.start()
+    thread.join()
+    writer.record('/metrics/', 'GET', 200, 0.01)
+    assert reader.get_metrics() == {}
+
+    # As done by the flusher thread and when the process exits
+    writer.stop()
+    assert reader.get_metrics()['/metrics/']['total_calls'] == 2
+    assert writer.buffers == [writer.local.buffer]
+
+
+@pytest.mark.django_db
+def test_metrics_use_route_patterns(api_client, user):
+    api_client.force_authenticate(user=user)
+    orders = create_orders(user, 2)
+    before = api_client.get(reverse('metrics')).json().get('/api/v1/orders/<pk>/', {'total_calls': 0})
+
+    # Requests to different orders are counted under one route
+    for order in orders:
+        api_client.get(reverse('order-detail', args=[order.order_id]))
+    api_client.get('/no/such/page/')
+
+    metrics = api_client.get(reverse('metrics')).json()
+    assert metrics['/api/v1/orders/<pk>/']['total_calls'] == before['total_calls'] + 2
+    assert not any(str(order.order_id) in route for order in orders for route in metrics)
+    assert metrics['<unmatched>']['errors'] >= 1
+    assert metrics['/api/v1/orders/<pk>/']['methods']['GET']['db_queries'] >= 4
+
+    # The same counters are exposed in the Prometheus text format
+    response = api_client.get(reverse('metrics') + '?format=prometheus')
+    assert response['Content-Type'].startswith('text/plain')
+    content = response.content.decode()
+    assert 'http_requests_total{route="/api/v1/orders/<pk>/",method="GET",outcome="success"}' in content
+    assert 'http_request_duration_seconds_bucket{route="/api/v1/orders/<pk>/",method="GET",le="+Inf"}' in content
+
+
+class ListSink:
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, events):
+        self.release.wait()
+        self.batches.append(events)
+
+
+def test_event_pipeline_writes_in_batches_and_on_stop():
+    sink = ListSink()
+    pipeline = EventPipeline(sink, batch_size=10)
+
+    # Events queued while the writer is busy are written together
+    sink.release.clear()
+    for number in range(25):
+        pipeline.publish(Event('event_stub', f'event {number}', 0))
+    sink.release.set()
+
+    # Stopping writes everything that is still queued
+    pipeline.stop()
+    messages = [event.message for batch in sink.batches for event in batch]
+    assert messages == [f'event {number}' for number in range(25)]
+    assert all(len(batch) <= 10 for batch in sink.batches)
+
+
+def test_event_pipeline_drops_events_when_full():
+    sink = ListSink()
+    sink.release.clear()
+    pipeline = EventPipeline(sink, max_size=2, batch_size=1, put_timeout=0)
+
+    # The writer is stuck, so only the queue capacity (plus the event being written) is kept
+    for number in range(10):
+        pipeline.publish(Event('event_stub', f'event {number}', 0))
+    assert 7 <= pipeline.dropped <= 8
+
+    sink.release.set()
+    pipeline.stop()
+    assert len(sink.batches) == 10 - pipeline.dropped
+
+
+@pytest.mark.django_db
+def test_status_change_event_published_on_commit(user, monkeypatch, django_capture_on_commit_callbacks):
+    published = []
+    monkeypatch.setattr(get_event_pipeline(), 'publish', published.append)
+    order = Order.objects.create(user=user, status='pending', total_price='40.00')
+    order = Order.objects.get(order_id=order.order_id)
+
+    # Nothing is queued before the transaction commits
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        order.status = 'confirmed'
+        order.save()
+        assert published == []
+
+    # The status change goes to the outbox, only the activity log is queued
+    assert [event.message for event in published] == [
+        f"Order updated: {order.order_id}, User: id={user.id}, Total Price: 40.00",
+    ]
+    assert len(callbacks) == 1
+    assert OutboxEvent.objects.filter(topic=ORDER_STATUS_CHANGED).count() == 1
+
+
+@pytest.mark.django_db
+def test_bulk_import_publishes_order_events(api_client, user, monkeypatch, django_capture_on_commit_callbacks):
+    published = []
+    monkeypatch.setattr(get_event_pipeline(), 'publish', published.append)
+    existing = Order.objects.create(user=user, status='pending', total_price='40.00')
+    api_client.force_authenticate(user=user)
+    rows = [{"status": "pending", "products": []}, {"order_id": str(existing.order_id), "status": "cancelled"}]
+
+    # Order.save doesn't run for the bulk writes, they publish the same events and count the stats
+    with django_capture_on_commit_callbacks(execute=True):
+        results = api_client.post(reverse('order-bulk'), rows, format='json').data['results']
+    assert [event.message.split(':')[0] for event in published] == ['Order created', 'Order updated']
+    assert results[0]['order_id'] in published[0].message
+    assert OutboxEvent.objects.filter(payload__order_id=str(existing.order_id)).count() == 1
+    assert get_stats(f'user:{user.id}')['pending']['orders'] == 1
+    assert get_stats(f'user:{user.id}')['cancelled']['orders'] == 1
+
+
+@pytest.mark.django_db
+def test_outbox_event_rolled_back_with_order(user):
+    order = Order.objects.create(user=user, status='pending', total_price='40.00')
+    order = Order.objects.get(order_id=order.order_id)
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            order.status = 'confirmed'
+            order.save()
+            raise RuntimeError
+
+    assert not OutboxEvent.objects.exists()
+
+
+class OutboxListSink:
+    def __init__(self, fail=False):
+        self.events = []
+        self.fail = fail
+
+    def write(self, outbox_events):
+        if self.fail:
+            raise ConnectionError
+        self.events.extend(outbox_events)
+
+
+@pytest.mark.django_db
+def test_relay_outbox_delivers_each_event_once(user):
+    order = Order.objects.create(user=user, status='pending', total_price='40.00')
+    for new_status in ('confirmed', 'cancelled', 'pending'):
+        order.status = new_status
+        order.save()
+
+    # A failed delivery leaves the batch in the outbox
+    with pytest.raises(ConnectionError):
+        relay_outbox_batch(OutboxListSink(fail=True), batch_size=2)
+    assert OutboxEvent.objects.filter(delivered_at__isnull=True).count() == 3
+
+    sink = OutboxListSink()
+    assert relay_outbox_batch(sink, batch_size=2) == 2
+    assert relay_outbox_batch(sink, batch_size=2) == 1
+    assert relay_outbox_batch(sink, batch_size=2) == 0
+    assert [event.payload['new_status'] for event in sink.events] == ['confirmed', 'cancelled', 'pending']
+    assert not OutboxEvent.objects.filter(delivered_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_event_log_sink_formats_status_changes(user, monkeypatch):
+    written = []
+    monkeypatch.setattr('orders.outbox.LoggerSink.write', lambda self, events: written.extend(events))
+    order = Order.objects.create(user=user, status='pending', total_price='40.00')
+    order.status = 'confirmed'
+    order.save()
+
+    relay_outbox_batch(EventLogSink())
+    assert [event.message for event in written] == [
+        f"Order {order.order_id} changed status from 'pending' to 'confirmed'",
+    ]
+
+
+# Parallel Relays Need Row Locks That SKIP LOCKED, Which SQLite Doesn't Have
+@pytest.mark.django_db(transaction=True)
+def test_parallel_relays_never_deliver_twice(user):
+    if connection.vendor != 'postgresql':
+        pytest.skip('SELECT ... FOR UPDATE SKIP LOCKED needs PostgreSQL')
+
+    order = Order.objects.create(user=user, status='pending', total_price='40.00')
+    for number in range(200):
+        order.status = 'confirmed' if number % 2 == 0 else 'pending'
+        order.save()
+
+    sinks = [OutboxListSink() for _ in range(4)]
+
+    def relay(sink):
+        try:
+            while relay_outbox_batch(sink, batch_size=10):
+                pass
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=relay, args=(sink,)) for sink in sinks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    delivered = [event.id for sink in sinks for event in sink.events]
+    assert len(delivered) == len(set(delivered)) == 200
+
+
+def async_request(user, method, path, data=None):
+    # Sends a request to the async views with a JWT of the user, outside of an event loop
+    headers = {'Authorization': f'Bearer {RefreshToken.for_user(user).access_token}'} if user else {}
+    send = getattr(AsyncClient(), method)
+    if data is None:
+        return async_to_sync(send)(path, headers=headers)
+    return async_to_sync(send)(path, json.dumps(data), content_type='application/json', headers=headers)
+
+
+@pytest.mark.django_db
+def test_async_views_render_like_sync_views(api_client, user, clear_cache):
+    orders = create_orders(user, 3)
+    api_client.force_authenticate(user=user)
+
+    response = async_request(user, 'get', '/api/v1/async/orders/')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['results'] == api_client.get(reverse('order-list')).json()['results']
+
+    # The second request is served from the cache
+    assert async_request(user, 'get', '/api/v1/async/orders/').content == response.content
+
+    path = f'/api/v1/async/orders/{orders[0].order_id}/'
+    response = async_request(user, 'get', path)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == api_client.get(reverse('order-detail', args=[orders[0].order_id])).json()
+
+
+@pytest.mark.django_db
+def test_async_views_write_orders(user, clear_cache):
+    data = {"status": "pending", "total_price": "40.00", "products": [{"name": "shampoo", "price": "40.00", "quantity": 1}]}
+    response = async_request(user, 'post', '/api/v1/async/orders/', data)
+    assert response.status_code == status.HTTP_201_CREATED
+    order_id = response.json()['order_id']
+    assert [order['order_id'] for order in async_request(user, 'get', '/api/v1/async/orders/').json()['results']] == [
+        order_id,
+    ]
+
+    path = f'/api/v1/async/orders/{order_id}/'
+    response = async_request(user, 'patch', path, {"status": "confirmed"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['status'] == 'confirmed'
+    assert response.json()['products'][0]['name'] == 'shampoo'
+
+    invalid = async_request(user, 'put', path, {"status": "unknown"})
+    assert invalid.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'status' in invalid.json()
+
+    # The soft delete invalidates the cached list
+    assert async_request(user, 'delete', path).status_code == status.HTTP_200_OK
+    assert async_request(user, 'get', path).status_code == status.HTTP_404_NOT_FOUND
+    assert async_request(user, 'get', '/api/v1/async/orders/').json()['results'] == []
+    assert Order.objects.get(order_id=order_id).is_deleted
+
+
+@pytest.mark.django_db
+def test_async_views_authentication_and_scoping(user):
+    order = create_orders(user, 1)[0]
+    other_user = User.objects.create_user(username='otheruser', password='testpass')
+    path = f'/api/v1/async/orders/{order.order_id}/'
+
+    response = async_request(None, 'get', path)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response['WWW-Authenticate'].startswith('Bearer')
+
+    assert async_request(other_user, 'get', path).status_code == status.HTTP_404_NOT_FOUND
+    assert async_request(other_user, 'get', '/api/v1/async/orders/not-a-uuid/').status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_async_views_check_viewset_permissions_and_throttles(monkeypatch, user, clear_cache):
+    class OneRequestThrottle(UserRateThrottle):
+        rate = '1/min'
+
+    # The permission classes of the viewset apply
+    monkeypatch.setattr(OrderViewSet, 'permission_classes', [IsAdminUser])
+    assert async_request(user, 'get', '/api/v1/async/orders/').status_code == status.HTTP_403_FORBIDDEN
+
+    # As well as its throttles, with the same 'Retry-After' header
+    monkeypatch.setattr(OrderViewSet, 'permission_classes', [IsAuthenticated])
+    monkeypatch.setattr(OrderViewSet, 'throttle_classes', [OneRequestThrottle])
+    assert async_request(user, 'get', '/api/v1/async/orders/').status_code == status.HTTP_200_OK
+    response = async_request(user, 'get', '/api/v1/async/orders/')
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert 'Retry-After' in response
+
+
+@pytest.mark.django_db
+def test_async_views_reject_session_requests(user):
+    # Only the authentication classes of the API are accepted, a logged in session is not
+    client = AsyncClient(enforce_csrf_checks=True)
+    client.force_login(user)
+    response = async_to_sync(client.post)('/api/v1/async/orders/', '{}', content_type='application/json')
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert not Order.objects.exists()
+
+
+def jwt_client(user):
+    # API client sending a real JWT, so requests go through the authentication class
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+@pytest.mark.django_db
+def test_cached_jwt_authentication_skips_user_query(user, django_assert_num_queries):
+    order = create_orders(user, 1)[0]
+    client = jwt_client(user)
+    url = reverse('order-detail', args=[order.order_id])
+
+    # The first request loads the user, the next ones only load the order and its products
+    with django_assert_num_queries(3):
+        assert client.get(url).status_code == status.HTTP_200_OK
+    with django_assert_num_queries(2):
+        response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['user'] == user.username
+
+
+@pytest.mark.django_db
+def test_cached_jwt_user_invalidated_on_change(user, clear_cache):
+    other_user = User.objects.create_user(username='otheruser', password='testpass')
+    create_orders(other_user, 1)
+    client = jwt_client(user)
+    assert client.get(reverse('order-list')).data['results'] == []
+
+    # Granting the staff flag shows the other users' orders right away
+    user.is_staff = True
+    user.save()
+    assert len(client.get(reverse('order-list')).data['results']) == 1
+
+    user.is_active = False
+    user.save()
+    assert client.get(reverse('order-list')).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_fast_json_renderer_matches_drf(api_client, user, clear_cache, monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr('orders.renderers.orjson', None)
+        monkeypatch.setattr('orders.parsers.orjson', None)
+
+    create_orders(user, 3)
+    api_client.force_authenticate(user=user)
+    data = api_client.get(reverse('order-list')).data
+    extra = {
+        'name': 'шампунь \u2028 \u2029 "quoted"',
+        'price': Decimal('450.00'),
+        'order_id': uuid.uuid4(),
+        'created_at': datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+        'nested': [None, True, 1],
+    }
+
+    for value in (data, extra):
+        content = FastJSONRenderer().render(value)
+        assert content == JSONRenderer().render(value)
+        assert FastJSONParser().parse(io.BytesIO(content)) == JSONParser().parse(io.BytesIO(content))
+
+    # Indented output is rendered by DRF
+    indented = FastJSONRenderer().render(data, 'application/json; indent=4')
+    assert indented == JSONRenderer().render(data, 'application/json; indent=4')
+
+
+@pytest.mark.django_db
+def test_fast_json_renderer_renders_list_field_errors(api_client, user):
+    # ListField errors are keyed by the index of the bad item
+    api_client.force_authenticate(user=user)
+    response = api_client.post(reverse('order-transition'), {"order_ids": ["bad"], "status": "confirmed"}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert list(response.json()['order_ids']) == ['0']
+    assert FastJSONRenderer().render(response.data) == JSONRenderer().render(response.data)
+
+
+def test_fast_json_parser_errors():
+    with pytest.raises(ParseError, match='JSON parse error'):
+        FastJSONParser().parse(io.BytesIO(b'{"status": '))
+    with pytest.raises(ParseError):
+        FastJSONParser().parse(io.BytesIO(b'{"total_price": NaN}'))
+
+
+@pytest.fixture
+def varied_orders(user):
+    # Orders with no, one and several products, odd prices, another owner and a deleted order
+    admin = User.objects.create_user(username='админ', password='testpass', is_staff=True)
+    prices = ['0.50', '1234.5', '9999999.99', '7']
+    orders = []
+    for number, (owner, products_count) in enumerate([(user, 0), (user, 1), (admin, 5), (user, 3)]):
+        order = Order.objects.create(
+            user=owner, status=Order.STATUS_CHOICES[number % 3][0], total_price=prices[number],
+            is_deleted=number == 3,
+        )
+        products = Product.objects.bulk_create(
+            Product(name=f'товар "{number}-{item}"', price=prices[item % 4], quantity=item)
+            for item in range(products_count)
+        )
+        link_products(order, products)
+        orders.append(order)
+    return orders
+
+
+@pytest.mark.django_db
+def test_order_values_serializer_matches_order_serializer(varied_orders, django_assert_num_queries):
+    queryset = Order.objects.order_by('order_id')
+    expected = OrderSerializer(OrderSerializer.setup_eager_loading(queryset), many=True).data
+
+    with django_assert_num_queries(2):
+        rows = list(OrderValuesSerializer.get_values(queryset))
+        data = OrderValuesSerializer().to_representation(rows)
+
+    assert data == expected
+    assert JSONRenderer().render(data) == JSONRenderer().render(expected)
+    assert OrderValuesSerializer().to_representation([]) == []
+
+    row = rows[0]
+    assert async_to_sync(OrderValuesSerializer().ato_representation)([row]) == [expected[0]]
+
+
+@pytest.mark.django_db
+def test_list_and_retrieve_match_order_serializer(api_client, user, varied_orders, clear_cache):
+    api_client.force_authenticate(user=user)
+    visible = Order.objects.filter(user=user, is_deleted=False).order_by('-created_at', '-order_id')
+    expected = OrderSerializer(OrderSerializer.setup_eager_loading(visible), many=True).data
+
+    # Walking the list one order per page exercises the cursors built from '.values()' rows
+    results = []
+    url = reverse('order-list') + '?page_size=1'
+    while url:
+        response = api_client.get(url)
+        results += response.json()['results']
+        url = response.json()['next']
+    assert results == json.loads(JSONRenderer().render(expected))
+
+    for order in expected:
+        response = api_client.get(reverse('order-detail', args=[order['order_id']]))
+        assert response.content == JSONRenderer().render(order)
+
+    # Other users' orders stay hidden
+    other_order = varied_orders[2]
+    assert api_client.get(reverse('order-detail', args=[other_order.order_id])).status_code == 404
+
+
+@pytest.mark.django_db
+def test_order_total_computed_from_lines(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    soap = Product.objects.create(name='soap', price='2.50', quantity=100)
+    data = {
+        "status": "pending",
+        "total_price": "1.00",  # Ignored, the total is computed from the lines
+        "products": [{"name": "shampoo", "price": "10.00", "quantity": 5}],
+        "items": [{"product_id": str(soap.product_id), "quantity": 3}, {"product_id": str(soap.product_id)}],
+    }
+
+    response = api_client.post(reverse('order-list'), data, format='json')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.data['total_price'] == '20.00'
+    order = Order.objects.get(order_id=response.data['order_id'])
+    assert (order.total_price, order.items_count) == (Decimal('20.00'), 5)
+    # The repeated product is one line, its price is kept even if the product's price changes
+    assert OrderItem.objects.get(order=order, product=soap).quantity == 4
+    Product.objects.filter(product_id=soap.product_id).update(price='3.00')
+    item = {'product_id': str(soap.product_id), 'quantity': 4, 'unit_price': '2.50'}
+    assert item in api_client.get(reverse('order-detail', args=[order.order_id])).data['items']
+
+    # Lines replace the order's lines, a status change alone keeps them and the totals
+    url = reverse('order-detail', args=[order.order_id])
+    response = api_client.patch(url, {"items": [{"product_id": str(soap.product_id), "quantity": 2}]}, format='json')
+    assert response.data['total_price'] == '6.00'
+    assert response.data['items'] == [{'product_id': str(soap.product_id), 'quantity': 2, 'unit_price': '3.00'}]
+    response = api_client.patch(url, {"status": "confirmed"}, format='json')
+    assert (response.data['total_price'], len(response.data['items'])) == ('6.00', 1)
+
+
+@pytest.mark.django_db
+def test_order_lines_validation(api_client, user):
+    api_client.force_authenticate(user=user)
+    expensive = Product.objects.create(name='yacht', price='60000000.00', quantity=1)
+    url = reverse('order-list')
+
+    unknown = api_client.post(url, {"status": "pending", "items": [{"product_id": str(uuid.uuid4())}]}, format='json')
+    assert unknown.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'Products not found' in str(unknown.data['items'])
+
+    zero = api_client.post(url, {"items": [{"product_id": str(expensive.product_id), "quantity": 0}]}, format='json')
+    assert zero.status_code == status.HTTP_400_BAD_REQUEST
+
+    too_big = api_client.post(url, {"items": [{"product_id": str(expensive.product_id), "quantity": 2}]}, format='json')
+    assert too_big.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'total_price' in too_big.data
+    assert Order.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_get_or_create_products_without_products(django_assert_num_queries):
+    # Items-only updates have no products to look up
+    Product.objects.create(name='soap', price='2.50', quantity=1)
+    with django_assert_num_queries(0):
+        assert get_or_create_products([]) == []
+
+
+@pytest.mark.django_db
+def test_bulk_import_lines(api_client, user, clear_cache, django_assert_max_num_queries):
+    api_client.force_authenticate(user=user)
+    soap, towel = Product.objects.bulk_create([
+        Product(name='soap', price='2.50', quantity=100), Product(name='towel', price='7.00', quantity=100),
+    ])
+    existing = Order.objects.create(user=user, status='pending', total_price='40.00')
+    rows = [
+        {"status": "pending", "items": [{"product_id": str(soap.product_id), "quantity": 2}]},
+        {"order_id": str(existing.order_id), "items": [{"product_id": str(towel.product_id), "quantity": 3}]},
+        {"status": "pending", "items": [{"product_id": str(uuid.uuid4())}]},
+    ] + [{"status": "pending", "items": [{"product_id": str(towel.product_id)}]} for _ in range(50)]
+
+    # The products of all the lines are loaded once for the chunk
+    with django_assert_max_num_queries(15):
+        response = api_client.post(reverse('order-bulk'), rows, format='json')
+
+    results = response.data['results']
+    assert [result['status'] for result in results[:3]] == ['created', 'updated', 'error']
+    assert Order.objects.get(order_id=results[0]['order_id']).total_price == Decimal('5.00')
+    existing.refresh_from_db()
+    assert (existing.total_price, existing.items_count) == (Decimal('21.00'), 3)
+
+
+@pytest.mark.django_db
+def test_user_totals(user, django_assert_num_queries):
+    other_user = User.objects.create_user(username='otheruser', password='testpass')
+    Order.objects.bulk_create([
+        Order(user=user, status='confirmed', total_price='10.00', items_count=1),
+        Order(user=user, status='confirmed', total_price='15.50', items_count=3),
+        Order(user=user, status='cancelled', total_price='99.00', items_count=2),
+        Order(user=user, status='confirmed', total_price='1000.00', items_count=9, is_deleted=True),
+        Order(user=other_user, status='pending', total_price='40.00', items_count=4),
+    ])
+
+    with django_assert_num_queries(1):
+        totals = {row['user_id']: row for row in Order.objects.user_totals()}
+
+    assert totals[user.id]['orders'] == 3
+    assert totals[user.id]['revenue'] == Decimal('25.50')
+    assert (totals[user.id]['items'], totals[user.id]['average_items']) == (6, 2)
+    assert (totals[other_user.id]['orders'], totals[other_user.id]['revenue']) == (1, 0)
+
+
+@pytest.mark.django_db
+def test_confirm_reserves_and_cancel_releases_stock(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    soap = Product.objects.create(name='soap', price='2.50', quantity=5)
+    orders = []
+    for _ in range(2):
+        data = {"status": "pending", "items": [{"product_id": str(soap.product_id), "quantity": 3}]}
+        orders.append(api_client.post(reverse('order-list'), data, format='json').data['order_id'])
+
+    def update(order_id, data):
+        return api_client.patch(reverse('order-detail', args=[order_id]), data, format='json')
+
+    assert update(orders[0], {"status": "confirmed"}).status_code == status.HTTP_200_OK
+    soap.refresh_from_db()
+    assert soap.quantity == 2
+
+    # Not enough stock left, the order stays pending and nothing is taken
+    response = update(orders[1], {"status": "confirmed"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert 'Not enough stock' in str(response.data['status'])
+    assert Order.objects.get(order_id=orders[1]).status == 'pending'
+    assert OutboxEvent.objects.filter(payload__order_id=orders[1]).count() == 0
+
+    # The lines of a confirmed order can't change, cancelling gives its stock back
+    response = update(orders[0], {"items": [{"product_id": str(soap.product_id), "quantity": 1}]})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert update(orders[0], {"status": "cancelled"}).status_code == status.HTTP_200_OK
+    assert update(orders[1], {"status": "confirmed"}).status_code == status.HTTP_200_OK
+    soap.refresh_from_db()
+    assert soap.quantity == 2
+
+    # An order created as confirmed takes its stock too
+    data = {"status": "confirmed", "items": [{"product_id": str(soap.product_id), "quantity": 3}]}
+    assert api_client.post(reverse('order-list'), data, format='json').status_code == status.HTTP_400_BAD_REQUEST
+    data['items'][0]['quantity'] = 2
+    assert api_client.post(reverse('order-list'), data, format='json').status_code == status.HTTP_201_CREATED
+    soap.refresh_from_db()
+    assert soap.quantity == 0
+
+
+@pytest.mark.django_db
+def test_change_stock_locks_products_in_order(django_assert_num_queries):
+    products = Product.objects.bulk_create(Product(name=f'soap {number}', price='1.00', quantity=2) for number in range(3))
+    deltas = {product.product_id: -1 for product in reversed(products)}
+
+    # Locking read and one conditional UPDATE, whatever the number of products
+    with django_assert_num_queries(2) as captured:
+        change_stock(deltas)
+    assert 'ORDER BY "orders_product"."product_id" ASC' in captured.captured_queries[0]['sql']
+    assert '"quantity" >= (CASE' in captured.captured_queries[1]['sql']
+
+    # Short products are reported and nothing is taken
+    deltas[products[0].product_id] = -2
+    with pytest.raises(InsufficientStock) as excinfo:
+        with transaction.atomic():
+            change_stock(deltas)
+    assert excinfo.value.product_ids == [products[0].product_id]
+    assert set(Product.objects.values_list('quantity', flat=True)) == {1}
+
+
+@pytest.mark.django_db
+def test_bulk_import_rejects_orders_out_of_stock(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    soap = Product.objects.create(name='soap', price='2.50', quantity=4)
+    pending = Order.objects.create(user=user, status='pending', total_price='0.00')
+    link_products(pending, [soap])
+    rows = [
+        {"status": "confirmed", "items": [{"product_id": str(soap.product_id), "quantity": 2}]},
+        {"status": "confirmed", "items": [{"product_id": str(soap.product_id), "quantity": 2}]},
+        {"status": "confirmed", "items": [{"product_id": str(soap.product_id), "quantity": 1}]},
+        {"order_id": str(pending.order_id), "status": "confirmed"},
+    ]
+
+    response = api_client.post(reverse('order-bulk'), rows, format='json')
+
+    # The first two rows take all the stock, the others are rejected and not written
+    assert [result['status'] for result in response.data['results']] == ['created', 'created', 'error', 'error']
+    soap.refresh_from_db()
+    assert soap.quantity == 0
+    assert Order.objects.filter(user=user).count() == 3
+    pending.refresh_from_db()
+    assert pending.status == 'pending'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_confirmations_never_oversell():
+    if connection.vendor != 'postgresql':
+        pytest.skip('Parallel writers need PostgreSQL')
+
+    # Stock for about half of the orders, the command fails on any oversold product or failed transition
+    out = io.StringIO()
+    call_command('stress_stock', workers=16, orders=400, products=4, lines=3, stock=300, stdout=out)
+    assert 'No stock oversold' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_status_changes_follow_state_machine(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    order = Order.objects.create(user=user, status='pending', total_price='40.00')
+    url = reverse('order-detail', args=[order.order_id])
+
+    assert api_client.patch(url, {"status": "pending"}, format='json').status_code == status.HTTP_200_OK
+    assert api_client.patch(url, {"status": "confirmed"}, format='json').status_code == status.HTTP_200_OK
+    response = api_client.patch(url, {"status": "pending"}, format='json')
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "from 'confirmed' to 'pending'" in str(response.data['status'])
+    assert api_client.patch(url, {"status": "cancelled"}, format='json').status_code == status.HTTP_200_OK
+    assert api_client.patch(url, {"status": "confirmed"}, format='json').status_code == status.HTTP_400_BAD_REQUEST
+    assert Order.objects.get(order_id=order.order_id).status == 'cancelled'
+
+
+@pytest.mark.django_db
+def test_bulk_transition_by_ids(api_client, user, clear_cache, monkeypatch):
+    api_client.force_authenticate(user=user)
+    monkeypatch.setattr(OrderViewSet, 'TRANSITION_BATCH_SIZE', 2)
+    invalidations = []
+    monkeypatch.setattr('orders.views.delete_cache', lambda *args, **kwargs: invalidations.append(kwargs))
+
+    soap = Product.objects.create(name='soap', price='2.50', quantity=3)
+    orders = Order.objects.bulk_create(Order(user=user, status='pending', total_price='0.00') for _ in range(5))
+    for order in orders:
+        link_products(order, [soap])
+    cancelled = Order.objects.create(user=user, status='cancelled', total_price='0.00')
+    other_order = create_orders(User.objects.create_user(username='otheruser'), 1)[0]
+    order_ids = [str(order.order_id) for order in orders + [cancelled, other_order]]
+
+    response = api_client.post(reverse('order-transition'), {"status": "confirmed", "order_ids": order_ids}, format='json')
+
+    # Stock for three orders, the cancelled order and the other user's order are left alone
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['updated'] == 3
+    assert len(response.data['out_of_stock']) == 2
+    confirmed = set(Order.objects.filter(status='confirmed').values_list('order_id', flat=True))
+    assert len(confirmed) == 3 and {str(order_id) for order_id in confirmed}.isdisjoint(response.data['out_of_stock'])
+    assert Order.objects.filter(order_id__in=response.data['out_of_stock'], status='pending').count() == 2
+    assert Order.objects.get(order_id=cancelled.order_id).status == 'cancelled'
+    assert Order.objects.get(order_id=other_order.order_id).status == 'pending'
+    soap.refresh_from_db()
+    assert soap.quantity == 0
+
+    # One outbox event per changed order and one cache invalidation for the whole request
+    events = OutboxEvent.objects.filter(topic=ORDER_STATUS_CHANGED)
+    assert sorted(event.payload['order_id'] for event in events) == sorted(str(order_id) for order_id in confirmed)
+    assert {event.payload['old_status'] for event in events} == {'pending'}
+    assert invalidations == [{'user_id': user.id}]
+
+    # Cancelling gives the stock back, from both pending and confirmed orders
+    response = api_client.post(reverse('order-transition'), {"status": "cancelled", "order_ids": order_ids}, format='json')
+    assert response.data['updated'] == 5
+    soap.refresh_from_db()
+    assert soap.quantity == 3
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('orders_count', [10, 200])
+def test_bulk_transition_by_filter(api_client, user, clear_cache, django_assert_num_queries, orders_count):
+    admin = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+    api_client.force_authenticate(user=admin)
+    orders = create_orders(user, orders_count)
+    Order.objects.filter(order_id=orders[0].order_id).update(total_price='500.00')
+    url = reverse('order-transition')
+
+    # Changing every order needs an explicit filter
+    assert api_client.post(url, {"status": "cancelled"}, format='json').status_code == status.HTTP_400_BAD_REQUEST
+    assert api_client.post(url, {"status": "unknown", "order_ids": []}, format='json').status_code == 400
+
+    # The same number of queries whatever the number of orders in the batch: per source status (pending
+    # and confirmed) a savepoint, the UPDATE and its release until a batch is empty, one INSERT of the events
+    # and one upsert of the stats
+    with django_assert_num_queries(11):
+        response = api_client.post(url + '?status=pending&max_price=100', {"status": "cancelled"}, format='json')
+
+    assert response.data['updated'] == orders_count - 1
+    assert Order.objects.filter(status='cancelled').count() == orders_count - 1
+    assert OutboxEvent.objects.count() == orders_count - 1
+
+
+@pytest.mark.django_db
+def test_archive_orders(api_client, user, clear_cache, monkeypatch):
+    invalidations = []
+    monkeypatch.setattr('orders.views.delete_cache', lambda *args, **kwargs: invalidations.append(kwargs))
+    orders = create_orders(user, 6)
+    long_ago = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+    Order.objects.filter(order_id__in=[orders[0].order_id, orders[1].order_id]).update(is_deleted=True)
+    Order.objects.filter(order_id=orders[2].order_id).update(status='cancelled', created_at=long_ago, cancelled_at=long_ago)
+    # Created long ago but cancelled now, or pending for long, both stay in the orders table
+    Order.objects.filter(order_id__in=[orders[3].order_id, orders[4].order_id]).update(created_at=long_ago)
+    order = Order.objects.get(order_id=orders[3].order_id)
+    order.status = 'cancelled'
+    order.save()
+    assert Order.objects.get(order_id=order.order_id).cancelled_at > long_ago
+
+    call_command('archive_orders', '--batch-size=2', stdout=io.StringIO())
+
+    archived_ids = {order.order_id for order in orders[:3]}
+    assert set(ArchivedOrder.objects.values_list('order_id', flat=True)) == archived_ids
+    assert set(Order.objects.values_list('order_id', flat=True)) == {order.order_id for order in orders[3:]}
+    assert set(ArchivedOrderItem.objects.values_list('order_id', flat=True)) == archived_ids
+    assert not OrderItem.objects.filter(order_id__in=archived_ids).exists()
+    archived = ArchivedOrder.objects.get(order_id=orders[2].order_id)
+    assert (archived.status, archived.total_price, archived.items_count, archived.created_at) == (
+        'cancelled', Decimal('40.00'), 0, long_ago,
+    )
+    # The archived cancelled order was still listed
+    assert invalidations == [{'user_id': user.id}]
+
+    # Nothing left, a second run is a no-op
+    assert archive_orders_batch(get_archive_cutoff()) == []
+
+
+@pytest.mark.django_db
+def test_archive_orders_batch_query_count(user, django_assert_num_queries):
+    orders = create_orders(user, 5)
+    Order.objects.filter(order_id__in=[order.order_id for order in orders]).update(is_deleted=True)
+
+    # A savepoint, the select, the copy of the orders, the select and the copy of the lines, the select
+    # of the deletion, the deletes of the lines and of the orders, the savepoint's release
+    with django_assert_num_queries(9):
+        assert len(archive_orders_batch(get_archive_cutoff(), batch_size=10)) == 5
+
+
+@pytest.mark.django_db
+def test_archived_orders_are_read_by_admins_only(api_client, user):
+    orders = create_orders(user, 3)
+    Order.objects.filter(order_id__in=[order.order_id for order in orders]).update(is_deleted=True)
+    archive_orders_batch(get_archive_cutoff())
+    url = reverse('archived-order-list')
+
+    api_client.force_authenticate(user=user)
+    assert api_client.get(url).status_code == status.HTTP_403_FORBIDDEN
+
+    admin = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+    api_client.force_authenticate(user=admin)
+    response = api_client.get(url, {'user': user.id})
+    assert response.status_code == status.HTTP_200_OK
+    assert {row['order_id'] for row in response.data['results']} == {str(order.order_id) for order in orders}
+    assert response.data['results'][0]['user'] == 'testuser'
+    assert response.data['results'][0]['items'][0]['quantity'] == 1
+    assert api_client.get(url, {'user': 'testuser'}).status_code == status.HTTP_400_BAD_REQUEST
+
+    response = api_client.get(reverse('archived-order-detail', args=[orders[0].order_id]))
+    assert response.data['is_deleted'] is True
+    assert api_client.post(url, {}, format='json').status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+
+def test_primary_replica_router(monkeypatch):
+    router = PrimaryReplicaRouter()
+    monkeypatch.setattr('orders.routers.has_replica', lambda: False)
+    assert router.db_for_read(Order) is None
+
+    # Outside a request everything reads from the primary
+    monkeypatch.setattr('orders.routers.has_replica', lambda: True)
+    assert router.db_for_read(Order) == 'default'
+    assert router.db_for_write(Order) == 'default'
+
+    token = read_from_primary.set(False)
+    try:
+        assert router.db_for_read(Order) == 'replica'
+        assert router.db_for_read(Session) == 'default'
+        monkeypatch.setattr(connections['default'], 'in_atomic_block', True)
+        assert router.db_for_read(Order) == 'default'
+    finally:
+        read_from_primary.reset(token)
+
+
+@pytest.mark.django_db
+def test_write_pins_user_to_primary(
+    api_client, user, products, clear_cache, monkeypatch, django_capture_on_commit_callbacks,
+):
+    for module in ('orders.middleware', 'orders.utils'):
+        monkeypatch.setattr(f'{module}.has_replica', lambda: True)
+    other_user = User.objects.create_user(username='otheruser', password='testpass')
+
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    items = [{"product_id": str(products[0].product_id)}]
+    with django_capture_on_commit_callbacks(execute=True):
+        assert api_client.post(reverse('order-list'), {"items": items}, format='json').status_code == 201
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(other_user).access_token}')
+    assert api_client.post(reverse('order-list'), {"items": [{}]}, format='json').status_code == 400
+
+    # Only the successful writer is pinned
+    assert cache.get(get_pin_key(user.id)) is not None
+    assert cache.get(get_pin_key(other_user.id)) is None
+
+    for user_id, pinned in ((user.id, True), (other_user.id, False)):
+        token = read_from_primary.set(False)
+        try:
+            route_user_reads(user_id)
+            assert read_from_primary.get() is pinned
+        finally:
+            read_from_primary.reset(token)
+
+
+# Copies The Rows of The Primary to The Replica, as The Replication Eventually Does
+def replicate(*models):
+    for model in models:
+        model.objects.using('replica').all().delete()
+        model.objects.using('replica').bulk_create(model.objects.using('default').all())
+
+
+# Needs 'replica' to Be a Database of Its Own, Lagging Until 'replicate' ('--ds=core.settings_replica_test')
+@pytest.mark.django_db(transaction=True, databases='__all__')
+def test_replica_lag_read_your_writes(api_client, clear_cache):
+    if 'replica' not in settings.DATABASES or settings.DATABASES['replica'].get('TEST', {}).get('MIRROR'):
+        pytest.skip('Needs a replica database of its own (core.settings_replica_test)')
+
+    user = User.objects.create_user(username='testuser', password='testpass')
+    admin = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+    product = Product.objects.create(name='shampoo', price=50, quantity=1)
+    replicate(User, Product)
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+
+    response = api_client.post(reverse('order-list'), {"items": [{"product_id": str(product.product_id)}]}, format='json')
+    assert response.status_code == status.HTTP_201_CREATED
+    url = reverse('order-detail', args=[response.data['order_id']])
+
+    # The writer reads its order from the primary, and so does the admin's first page after the write
+    assert api_client.get(url).status_code == status.HTTP_200_OK
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(admin).access_token}')
+    assert len(api_client.get(reverse('order-list')).data['results']) == 1
+
+    # Once the pin has expired, reads go to the replica, which hasn't got the order yet
+    cache.delete(get_pin_key(user.id))
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    assert api_client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+    replicate(Order, OrderItem)
+    assert api_client.get(url).data['items'][0]['product_id'] == str(product.product_id)
+
+
+# The Stats of Every Scope, Summed Over The Slots
+def read_stats():
+    return {scope: get_stats(scope) for scope in OrderStats.objects.values_list('scope', flat=True).distinct()}
+
+
+@pytest.mark.django_db
+def test_order_stats_follow_writes(api_client, user, clear_cache):
+    api_client.force_authenticate(user=user)
+    soap = Product.objects.create(name='soap', price='2.50', quantity=10)
+    url = reverse('order-list')
+
+    # Create, change of lines, confirmation and soft delete through the API
+    response = api_client.post(url, {"items": [{"product_id": str(soap.product_id), "quantity": 2}]}, format='json')
+    first = reverse('order-detail', args=[response.data['order_id']])
+    response = api_client.post(url, {"items": [{"product_id": str(soap.product_id)}]}, format='json')
+    second = reverse('order-detail', args=[response.data['order_id']])
+    api_client.patch(first, {"items": [{"product_id": str(soap.product_id), "quantity": 4}]}, format='json')
+    api_client.patch(first, {"status": "confirmed"}, format='json')
+    api_client.delete(second)
+
+    stats = get_stats(f'user:{user.id}')
+    assert stats['confirmed'] == {'orders': 1, 'total_price': Decimal('10.00'), 'items_count': 4}
+    assert stats['pending']['orders'] == 0 and stats['cancelled']['orders'] == 0
+    assert get_stats(ALL_USERS_SCOPE) == stats
+
+    # Bulk import, bulk status change and archiving
+    rows = [{"status": "pending", "items": [{"product_id": str(soap.product_id)}]} for _ in range(3)]
+    api_client.post(reverse('order-bulk'), '\n'.join(json.dumps(row) for row in rows), content_type='application/x-ndjson')
+    api_client.post(reverse('order-transition') + '?status=pending', {"status": "cancelled"}, format='json')
+    assert not Order.objects.filter(status='cancelled', cancelled_at__isnull=True).exists()
+    Order.objects.filter(status='cancelled').update(cancelled_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+    archive_orders_batch(get_archive_cutoff())
+
+    incremental = read_stats()
+    assert incremental[ALL_USERS_SCOPE]['confirmed']['orders'] == 1
+    assert incremental[ALL_USERS_SCOPE]['cancelled']['orders'] == 0
+
+    # The rebuild from the orders table finds the same totals
+    assert rebuild_stats() == 1
+    assert read_stats() == incremental
+
+
+@pytest.mark.django_db
+def test_order_stats_of_seeded_orders(user):
+    Order.objects.create(user=user, status='confirmed', total_price='15.00')
+    other_user = User.objects.create_user(username='otheruser', password='testpass')
+
+    # Orders seeded with bulk_create are counted, then taken out again when deleted in batches
+    with transaction.atomic():
+        add_created_orders(Order.objects.bulk_create(
+            Order(user=other_user, status=('pending', 'cancelled')[number % 2], total_price='2.00') for number in range(5)
+        ))
+    seeded = read_stats()
+    assert rebuild_stats() == 6
+    assert read_stats() == seeded
+
+    assert delete_orders(Order.objects.filter(user=other_user), batch_size=2) == 5
+    assert get_stats(f'user:{other_user.id}')['pending']['orders'] == 0
+    assert rebuild_stats() == 1
+    assert read_stats()[ALL_USERS_SCOPE] == get_stats(f'user:{user.id}')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('orders_count', [1, 1000])
+def test_order_stats_endpoint(api_client, user, django_assert_num_queries, orders_count):
+    orders = create_orders(user, orders_count)
+    Order.objects.filter(order_id=orders[0].order_id).update(status='confirmed')
+    other_user = User.objects.create_user(username='otheruser')
+    create_orders(other_user, 2)
+    rebuild_stats(batch_size=1)
+    url = reverse('order-stats')
+
+    api_client.force_authenticate(user=user)
+    with django_assert_num_queries(1):
+        response = api_client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['orders'] == orders_count
+    assert response.data['revenue'] == '40.00'
+    assert response.data['statuses']['pending'] == {
+        'orders': orders_count - 1, 'total_price': f'{40 * (orders_count - 1)}.00', 'items_count': 0,
+    }
+    # Users only get their own stats
+    assert api_client.get(url, {'user': other_user.id}).data['orders'] == orders_count
+
+    admin = User.objects.create_user(username='admin', password='testpass', is_staff=True)
+    api_client.force_authenticate(user=admin)
+    assert api_client.get(url).data['orders'] == orders_count + 2
+    assert api_client.get(url, {'user': other_user.id}).data['orders'] == 2
+    assert api_client.get(url, {'user': 'otheruser'}).status_code == status.HTTP_400_BAD_REQUEST
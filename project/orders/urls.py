@@ -1,13 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet, metrics_view
+from .async_views import AsyncOrderDetailView, AsyncOrderListView
+from .views import ArchivedOrderViewSet, OrderViewSet, metrics_view
 
 # API Router
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'archive/orders', ArchivedOrderViewSet, basename='archived-order')
 
 # Routing Endpoints
 urlpatterns = [
     path('api/v1/', include(router.urls)),
+    path('api/v1/async/orders/', AsyncOrderListView.as_view(), name='async-order-list'),
+    path('api/v1/async/orders/<str:pk>/', AsyncOrderDetailView.as_view(), name='async-order-detail'),
     path('metrics/', metrics_view, name='metrics'),
 ]
@@ -1,17 +1,101 @@
+import asyncio
+import weakref
+from django.conf import settings
 from django.core.cache import cache
 import os
 import logging
+import redis.asyncio
+from .routers import get_pin_seconds, has_replica
+
+# Cache Scope Shared by All The Admins, They See The Same Orders
+STAFF_SCOPE = 'staff'
+
+# Async Redis Clients, One per Event Loop (a Client Can't Be Shared Between Loops)
+_async_redis_clients = weakref.WeakKeyDictionary()
+
+
+# Async Client for The Redis of The Default Cache, Used by The Async Views
+# ASYNC_REDIS_URL defaults to the cache LOCATION, ASYNC_REDIS_OPTIONS are passed to the client
+def get_async_redis_client():
+    loop = asyncio.get_running_loop()
+    client = _async_redis_clients.get(loop)
+    if client is None:
+        url = getattr(settings, 'ASYNC_REDIS_URL', None) or settings.CACHES['default']['LOCATION']
+        client = redis.asyncio.Redis.from_url(url, **getattr(settings, 'ASYNC_REDIS_OPTIONS', {}))
+        _async_redis_clients[loop] = client
+    return client
+
+
+# Cache Scope of The Regular User, They See Only Their Own Orders
+def get_user_scope(user_id):
+    return f"user:{user_id}"
+
+
+# Key of The Generation Counter for The Cache Namespace
+def get_generation_key(key_prefix: str):
+    return f"{key_prefix}:generation"
+
+
+# Set for REPLICA_PIN_SECONDS When a Generation Is Bumped While There Is a Read Replica
+def get_recent_write_key(generation_key: str):
+    return f"{generation_key}:recent-write"
+
+
+def split_generations_and_writes(values, count):
+    return [int(value or 0) for value in values[:count]], any(value is not None for value in values[count:])
+
+
+# Generation Counters Bumped When an Order Changes
+# Bumping a generation makes the cached pages unreachable in one INCR,
+# stale entries are left to expire by their timeout
+def get_invalidated_generation_keys(key_prefix: str, user_id=None):
+    if user_id is None:
+        return [get_generation_key(key_prefix)]
+
+    # Only The Owner's Pages and The Admins' Pages Can Contain The Order
+    return [
+        get_generation_key(f"{key_prefix}:{get_user_scope(user_id)}"),
+        get_generation_key(f"{key_prefix}:{STAFF_SCOPE}"),
+    ]
 
 
 # Creating Cache Function
-def delete_cache(key_prefix: str):
-    # Connecting to The Redis
+def delete_cache(key_prefix: str, user_id=None):
+    pipeline = cache.client.get_client().pipeline(transaction=False)
+    add_invalidation(pipeline, key_prefix, user_id)
+    pipeline.execute()
+
+
+async def adelete_cache(key_prefix: str, user_id=None):
+    pipeline = get_async_redis_client().pipeline(transaction=False)
+    add_invalidation(pipeline, key_prefix, user_id)
+    await pipeline.execute()
+
+
+# With a Replica The Next Pages Are Read From The Primary for a While (OrderListCache.get_lookup_keys),
+# a Page Read From The Lagging Replica Would Stay Cached Until The Next Write
+def add_invalidation(pipeline, key_prefix: str, user_id=None):
+    for key in get_invalidated_generation_keys(key_prefix, user_id):
+        pipeline.incr(key)
+        if has_replica():
+            pipeline.set(get_recent_write_key(key), 1, ex=get_pin_seconds())
+
+
+# Explicit Purge of The Cached Pages, SCAN Doesn't Block Redis Like KEYS Does
+def purge_cache(key_prefix: str, batch_size: int = 1000):
     redis_client = cache.client.get_client()
-    # Creating Cache Keys
-    cache_keys = redis_client.keys(f":1:views.decorators.cache.cache_page.{key_prefix}*")
-    for key in cache_keys:
-        # Deleting Cache by The Keys
-        redis_client.delete(key)
+    pipeline = redis_client.pipeline(transaction=False)
+    purged = 0
+
+    for key in redis_client.scan_iter(match=f"{key_prefix}:page:*", count=batch_size):
+        # UNLINK Frees The Memory in The Background
+        pipeline.unlink(key)
+        purged += 1
+        if purged % batch_size == 0:
+            pipeline.execute()
+
+    pipeline.execute()
+    return purged
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -27,13 +111,34 @@ file_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
 event_logger.addHandler(file_handler)
 
 
+# Topic of The Status Change Events in The Outbox
+ORDER_STATUS_CHANGED = 'order.status_changed'
+
+
 def send_order_status_change_event(order_id, old_status, new_status):
     """
-    Логирует событие изменения статуса заказа.
+    Записывает событие изменения статуса заказа в outbox.
+    Событие сохраняется в текущей транзакции и доставляется в лог процессом relay_outbox.
     :param order_id: ID заказа
     :param old_status: Старый статус
     :param new_status: Новый статус
     """
-    event_logger.info(
-        f"Order {order_id} changed status from '{old_status}' to '{new_status}'"
+    send_order_status_change_events([(order_id, old_status, new_status)])
+
+
+# Записывает события для нескольких заказов одним запросом
+def send_order_status_change_events(changes):
+    from .models import OutboxEvent
+
+    OutboxEvent.objects.bulk_create(
+        OutboxEvent(
+            topic=ORDER_STATUS_CHANGED,
+            payload={'order_id': str(order_id), 'old_status': old_status, 'new_status': new_status},
+        )
+        for order_id, old_status, new_status in changes
     )
+
+
+# Текст события изменения статуса для лога
+def format_order_status_change_event(payload):
+    return f"Order {payload['order_id']} changed status from '{payload['old_status']}' to '{payload['new_status']}'"
@@ -1,18 +1,37 @@
-from django.http import JsonResponse
+import csv
+import json
+import logging
+import time
+import uuid
+from itertools import islice
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework import viewsets, filters, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.generics import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.response import Response
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from rest_framework.utils.encoders import JSONEncoder
+from .cache import OrderListCache
+from .metrics import format_prometheus, get_metrics_backend
 from .middleware import MetricsMiddleware
-from .models import Order
-from .serializers import OrderSerializer
-from .utils import delete_cache
-from rest_framework.permissions import IsAuthenticated, BasePermission
+from .models import ArchivedOrder, Order, Product
+from .pagination import OrderCursorPagination
+from .parsers import JSONArrayStreamParser, NDJSONParser
+from .serializers import ArchivedOrderSerializer, OrderSerializer, OrderTransitionSerializer, OrderValuesSerializer, bulk_write_orders
+from .stats import ALL_USERS_SCOPE, get_stats
+from .utils import delete_cache, get_user_scope
+from rest_framework.permissions import IsAdminUser, IsAuthenticated, BasePermission
 
+logger = logging.getLogger('orders')
 
-# Returns The Metrics
+
+# Returns The Metrics, in JSON or With '?format=prometheus' in The Prometheus Text Format
 def metrics_view(request):
+    if request.GET.get('format') == 'prometheus':
+        content = format_prometheus(get_metrics_backend().get_counters())
+        return HttpResponse(content, content_type='text/plain; version=0.0.4; charset=utf-8')
+
     metrics = MetricsMiddleware.get_metrics()
     return JsonResponse(metrics)
 
@@ -20,6 +39,9 @@ def metrics_view(request):
 # Timeout of The Cache
 CACHE_TIMEOUT = 60 * 15  # 15 Minutes
 
+# Pages Older Than That Are Still Served While One Request Refreshes Them
+CACHE_SOFT_TIMEOUT = 60 * 5  # 5 Minutes
+
 
 # Custom Permisson Class for Admins
 class IsOwnerOrAdmin(BasePermission):
@@ -27,7 +49,7 @@ class IsOwnerOrAdmin(BasePermission):
         if request.user.is_staff:
             return True
 
-        return obj.user == request.user
+        return obj.user_id == request.user.id
 
 
 # ModelViewSet for The Order Model
@@ -35,9 +57,29 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.filter(is_deleted=False)
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    pagination_class = OrderCursorPagination
 
     # Creating Keys for The Cache
     KEY_PREFIX = 'orders-viewset'
+    list_cache = OrderListCache(KEY_PREFIX, CACHE_TIMEOUT, CACHE_SOFT_TIMEOUT)
+
+    # Number of Rows Validated and Written in One Transaction by The Bulk Import
+    BULK_CHUNK_SIZE = 500
+
+    # Number of Orders Changed per UPDATE by The Bulk Status Change
+    TRANSITION_BATCH_SIZE = 1000
+
+    # Number of Orders Fetched per Round Trip by The Export
+    EXPORT_CHUNK_SIZE = 2000
+    EXPORT_CSV_HEADER = [
+        'order_id', 'user', 'status', 'total_price', 'is_deleted',
+        'product_id', 'product_name', 'product_price', 'product_quantity', 'item_quantity', 'item_unit_price',
+    ]
+
+    # Actions Rendering Orders From The Queryset, They Get The Serializer's Relations Preloaded
+    # (list and retrieve render '.values()' rows with OrderValuesSerializer instead)
+    eager_loading_actions = ('update', 'partial_update', 'export')
+    read_serializer_class = OrderValuesSerializer
 
     # Filter's Settings
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
@@ -59,6 +101,9 @@ class OrderViewSet(viewsets.ModelViewSet):
         if max_price:
             queryset = queryset.filter(total_price__lte=max_price)
 
+        if self.action in self.eager_loading_actions:
+            queryset = self.get_serializer_class().setup_eager_loading(queryset)
+
         if self.request.user.is_staff:  # Admin Can See All The Orders
             return queryset
 
@@ -68,16 +113,312 @@ class OrderViewSet(viewsets.ModelViewSet):
         # Setting Current User as an Order's Owner
         serializer.save(user=self.request.user)
 
-    # Decorator for Creating the Cache
-    @method_decorator(cache_page(CACHE_TIMEOUT, key_prefix=KEY_PREFIX))
     # Processing GET Methods
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        # Cached Pages Are Served as Rendered JSON, a Stale One Is Refreshed Once Its Response Has Been Sent
+        cached_page = self.list_cache.get(request)
+        if cached_page is not None and cached_page.content is not None:
+            content_type = request.accepted_renderer.media_type
+            if self.list_cache.claim_refresh(cached_page):
+                return RefreshingResponse(
+                    cached_page.content, lambda: self.refresh_list_page(cached_page), content_type=content_type,
+                )
+            return HttpResponse(cached_page.content, content_type=content_type)
+
+        try:
+            response = self.get_list_response()
+        except Exception:
+            if cached_page is not None:
+                self.list_cache.release(cached_page)
+            raise
+        self.list_cache.store(cached_page, response)
+        return response
+
+    def get_list_response(self):
+        queryset = self.read_serializer_class.get_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.read_serializer_class().to_representation(page))
+
+    # Run by RefreshingResponse.close() After The Body Is Sent, The Client Has Already Got The Stale Page
+    def refresh_list_page(self, cached_page):
+        cached_page.started = time.monotonic()
+        try:
+            response = self.finalize_response(self.request, self.get_list_response())
+            self.list_cache.set(cached_page, response.render().content)
+        except Exception:
+            self.list_cache.release(cached_page)
+            logger.exception("Refreshing the cached orders page %s failed", cached_page.key)
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.read_serializer_class().to_representation([self.get_object_row()])[0])
+
+    # Same Lookup and Permissions as 'get_object', The Order Is a '.values()' Row
+    def get_object_row(self):
+        queryset = self.read_serializer_class.get_values(self.filter_queryset(self.get_queryset()))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(self.request, Order(order_id=row['order_id'], user_id=row['user_id']))
+        return row
 
     # Processing DELETE Methods
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         instance.is_deleted = True
         instance.save()
-        delete_cache(self.KEY_PREFIX)
+        delete_cache(self.KEY_PREFIX, user_id=instance.user_id)
         return Response(status=status.HTTP_200_OK)
+
+    # Processing Bulk Imports, The Body Is an NDJSON Stream or a JSON Array of Orders
+    # Rows With an 'order_id' Update Existing Orders, The Others Create New Ones
+    @action(detail=False, methods=['post'], parser_classes=[NDJSONParser, JSONArrayStreamParser])
+    def bulk(self, request):
+        rows = enumerate(request.data)
+        results = []
+        user_ids = set()
+
+        try:
+            while chunk := list(islice(rows, self.BULK_CHUNK_SIZE)):
+                results += self.write_bulk_chunk(chunk, user_ids)
+            response_status, error = status.HTTP_200_OK, None
+        except ParseError as exc:
+            # Chunks Before The Broken One (Unreadable Body or Repeated Order) Are Already Written
+            response_status, error = status.HTTP_400_BAD_REQUEST, exc.detail
+
+        # One Invalidation for The Whole Batch
+        self.delete_users_cache(user_ids)
+
+        data = {'results': results}
+        if error is not None:
+            data['detail'] = error
+        return Response(data, status=response_status)
+
+    def write_bulk_chunk(self, chunk, user_ids):
+        results = {}
+
+        # Existing Orders of The Chunk Are Loaded in One Query
+        # The chunk is written from the orders as loaded, so a chunk repeating an order is rejected as a whole
+        order_ids = {}
+        seen_order_ids = {}
+        for index, row in chunk:
+            if not isinstance(row, dict):
+                results[index] = self.bulk_error(index, {'non_field_errors': ['Expected an order object.']})
+            elif row.get('order_id'):
+                try:
+                    order_id = uuid.UUID(str(row['order_id']))
+                except ValueError:
+                    results[index] = self.bulk_error(index, {'order_id': ['Must be a valid UUID.']})
+                    continue
+                if order_id in seen_order_ids:
+                    raise ParseError(f'Order {order_id} is repeated in the rows {seen_order_ids[order_id]} and {index}.')
+                order_ids[index] = order_id
+                seen_order_ids[order_id] = index
+        orders = self.get_queryset().in_bulk(order_ids.values()) if order_ids else {}
+
+        # Products of The Chunk's Lines Are Loaded in One Query Too
+        product_ids = set()
+        for index, row in chunk:
+            if index in results or not isinstance(row.get('items'), list):
+                continue
+            for item in row['items']:
+                try:
+                    product_ids.add(uuid.UUID(str(item['product_id'])))
+                except (TypeError, KeyError, ValueError):
+                    continue
+        context = self.get_serializer_context()
+        context['products'] = Product.objects.in_bulk(product_ids) if product_ids else {}
+
+        # One Serializer per Kind of Row, Building DRF Fields per Row Would Dominate The Cost
+        serializer_class = self.get_serializer_class()
+        create_serializer = serializer_class(context=context)
+        update_serializer = serializer_class(partial=True, context=context)
+
+        created = []
+        updated = []
+        for index, row in chunk:
+            if index in results:
+                continue
+
+            order = None
+            if index in order_ids:
+                order = orders.get(order_ids[index])
+                if order is None:
+                    results[index] = self.bulk_error(index, {'order_id': ['Not found.']})
+                    continue
+
+            # The Updated Order Is Seen by The Serializer's Validation
+            update_serializer.instance = order
+            try:
+                validated_data = (update_serializer if order is not None else create_serializer).run_validation(row)
+            except ValidationError as exc:
+                results[index] = self.bulk_error(index, exc.detail)
+                continue
+
+            if order is not None:
+                updated.append((index, order, validated_data))
+            else:
+                created.append((index, validated_data))
+
+        new_orders, rejected = bulk_write_orders(
+            self.request.user,
+            [validated_data for _, validated_data in created],
+            [(order, validated_data) for _, order, validated_data in updated],
+        )
+
+        written = [(index, order, 'created') for (index, _), order in zip(created, new_orders)]
+        written += [(index, order, 'updated') for index, order, _ in updated]
+        for index, order, row_status in written:
+            if order in rejected:
+                results[index] = self.bulk_error(index, {'status': ['Not enough stock for the order.']})
+                continue
+            results[index] = {'index': index, 'status': row_status, 'order_id': str(order.order_id)}
+            user_ids.add(order.user_id)
+
+        return [results[index] for index, _ in chunk]
+
+    def bulk_error(self, index, errors):
+        return {'index': index, 'status': 'error', 'errors': errors}
+
+    # The Owners' Cache if Only One User's Orders Changed, Otherwise Everybody's
+    def delete_users_cache(self, user_ids):
+        if len(user_ids) == 1:
+            delete_cache(self.KEY_PREFIX, user_id=next(iter(user_ids)))
+        elif user_ids:
+            delete_cache(self.KEY_PREFIX)
+
+    # Processing Bulk Status Changes '/orders/transition/', Body - {"status": "<EXAMPLE>", "order_ids": [...]}
+    # Without 'order_ids' the orders matching the list's filters ('?status=pending&max_price=100') are changed
+    @action(detail=False, methods=['post'])
+    def transition(self, request):
+        serializer = OrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        new_status = serializer.validated_data['status']
+        order_ids = serializer.validated_data.get('order_ids')
+
+        # Changing Every Order Needs an Explicit Filter
+        filters = ('status', 'min_price', 'max_price')
+        if order_ids is None and not any(request.query_params.get(name) for name in filters):
+            raise ValidationError({'order_ids': ['Give the order IDs or filter the orders.']})
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if order_ids is not None:
+            queryset = queryset.filter(order_id__in=order_ids)
+
+        changed, out_of_stock = queryset.transition(new_status, batch_size=self.TRANSITION_BATCH_SIZE)
+        self.delete_users_cache({user_id for _, user_id, _ in changed})
+
+        return Response({
+            'status': new_status,
+            'updated': len(changed),
+            'out_of_stock': [str(order_id) for order_id in out_of_stock],
+        })
+
+    # Processing '/orders/stats/', Totals per Status of The User's Orders, Admins Get Everybody's
+    # or One User's With '?user=<EXAMPLE>'. Read From The Stats Table, One Query Whatever The Number of Orders
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        scope = get_user_scope(request.user.id)
+        if request.user.is_staff:
+            user = request.query_params.get('user')
+            try:
+                scope = get_user_scope(int(user)) if user else ALL_USERS_SCOPE
+            except ValueError:
+                raise ValidationError({'user': ['Must be a user ID.']})
+
+        statuses = get_stats(scope)
+        for values in statuses.values():
+            values['total_price'] = str(values['total_price'])
+        return Response({
+            'orders': sum(values['orders'] for values in statuses.values()),
+            'items_count': sum(values['items_count'] for values in statuses.values()),
+            'revenue': statuses['confirmed']['total_price'],
+            'statuses': statuses,
+        })
+
+    # Processing Exports '/orders/export/?export_format=<ndjson|csv>', Filters Are The Same as in The List
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            return Response({'export_format': ['Must be ndjson or csv.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by('-created_at', '-order_id')
+
+        # Server-Side Cursor, Products Are Prefetched for Each Chunk
+        orders = (
+            self.get_serializer().to_representation(order)
+            for order in queryset.iterator(chunk_size=self.EXPORT_CHUNK_SIZE)
+        )
+
+        if export_format == 'csv':
+            response = StreamingHttpResponse(self.iter_csv(orders), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(self.iter_ndjson(orders), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
+    def iter_ndjson(self, orders):
+        for order in orders:
+            yield json.dumps(order, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+    # One CSV Row per Line of The Order
+    def iter_csv(self, orders):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(self.EXPORT_CSV_HEADER)
+
+        for order in orders:
+            order_values = [order['order_id'], order['user'], order['status'], order['total_price'], order['is_deleted']]
+            # Products and Lines Are Listed in The Same Order
+            for product, item in list(zip(order['products'], order['items'])) or [(None, None)]:
+                product_values = [] if product is None else [
+                    product['product_id'], product['name'], product['price'], product['quantity'],
+                    item['quantity'], item['unit_price'],
+                ]
+                yield writer.writerow(order_values + product_values)
+
+
+# Read-Only Viewset of The Archived Orders ('manage.py archive_orders'), Admins Only
+# Processing Filters in The URL '/?user=<EXAMPLE>&status=<EXAMPLE>'
+class ArchivedOrderViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ArchivedOrder.objects.all()
+    serializer_class = ArchivedOrderSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = OrderCursorPagination
+
+    def get_queryset(self):
+        queryset = self.get_serializer_class().setup_eager_loading(super().get_queryset())
+
+        user = self.request.query_params.get('user')
+        status = self.request.query_params.get('status')
+
+        if user:
+            try:
+                queryset = queryset.filter(user_id=int(user))
+            except ValueError:
+                raise ValidationError({'user': ['Must be a user ID.']})
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset
+
+
+# Response Running a Function Once It Has Been Sent: The WSGI Server (or ASGI Handler) Calls
+# 'close()' After The Body, Before Django's 'request_finished' Closes The Database Connections
+class RefreshingResponse(HttpResponse):
+    def __init__(self, content, refresh, **kwargs):
+        super().__init__(content, **kwargs)
+        self.refresh = refresh
+
+    def close(self):
+        refresh, self.refresh = self.refresh, None
+        try:
+            if refresh is not None:
+                refresh()
+        finally:
+            super().close()
+
+
+# File-Like Object Returning What Is Written, Lets csv.writer Produce Rows for Streaming
+class EchoBuffer:
+    def write(self, value):
+        return value